@@ -1,48 +1,78 @@
-import os
-import subprocess
-import time
-
-def start_fastapi():
-    print("\n [Step 1] Lancement du serveur FastAPI (http://127.0.0.1:8000)...")
-
-    # Path to src/
-    src_path = os.path.join(os.path.dirname(__file__), "src")
-
-    # Add src to PYTHONPATH
-    current_pythonpath = os.environ.get("PYTHONPATH", "")
-    os.environ["PYTHONPATH"] = f"{src_path}{os.pathsep}{current_pythonpath}"
-
-    # Uvicorn order
-    return subprocess.Popen(["uvicorn", "api.api:app", "--reload"], cwd=src_path)
-
-def start_gradio():
-    print("\n Step 2: Launching the Gradio interface ...")
-
-    ui_path = os.path.join("src", "ui")
-    return subprocess.Popen(["python", "ui.py"], cwd=ui_path)
-
-def main():
-    fastapi_proc = start_fastapi()
-    time.sleep(5)  
-
-    gradio_proc = start_gradio()
-
-    print("\n Application ready")
-    print(" Ctrl+C to stop")
-
-    try:
-        gradio_proc.wait()
-    except KeyboardInterrupt:
-        print("\n Interruption")
-        gradio_proc.terminate()
-        fastapi_proc.terminate()
-
-if __name__ == "__main__":
-    main()
-
-
-
-
-
-
-
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import urllib.request
+
+def start_fastapi(host="127.0.0.1", port=8000, workers=1):
+    print(f"\n [Step 1] Lancement du serveur FastAPI (http://{host}:{port})...")
+
+    # Path to src/
+    src_path = os.path.join(os.path.dirname(__file__), "src")
+
+    # Add src to PYTHONPATH
+    current_pythonpath = os.environ.get("PYTHONPATH", "")
+    os.environ["PYTHONPATH"] = f"{src_path}{os.pathsep}{current_pythonpath}"
+
+    # Uvicorn order: --reload for development, N workers sharing the memory-mapped indexes in production
+    command = ["uvicorn", "api.api:app", "--host", host, "--port", str(port)]
+    command += ["--workers", str(workers)] if workers > 1 else ["--reload"]
+    return subprocess.Popen(command, cwd=src_path)
+
+def wait_until_ready(base_url, process, workers=1, timeout=600):
+    """Poll /readyz until every worker reports ready (model and indexes loaded), then print their startup."""
+    print(f" Waiting for the API to be ready ({base_url}/readyz)...")
+    ready = {}
+    start = time.time()
+    while len(ready) < workers:
+        if process.poll() is not None:
+            sys.exit(f"The API stopped during startup (exit code {process.returncode}).")
+        if time.time() - start > timeout:
+            if ready:
+                print(f" ⚠️ Only {len(ready)}/{workers} workers seen ready after {timeout}s, continuing.")
+                break
+            process.terminate()
+            sys.exit(f"Timeout: the API was not ready after {timeout} seconds.")
+        try:
+            with urllib.request.urlopen(f"{base_url}/readyz", timeout=2) as response:
+                report = json.loads(response.read())
+                ready[report["pid"]] = report
+        except OSError:
+            pass  # not listening yet, or worker still warming up (503)
+        time.sleep(0.5)
+
+    for report in ready.values():
+        print(f" ✅ Worker {report['pid']}: ready in {report['cold_start_s']}s, "
+              f"RSS {report['rss_mb']} MB (shared {report['shared_mb']} MB), FAISS index {report.get('index_mode')}")
+
+def start_gradio():
+    print("\n Step 2: Launching the Gradio interface ...")
+
+    ui_path = os.path.join("src", "ui")
+    return subprocess.Popen(["python", "ui.py"], cwd=ui_path)
+
+def main(args):
+    fastapi_proc = start_fastapi(args.host, args.port, args.workers)
+    wait_until_ready(f"http://{args.host}:{args.port}", fastapi_proc, workers=args.workers)
+
+    gradio_proc = start_gradio()
+
+    print("\n Application ready")
+    print(" Ctrl+C to stop")
+
+    try:
+        gradio_proc.wait()
+    except KeyboardInterrupt:
+        print("\n Interruption")
+        gradio_proc.terminate()
+        fastapi_proc.terminate()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Start the API (precomputed index) and the Gradio UI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Uvicorn worker processes (>1: production mode without --reload)")
+    main(parser.parse_args())
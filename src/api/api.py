@@ -1,46 +1,320 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
-import re
-
-# Load encapsulated API only
-from api.chatgpt_api import ChatGPTAPI
-
-# FastAPI application initialization
-app = FastAPI(title="RAG-LLM-SST API")
-
-# Loading the main component
-chat = ChatGPTAPI()
-
-# POST request data model
-class Query(BaseModel):
-    query: str
-
-# Welcome GET route
-@app.get("/")
-def root():
-    return {
-        "message": "Bienvenue sur l'API RAG-LLM-SST 🧠. Utilisez /query pour poser une question."
-    }
-
-# Main POST route for querying the model
-@app.post("/query")
-def query_llm(input: Query):
-    user_query = input.query.strip().lower()
-
-    # Social or meta query management
-    if re.match(r"^(bonjour|salut|coucou|qui (es|êtes)-tu|merci|au revoir|hello)", user_query):
-        return {
-            "response": (
-                "Bonjour 👋 Je suis un assistant spécialisé en SST (Sauveteur Secouriste du Travail). "
-                "Posez-moi une question sur les gestes de premiers secours, la prévention ou la conduite à tenir en cas d'accident."
-            )
-        }
-
-    # Direct response generation (the retriever is called in ChatGPTAPI)
-    response = chat.get_response(user_query)
-    return {"response": response}
-
-
-
-
-
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Optional, Union
+import asyncio
+import cProfile
+import hmac
+import json
+import os
+import re
+import time
+
+# Load encapsulated API only
+from api.chatgpt_api import (ADMIN_TOKEN, ChatGPTAPI, PROFILE_DIR, REQUEST_PROFILING, corpora, corpus_pdf_folder,
+                             index_status, query_log, readiness, reload_retriever, start_index_update,
+                             start_index_watcher, update_cache_gauges, warmup)
+from api.query_log import query_record
+from api.request_scheduler import Overloaded
+from model_management.corpus_registry import DEFAULT_CORPUS, UnknownCorpus
+from model_management.metrics import (REGISTRY, REQUEST_SECONDS, REQUESTS, current_profile, start_profile,
+                                      update_process_gauges)
+
+# Loading the main component
+chat = ChatGPTAPI()
+
+@asynccontextmanager
+async def lifespan(app):
+    # Load model and indexes in the background: /healthz answers at once, /readyz once warm
+    loop = asyncio.get_running_loop()
+    warmup_task = loop.run_in_executor(None, warmup)
+    # Hot swap to index versions published by live updates (this or another worker, or the CLI)
+    watcher_stop = start_index_watcher()
+    yield
+    watcher_stop.set()
+    if not warmup_task.done():
+        warmup_task.cancel()
+    # Persist caches on shutdown
+    chat.shutdown()
+
+# FastAPI application initialization
+app = FastAPI(title="RAG-LLM-SST API", lifespan=lifespan)
+
+# Routes whose questions are written to the query log (with the stage timings of their profile)
+LOGGED_ROUTES = ("/query", "/query/stream")
+
+def profile_mode(request: Request):
+    """Profiling asked by the X-Profile header: "stages", "cprofile" or None."""
+    mode = request.headers.get("x-profile", "").lower() if REQUEST_PROFILING else ""
+    return mode if mode in ("stages", "cprofile") else None
+
+# Instrumentation: request counters/latency, and opt-in profiling of one request with the header
+#   X-Profile: stages   -> stage breakdown in the Server-Timing response header
+#   X-Profile: cprofile -> same, plus a cProfile dump in PROFILE_DIR (path in X-Profile-File)
+# Logged routes are always profiled for the query log, without the response headers.
+@app.middleware("http")
+async def instrument(request: Request, call_next):
+    mode = profile_mode(request)
+    profile = start_profile(cprofile=mode == "cprofile") \
+        if mode or (query_log is not None and request.url.path in LOGGED_ROUTES) else None
+
+    profiler = None
+    if profile is not None and profile.profilers is not None:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            profiler = None  # another request is already being profiled
+
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profile.profilers.append(profiler)
+    elapsed = time.perf_counter() - start
+
+    route = request.scope.get("route")
+    route_path = route.path if route is not None else "unmatched"
+    REQUESTS.inc(route=route_path, status=response.status_code)
+    REQUEST_SECONDS.observe(elapsed, route=route_path)
+
+    if mode is not None:
+        profile.add("total", elapsed)
+        response.headers["Server-Timing"] = profile.server_timing()
+        if profile.notes:
+            response.headers["X-Profile-Notes"] = ", ".join(f"{k}={v}" for k, v in profile.notes.items())
+        if profile.profilers:
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}_{route_path.strip('/').replace('/', '_') or 'root'}_{os.getpid()}.prof"
+            response.headers["X-Profile-File"] = profile.dump(os.path.join(PROFILE_DIR, name))
+    return response
+
+# Backpressure: questions beyond the scheduler queue (or past their deadline) are refused, not queued forever
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return JSONResponse({"detail": "Serveur surchargé, réessayez dans quelques instants."}, status_code=503,
+                        headers={"Retry-After": str(max(int(round(exc.retry_after)), 1))})
+
+# Corpus names are checked before any work: an unknown one is a 404, not an answer made of an error
+@app.exception_handler(UnknownCorpus)
+async def unknown_corpus_handler(request: Request, exc: UnknownCorpus):
+    return JSONResponse({"detail": f"Corpus inconnu : {exc.args[0]}. Voir GET /corpora."}, status_code=404)
+
+def check_corpus(corpus):
+    """The corpus name of a request (None: default corpus), raising UnknownCorpus if it has no index."""
+    if corpus in (None, DEFAULT_CORPUS):
+        return None
+    corpora.index_root(corpus)
+    return corpus
+
+# Liveness: the worker process answers
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok", "pid": os.getpid()}
+
+# Readiness: model and indexes loaded and warmed up (503 until then), with cold-start time and memory
+@app.get("/readyz")
+def readyz():
+    report = readiness()
+    return JSONResponse(report, status_code=200 if report["status"] == "ready" else 503)
+
+# Prometheus scrape endpoint (metrics of the worker that answers)
+@app.get("/metrics")
+def metrics():
+    update_cache_gauges()
+    update_process_gauges()
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Metadata filters (applied inside FAISS and BM25, see HybridRetriever.resolve_filter)
+class SearchFilters(BaseModel):
+    documents: Optional[List[str]] = None
+    sections: Optional[List[str]] = None
+    subsections: Optional[List[str]] = None
+    page_min: Optional[int] = None
+    page_max: Optional[int] = None
+
+def filter_dict(filters):
+    return filters.model_dump(exclude_none=True) if filters is not None else None
+
+# Corpus searched by a request (GET /corpora lists them); unset: the default corpus
+CorpusField = Field(None, description="Corpus name, default corpus if unset")
+
+# POST request data model
+class Query(BaseModel):
+    query: str
+    filters: Optional[SearchFilters] = None
+    corpus: Optional[str] = CorpusField
+
+# Retrieval-only request models
+class SearchRequest(BaseModel):
+    query: str
+    top_k: int = Field(5, ge=1, le=100)
+    alpha: float = Field(0.6, ge=0.0, le=1.0)
+    filters: Optional[SearchFilters] = None
+    corpus: Optional[str] = CorpusField
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=256)
+    top_k: int = Field(5, ge=1, le=100)
+    alpha: float = Field(0.6, ge=0.0, le=1.0)
+    filters: Optional[SearchFilters] = None
+    corpus: Optional[str] = CorpusField
+
+class SearchHit(BaseModel):
+    passage_id: int
+    document: str
+    page: Union[int, str]
+    section: str
+    subsection: str
+    text: str
+    score: float
+    dense_score: Optional[float] = None
+    bm25_score: Optional[float] = None
+
+class SearchResponse(BaseModel):
+    hits: List[SearchHit]
+
+class BatchSearchResponse(BaseModel):
+    results: List[List[SearchHit]]
+
+# Welcome GET route
+@app.get("/")
+def root():
+    return {
+        "message": "Bienvenue sur l'API RAG-LLM-SST 🧠. Utilisez /query (ou /query/stream) pour poser une question."
+    }
+
+def social_response(user_query):
+    """Canned answer for social or meta queries, None for SST questions."""
+    if re.match(r"^(bonjour|salut|coucou|qui (es|êtes)-tu|merci|au revoir|hello)", user_query):
+        return (
+            "Bonjour 👋 Je suis un assistant spécialisé en SST (Sauveteur Secouriste du Travail). "
+            "Posez-moi une question sur les gestes de premiers secours, la prévention ou la conduite à tenir en cas d'accident."
+        )
+    return None
+
+def log_query(route, question, filters, corpus, start):
+    """Append an answered question to the query log, with the passages and stage timings of its profile."""
+    if query_log is not None:
+        query_log.append(query_record(route, question, filters, current_profile(),
+                                      (time.perf_counter() - start) * 1000, corpus=corpus))
+
+# Main POST route for querying the model
+@app.post("/query")
+async def query_llm(input: Query):
+    start = time.perf_counter()
+    user_query = input.query.strip().lower()
+    corpus = check_corpus(input.corpus)
+
+    # Social or meta query management
+    greeting = social_response(user_query)
+    if greeting:
+        return {"response": greeting}
+
+    # Direct response generation (the retriever is called in ChatGPTAPI)
+    filters = filter_dict(input.filters)
+    response = await chat.get_response_async(user_query, filters, corpus)
+    log_query("query", user_query, filters, corpus, start)
+    return {"response": response}
+
+def sse_event(data, event=None):
+    """Server-Sent Event frame with a JSON payload."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# Streaming POST route: tokens are sent as Server-Sent Events as soon as they arrive
+@app.post("/query/stream")
+async def query_llm_stream(input: Query, request: Request):
+    start = time.perf_counter()
+    user_query = input.query.strip().lower()
+    corpus = check_corpus(input.corpus)
+    greeting = social_response(user_query)
+    filters = filter_dict(input.filters)
+    # Admitted (or refused with 503) here, before the response headers are sent
+    tokens = chat.stream_response(user_query, filters, corpus) if not greeting else None
+    profiled = profile_mode(request) is not None
+
+    async def events():
+        if greeting:
+            yield sse_event({"token": greeting})
+        else:
+            async for token in tokens:
+                yield sse_event({"token": token})
+        # Headers are sent before the answer: a profiled stream gets its stage breakdown here
+        profile = current_profile()
+        yield sse_event({"timings_ms": profile.milliseconds(), "notes": profile.notes} if profiled else {},
+                        event="done")
+        if not greeting:
+            log_query("stream", user_query, filters, corpus, start)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Retrieval-only routes (no LLM call): structured hits with per-source scores
+@app.post("/search", response_model=SearchResponse)
+async def search(input: SearchRequest):
+    results = await chat.search_async([input.query.strip().lower()], top_k=input.top_k, alpha=input.alpha,
+                                      filters=filter_dict(input.filters), corpus=check_corpus(input.corpus))
+    return {"hits": results[0]}
+
+@app.post("/search/batch", response_model=BatchSearchResponse)
+async def search_batch(input: BatchSearchRequest):
+    queries = [q.strip().lower() for q in input.queries]
+    results = await chat.search_async(queries, top_k=input.top_k, alpha=input.alpha,
+                                      filters=filter_dict(input.filters), corpus=check_corpus(input.corpus))
+    return {"results": results}
+
+# Values accepted by the filters (of the default corpus, or of ?corpus=name)
+@app.get("/filters")
+def list_filters(corpus: Optional[str] = None):
+    return chat.filter_values(check_corpus(corpus))
+
+# Corpora available, loaded by this worker, and its memory budget for them
+@app.get("/corpora")
+def list_corpora():
+    return corpora.stats()
+
+# Live index administration: add/remove documents without restarting (see data_processing/live_update.py)
+class IndexUpdate(BaseModel):
+    add: List[str] = Field(default_factory=list,
+                           description="PDF file names in data/raw (data/raw/<corpus>) to add or replace")
+    remove: List[str] = Field(default_factory=list, description="Document names to remove")
+    corpus: Optional[str] = CorpusField
+
+def check_admin(request: Request):
+    # Fail closed: these routes change the index, so they stay disabled until a token is configured
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin routes disabled: set ADMIN_TOKEN in .env.")
+    if not hmac.compare_digest(request.headers.get("x-admin-token", "").encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Admin token missing or invalid.")
+
+@app.get("/admin/index")
+def admin_index(request: Request, corpus: Optional[str] = None):
+    check_admin(request)
+    return index_status(check_corpus(corpus))
+
+@app.post("/admin/index/update", status_code=202)
+async def admin_index_update(input: IndexUpdate, request: Request):
+    check_admin(request)
+    corpus = check_corpus(input.corpus)
+    if not input.add and not input.remove:
+        raise HTTPException(status_code=400, detail="Nothing to add or remove.")
+    pdf_folder = corpus_pdf_folder(corpus)
+    for name in input.add:
+        if os.path.basename(name) != name or not name.endswith(".pdf") \
+                or not os.path.isfile(os.path.join(pdf_folder, name)):
+            raise HTTPException(status_code=400, detail=f"PDF not found in data/raw{'/' + corpus if corpus else ''}: {name}")
+    # The new version is built in the background; GET /admin/index reports its progress
+    if start_index_update(input.add, input.remove, corpus) is None:
+        raise HTTPException(status_code=409, detail="An index update is already running.")
+    return {"status": "accepted", "add": input.add, "remove": input.remove, "corpus": corpus or DEFAULT_CORPUS}
+
+@app.post("/admin/index/reload")
+async def admin_index_reload(request: Request, corpus: Optional[str] = None):
+    check_admin(request)
+    corpus = check_corpus(corpus)
+    loop = asyncio.get_running_loop()
+    swapped = await loop.run_in_executor(None, reload_retriever, corpus)
+    return {"swapped": swapped, **index_status(corpus)}
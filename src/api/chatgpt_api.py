@@ -1,79 +1,650 @@
-import os
-import sys
-import openai
-from dotenv import load_dotenv
-
-# Add src/ to find model_management
-sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
-from model_management.hybrid_retrieval import HybridRetriever
-
-# Determine the absolute path to the project root
-base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
-index_path = os.path.join(base_dir, "models", "index", "index_files", "faiss_index")
-metadata_path = os.path.join(base_dir, "models", "index", "index_files", "metadata_passages.json")
-
-# Load .env
-env_path = os.path.join(base_dir, "config", ".env")
-if os.path.exists(env_path):
-    load_dotenv(env_path)
-else:
-    raise FileNotFoundError(f"The .env file cannot be found at the location {env_path}")
-
-# LOad API
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4-turbo")
-
-if not OPENAI_API_KEY:
-    raise ValueError("OpenAI API key missing. Check .env file.")
-
-openai.api_key = OPENAI_API_KEY
-
-# Initialize retriever with absolute paths
-retriever = HybridRetriever(index_path=index_path, embeddings_path=metadata_path)
-
-# Interface class for interacting with the OpenAI API
-class ChatGPTAPI:
-    def __init__(self, model=OPENAI_MODEL):
-        self.model = model
-
-    def build_prompt(self, question, context):
-        return (
-            "Tu es un assistant expert en SST (Sauveteur Secouriste du Travail). "
-            "Réponds de manière précise et factuelle en t'appuyant sur les informations suivantes, "
-            "et cite tes sources (document, page, section, sous-section) si possible.\n\n"
-            f" Contexte :\n{context}\n\n"
-            f" Question :\n{question}\n\n"
-            " **Réponse détaillée :**"
-        )
-
-    def get_response(self, question):
-        try:
-            context = retriever.retrieve_hybrid(query=question)
-            if not context:
-                context = "Aucune information spécifique trouvée dans la base de données."
-
-            prompt = self.build_prompt(question, context)
-
-            response = openai.ChatCompletion.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "Tu es un expert en SST."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.2
-            )
-
-            return response["choices"][0]["message"]["content"].strip()
-
-        except openai.error.AuthenticationError:
-            return " Authentication error: invalid or missing API key."
-        except openai.error.OpenAIError as e:
-            return f" OpenAI error: {str(e)}"
-        except Exception as e:
-            return f" Unknown error : {str(e)}"
-
-
-
-
-
-
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import openai
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+# Add src/ to find model_management
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+from model_management.corpus_registry import DEFAULT_CORPUS, Corpus, CorpusRegistry
+from model_management.passage_store import resolve_passages_path
+from model_management.metrics import (CACHE_SIZE, COLD_START_SECONDS, CONTEXT_TOKENS, CONTEXT_TOKENS_SAVED,
+                                      INDEX_SWAPS, LLM_COMPLETION_TOKENS, LLM_FIRST_TOKEN_SECONDS, LLM_SECONDS,
+                                      LLM_TOKENS, context_call, count_cache, count_error, process_memory, record_note,
+                                      record_passages, record_stage, stage_timer)
+from api.context_packer import ContextPacker, model_token_counter
+from api.query_log import QueryLog, most_frequent
+from api.request_scheduler import Overloaded, RequestScheduler, flight_key
+
+# Worker start, for the cold-start time reported by /readyz
+PROCESS_START = time.perf_counter()
+
+logger = logging.getLogger(__name__)
+
+# Determine the absolute path to the project root
+base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+# Base index built by hybrid_data_process.py; live updates publish versions under it (see index_versions.py)
+index_root = os.path.join(base_dir, "models", "index", "index_files")
+# Other corpora, one index root per sub-directory (see corpus_registry.py)
+corpora_root = os.path.join(base_dir, "models", "index", "corpora")
+pdf_folder = os.path.join(base_dir, "data", "raw")
+
+# Load .env
+env_path = os.path.join(base_dir, "config", ".env")
+if os.path.exists(env_path):
+    load_dotenv(env_path)
+else:
+    raise FileNotFoundError(f"The .env file cannot be found at the location {env_path}")
+
+# LOad API
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4-turbo")
+# Optional OpenAI-compatible endpoint (e.g. the local fake server: http://127.0.0.1:8001/v1)
+OPENAI_API_BASE = os.getenv("OPENAI_API_BASE")
+
+# Retrieval settings
+EXACT_HYBRID = os.getenv("EXACT_HYBRID", "false").lower() == "true"
+EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE") or None
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")  # torch, onnx or onnx_int8 (same as at indexing)
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS")) if os.getenv("EMBEDDING_THREADS") else None
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "3600"))
+# Retrieval results of repeated questions, per index version (0: disabled)
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH")) if os.getenv("FAISS_EF_SEARCH") else None
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE")) if os.getenv("FAISS_NPROBE") else None
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", str(os.cpu_count() or 1)))
+# Coarse-to-fine search: number of document sections probed before scoring passages (0: flat search)
+SECTION_PROBE = int(os.getenv("SECTION_PROBE", "0"))
+
+# Semantic answer cache settings
+SEMANTIC_CACHE = os.getenv("SEMANTIC_CACHE", "true").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "1000"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "86400"))
+SEMANTIC_CACHE_DIR = os.getenv("SEMANTIC_CACHE_DIR") or None
+
+# Prompt context: passages retrieved, then packed under a token budget (merged, deduplicated, cited)
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "5"))
+CONTEXT_PACKING = os.getenv("CONTEXT_PACKING", "true").lower() == "true"
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+
+# Per-request profiling (X-Profile header): allowed at all, and where cProfile dumps go
+REQUEST_PROFILING = os.getenv("REQUEST_PROFILING", "true").lower() == "true"
+PROFILE_DIR = os.getenv("PROFILE_DIR") or os.path.join(base_dir, "data", "logs", "profiles")
+
+# Live index updates: seconds between checks for a newly published index version (0: never), and
+# the token required by the /admin routes (unset: admin routes are disabled)
+INDEX_WATCH_INTERVAL = float(os.getenv("INDEX_WATCH_INTERVAL", "10"))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN") or None
+
+# Query log: answered questions with their passage ids and stage timings, rotated by size (see query_log.py),
+# and the number of most frequent logged questions whose embedding and retrieval are precomputed at startup
+QUERY_LOG = os.getenv("QUERY_LOG", "true").lower() == "true"
+QUERY_LOG_PATH = os.getenv("QUERY_LOG_PATH") or os.path.join(base_dir, "data", "logs", "queries.jsonl")
+QUERY_LOG_MAX_BYTES = int(os.getenv("QUERY_LOG_MAX_BYTES", str(20 * 2**20)))
+QUERY_LOG_BACKUPS = int(os.getenv("QUERY_LOG_BACKUPS", "5"))
+PREWARM_QUERIES = int(os.getenv("PREWARM_QUERIES", "50"))
+
+# Corpora loaded by a worker: estimated memory they may take together (MB, 0: no limit), the least recently
+# used being unloaded first, and seconds after which an unused corpus is unloaded (0: never)
+CORPUS_MEMORY_BUDGET_MB = float(os.getenv("CORPUS_MEMORY_BUDGET_MB", "4096"))
+CORPUS_IDLE_TTL = float(os.getenv("CORPUS_IDLE_TTL", "1800"))
+
+# Request scheduling (per worker): concurrent OpenAI calls, questions waiting beyond them (503 when full),
+# seconds a question may wait for an answer, and retries of rate-limited OpenAI calls
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "64"))
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "1.0"))
+
+if not OPENAI_API_KEY:
+    raise ValueError("OpenAI API key missing. Check .env file.")
+
+openai.api_key = OPENAI_API_KEY
+if OPENAI_API_BASE:
+    openai.api_base = OPENAI_API_BASE
+
+# Corpora (see corpus_registry.py): the retriever (FAISS, passages, BM25) and semantic cache of each corpus
+# are loaded lazily, once per worker: the default corpus by warmup() in the API lifespan hook, the others
+# by the first request that names them. All corpora share the embedding model and the query embedding cache.
+_query_cache = None
+startup_state = {"status": "starting", "cold_start_s": None, "warmup_s": None, "prewarmed": 0, "error": None}
+WARMUP_QUERY = "conduite à tenir en cas d'hémorragie"
+
+
+def corpus_pdf_folder(corpus=None):
+    """PDFs of a corpus: data/raw for the default one, data/raw/<corpus> for the others."""
+    return pdf_folder if corpus in (None, DEFAULT_CORPUS) else os.path.join(pdf_folder, corpus)
+
+
+def load_retriever(root, query_cache=None):
+    """HybridRetriever on the live index version of a corpus, and the identifier of that version."""
+    from model_management.hybrid_retrieval import HybridRetriever
+    from model_management.index_versions import current_version, index_version, resolve_index_dir
+
+    version = current_version(root)
+    live_dir = resolve_index_dir(root, version)
+    retriever = HybridRetriever(index_path=os.path.join(live_dir, "faiss_index"),
+                                embeddings_path=resolve_passages_path(live_dir),
+                                device=EMBEDDING_DEVICE, cache_size=QUERY_CACHE_SIZE,
+                                cache_ttl=QUERY_CACHE_TTL, ef_search=FAISS_EF_SEARCH, nprobe=FAISS_NPROBE,
+                                encoder_backend=EMBEDDING_BACKEND, encoder_threads=EMBEDDING_THREADS,
+                                query_cache=query_cache, section_probe=SECTION_PROBE,
+                                result_cache_size=RETRIEVAL_CACHE_SIZE)
+    return retriever, version or index_version(root)
+
+
+def load_corpus(name, root) -> Corpus:
+    """Retriever and semantic cache of a corpus, warmed up with one query and its most frequent logged questions."""
+    global _query_cache
+    from model_management.index_versions import index_version
+
+    retriever, version = load_retriever(root, query_cache=_query_cache)
+    _query_cache = retriever.query_encoder.cache
+
+    # Answers of past questions, reused for paraphrases grounded on the same passages of this corpus
+    semantic_cache = None
+    if SEMANTIC_CACHE:
+        from api.semantic_cache import SemanticAnswerCache
+
+        semantic_cache = SemanticAnswerCache(
+            dim=retriever.index.d,
+            threshold=SEMANTIC_CACHE_THRESHOLD,
+            max_entries=SEMANTIC_CACHE_SIZE,
+            ttl=SEMANTIC_CACHE_TTL,
+            persist_dir=SEMANTIC_CACHE_DIR if name == DEFAULT_CORPUS or not SEMANTIC_CACHE_DIR
+            else os.path.join(SEMANTIC_CACHE_DIR, name),
+            version_fn=lambda: index_version(root),
+        )
+    corpus = Corpus(name, root, retriever, version, semantic_cache)
+    retriever.retrieve(WARMUP_QUERY, exact=EXACT_HYBRID)
+    corpus.prewarmed = prewarm(retriever, name)
+    return corpus
+
+
+corpora = CorpusRegistry(index_root, corpora_root, load_corpus, memory_budget=int(CORPUS_MEMORY_BUDGET_MB * 2**20),
+                         idle_ttl=CORPUS_IDLE_TTL)
+
+
+def get_retriever(corpus=None):
+    """Retriever of a corpus (default: the default corpus), loaded first if needed (raises UnknownCorpus)."""
+    return corpora.get(corpus).retriever
+
+
+def prewarm(retriever, corpus=DEFAULT_CORPUS) -> int:
+    """
+    Precompute the query embeddings (one batch) and retrieval results of the PREWARM_QUERIES most
+    frequent questions asked to this corpus in the query log, so that the usual questions are cache hits from the start.
+    """
+    if query_log is None or PREWARM_QUERIES <= 0:
+        return 0
+    questions = most_frequent(QUERY_LOG_PATH, PREWARM_QUERIES, corpus=corpus)
+    if not questions:
+        return 0
+    with stage_timer("prewarm"):
+        retriever.query_encoder.encode_batch([question for question, _ in questions])
+        for question, filters in questions:
+            try:
+                retriever.retrieve(question, top_k=RETRIEVAL_TOP_K, exact=EXACT_HYBRID, filters=filters)
+            except Exception as e:
+                # e.g. filters on a document removed since: the question is simply not prewarmed
+                logger.warning("Prewarm skipped %r: %s", question, e)
+    return len(questions)
+
+
+def warmup():
+    """
+    Load the default corpus, run one query and prewarm the caches with the most frequent logged questions,
+    so that the first user requests do not pay the cold start. Other corpora are loaded on first use.
+    """
+    start = time.perf_counter()
+    try:
+        corpus = corpora.get()
+    except Exception as e:
+        startup_state.update(status="error", error=f"{type(e).__name__}: {e}")
+        logger.error("Warmup failed", exc_info=e)
+        return
+    startup_state.update(status="ready", warmup_s=round(time.perf_counter() - start, 3),
+                         cold_start_s=round(time.perf_counter() - PROCESS_START, 3), prewarmed=corpus.prewarmed)
+    COLD_START_SECONDS.set(startup_state["cold_start_s"])
+    print(f"✅ Worker {os.getpid()} ready in {startup_state['cold_start_s']}s "
+          f"(FAISS index: {corpus.retriever.index_mode}, {corpus.prewarmed} questions prewarmed, "
+          f"RSS {process_memory().get('rss', 0) / 2**20:.0f} MB)")
+
+# LIVE INDEX UPDATES (hot swap)
+
+_update_lock = threading.Lock()
+update_state = {"status": "idle", "corpus": None, "version": None, "error": None, "seconds": None}
+# Index updates started by the admin route run one at a time in this thread; the last one is kept
+_update_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-update")
+_update_future = None
+
+
+def swap_corpus(corpus: Corpus) -> bool:
+    """
+    Hot swap a loaded corpus to its published index version: the new retriever is loaded next to the
+    current one (same shared model, same query embedding cache), warmed up, then replaces it in one
+    assignment. Requests already running finish on the retriever they hold. Returns False if already up to date.
+    """
+    from model_management.index_versions import index_version
+
+    with corpus.swap_lock:
+        if index_version(corpus.index_root) == corpus.version:
+            return False
+        with stage_timer("index_swap"):
+            retriever, version = load_retriever(corpus.index_root, query_cache=corpus.retriever.query_encoder.cache)
+            retriever.retrieve(WARMUP_QUERY, exact=EXACT_HYBRID)
+            # Results cached on the old version are dropped with it: recompute the frequent ones
+            prewarm(retriever, corpus.name)
+        previous = corpus.version
+        corpus.retriever, corpus.version = retriever, version
+        # Passage ids and contents changed: answers cached on the old version are dropped
+        if corpus.semantic_cache is not None:
+            corpus.semantic_cache.invalidate()
+        corpora.resized(corpus)
+        INDEX_SWAPS.inc()
+        print(f"🔄 Worker {os.getpid()}: {corpus.name} index {previous} -> {version} ({len(retriever.passages)} passages, "
+              f"{retriever.tombstones.size} tombstones)")
+        return True
+
+
+def reload_retriever(corpus=None) -> bool:
+    """Hot swap a corpus (default: the default corpus) to its published index version, see swap_corpus."""
+    return swap_corpus(corpora.get(corpus))
+
+
+def watch_index(stop_event: threading.Event):
+    """
+    Background loop of each worker: hot swap the loaded corpora when another process publishes a new
+    index version (every INDEX_WATCH_INTERVAL seconds), and unload the corpora idle for CORPUS_IDLE_TTL.
+    """
+    while not stop_event.wait(INDEX_WATCH_INTERVAL if INDEX_WATCH_INTERVAL > 0 else 60):
+        corpora.evict_idle()
+        if INDEX_WATCH_INTERVAL <= 0:
+            continue
+        for corpus in corpora.loaded():
+            try:
+                swap_corpus(corpus)
+            except Exception as e:
+                count_error("index_swap", e)
+                logger.error("Index hot swap of %s failed, still serving %s", corpus.name, corpus.version, exc_info=e)
+
+
+def start_index_watcher() -> threading.Event:
+    """Start watch_index in a daemon thread (unless it has nothing to do); set the event to stop it."""
+    stop_event = threading.Event()
+    if INDEX_WATCH_INTERVAL > 0 or CORPUS_IDLE_TTL > 0:
+        threading.Thread(target=watch_index, args=(stop_event,), name="index-watcher", daemon=True).start()
+    return stop_event
+
+
+def update_index(add=(), remove=(), corpus=None):
+    """
+    Build the next index version of a corpus with PDFs of its folder (corpus_pdf_folder) added (or replaced)
+    and documents removed, publish it and hot swap to it. Other workers pick it up with their watcher.
+    Returns the live version.
+    """
+    if not _begin_update(corpus):
+        logger.warning("Index update ignored: another one is already running in this worker.")
+        return None
+    return _run_update(add, remove, corpus)
+
+
+def start_index_update(add=(), remove=(), corpus=None):
+    """
+    Start update_index in the background. The update is marked running before returning, so a caller
+    told it was accepted cannot lose it to a concurrent one. Returns its future, or None when one is running.
+    """
+    global _update_future
+    if not _begin_update(corpus):
+        return None
+    try:
+        _update_future = _update_executor.submit(_run_update, add, remove, corpus)
+    except Exception:
+        update_state.update(status="idle")
+        _update_lock.release()
+        raise
+    _update_future.add_done_callback(_log_update_result)
+    return _update_future
+
+
+def _begin_update(corpus) -> bool:
+    if not _update_lock.acquire(blocking=False):
+        return False
+    update_state.update(status="running", corpus=corpus or DEFAULT_CORPUS, version=None, error=None, seconds=None)
+    return True
+
+
+def _log_update_result(future):
+    if future.exception() is not None:
+        logger.error("Index update crashed", exc_info=future.exception())
+    else:
+        logger.info("Index update %s in %ss: %s", update_state["status"], update_state["seconds"],
+                    update_state["error"] or future.result())
+
+
+def _run_update(add, remove, corpus):
+    """Body of an update started by _begin_update (releases its lock)."""
+    from data_processing.live_update import update_live_index
+
+    start = time.perf_counter()
+    try:
+        loaded = corpora.get(corpus)
+        with stage_timer("index_update"):
+            version = update_live_index(loaded.index_root,
+                                        add_pdfs=[os.path.join(corpus_pdf_folder(corpus), name) for name in add],
+                                        remove_documents=remove, model=loaded.retriever.model)
+        swap_corpus(loaded)
+        update_state.update(status="done", version=version)
+    except Exception as e:
+        # Runs in the background: the error is reported by GET /admin/index, the live index is unchanged
+        update_state.update(status="error", error=f"{type(e).__name__}: {e}")
+        logger.error("Index update failed", exc_info=e)
+    finally:
+        update_state["seconds"] = round(time.perf_counter() - start, 3)
+        _update_lock.release()
+    return update_state["version"]
+
+
+def index_status(corpus=None) -> dict:
+    """Loaded index version of a corpus in this worker, its published version and state of the last update."""
+    from model_management.index_versions import index_version, list_versions
+
+    root = corpora.index_root(corpus)
+    loaded = corpora.peek(corpus)
+    retriever = loaded.retriever if loaded is not None else None
+    return {
+        "corpus": corpus or DEFAULT_CORPUS,
+        "loaded": loaded.version if loaded is not None else None,
+        "published": index_version(root),
+        "versions": list_versions(root),
+        "passages": len(retriever.passages) if retriever is not None else None,
+        "tombstones": int(retriever.tombstones.size) if retriever is not None else None,
+        "last_update": dict(update_state),
+    }
+
+
+def readiness() -> dict:
+    """Startup state, cold-start time and memory of this worker (served by /readyz)."""
+    memory = process_memory()
+    report = dict(startup_state, pid=os.getpid(),
+                  rss_mb=round(memory["rss"] / 2**20, 1) if "rss" in memory else None,
+                  shared_mb=round(memory["shared"] / 2**20, 1) if "shared" in memory else None)
+    default = corpora.peek()
+    if default is not None:
+        report.update(passages=len(default.retriever.passages), index_mode=default.retriever.index_mode,
+                      index_version=default.version)
+    report["corpora"] = corpora.stats()
+    report["scheduler"] = scheduler.stats()
+    return report
+
+# Context tokens counted with the tokenizer of the chat model (or a safe estimate without tiktoken)
+count_context_tokens, CONTEXT_TOKEN_UNIT = model_token_counter(OPENAI_MODEL)
+context_packer = ContextPacker(max_tokens=CONTEXT_TOKEN_BUDGET, count=count_context_tokens) if CONTEXT_PACKING else None
+
+# Retrieval is CPU-bound: run it in a pool sized to the cores, off the event loop
+retrieval_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+
+# Answered questions, appended by the API routes (None: QUERY_LOG disabled)
+query_log = QueryLog(QUERY_LOG_PATH, max_bytes=QUERY_LOG_MAX_BYTES, backups=QUERY_LOG_BACKUPS) if QUERY_LOG else None
+
+# Coalesces identical questions in flight and bounds the OpenAI calls of the async paths
+scheduler = RequestScheduler(max_llm_calls=LLM_MAX_CONCURRENCY, max_queue=LLM_QUEUE_SIZE, deadline=REQUEST_DEADLINE,
+                             max_retries=LLM_MAX_RETRIES, backoff=LLM_RETRY_BACKOFF)
+
+
+def error_message(e):
+    """User-facing text of an error; it is also counted in /metrics and logged with its traceback."""
+    if isinstance(e, Overloaded):
+        # Already counted in rag_rejected_requests_total; only reaches the user in a started stream
+        return " Server overloaded: please retry in a few moments."
+    count_error("llm" if isinstance(e, openai.error.OpenAIError) else "request", e)
+    logger.error("RAG pipeline error (%s)", type(e).__name__, exc_info=e)
+    if isinstance(e, openai.error.AuthenticationError):
+        return " Authentication error: invalid or missing API key."
+    if isinstance(e, openai.error.OpenAIError):
+        return f" OpenAI error: {str(e)}"
+    return f" Unknown error : {str(e)}"
+
+
+def record_completion(response, mode, seconds):
+    """LLM latency and token usage of a non-streamed completion."""
+    LLM_SECONDS.observe(seconds, mode=mode)
+    usage = response.get("usage") or {}
+    LLM_TOKENS.inc(usage.get("prompt_tokens", 0), type="prompt")
+    LLM_TOKENS.inc(usage.get("completion_tokens", 0), type="completion")
+    if "completion_tokens" in usage:
+        LLM_COMPLETION_TOKENS.observe(usage["completion_tokens"])
+
+
+def update_cache_gauges():
+    """Refresh the cache size gauges (called when /metrics is scraped), summed over the loaded corpora."""
+    loaded = corpora.loaded()
+    if _query_cache is not None:
+        CACHE_SIZE.set(len(_query_cache), cache="query_embedding")
+    CACHE_SIZE.set(sum(len(c.retriever.result_cache) for c in loaded), cache="retrieval")
+    if SEMANTIC_CACHE:
+        CACHE_SIZE.set(sum(c.semantic_cache.stats()["size"] for c in loaded if c.semantic_cache is not None),
+                       cache="semantic_answer")
+
+# Interface class for interacting with the OpenAI API
+class ChatGPTAPI:
+    def __init__(self, model=OPENAI_MODEL):
+        self.model = model
+
+    def build_prompt(self, question, context):
+        return (
+            "Tu es un assistant expert en SST (Sauveteur Secouriste du Travail). "
+            "Réponds de manière précise et factuelle en t'appuyant sur les informations suivantes, "
+            "et cite tes sources par leur numéro [n] (document, page, section) si possible.\n\n"
+            f" Contexte :\n{context}\n\n"
+            f" Question :\n{question}\n\n"
+            " **Réponse détaillée :**"
+        )
+
+    def build_messages(self, question, context):
+        with stage_timer("prompt"):
+            return [
+                {"role": "system", "content": "Tu es un expert en SST."},
+                {"role": "user", "content": self.build_prompt(question, context)}
+            ]
+
+    def retrieve_context(self, question, filters=None, corpus=None):
+        """
+        Formatted context and the ids of the passages retrieved in a corpus (optionally restricted by metadata
+        filters), and the question embedding when the corpus has a semantic cache (else None).
+        """
+        with stage_timer("retrieval"):
+            loaded = corpora.get(corpus)
+            retriever = loaded.retriever
+            results = retriever.retrieve(query=question, top_k=RETRIEVAL_TOP_K, exact=EXACT_HYBRID, filters=filters)
+            # Encoded here, in the retrieval thread (usually a query cache hit): the semantic cache reuses it
+            embedding = retriever.encode_query(question) if loaded.semantic_cache is not None else None
+        record_passages(i for i, _ in results)
+        context = self.pack_context(retriever, results) if results else ""
+        context = context or "Aucune information spécifique trouvée dans la base de données."
+        return context, [i for i, _ in results], embedding
+
+    def pack_context(self, retriever, results):
+        """Prompt context of the retrieved passages, packed under CONTEXT_TOKEN_BUDGET (tokens saved go to /metrics)."""
+        if context_packer is None:
+            return retriever.format_results(results)
+        with stage_timer("packing"):
+            hits = [(idx, score, retriever.passages[idx]) for idx, score in results]
+            context, stats = context_packer.pack(hits)
+            raw_tokens = count_context_tokens("\n\n".join(retriever._format_result(p, s) for _, s, p in hits))
+        CONTEXT_TOKENS.observe(stats["tokens"])
+        CONTEXT_TOKENS_SAVED.observe(max(raw_tokens - stats["tokens"], 0))
+        record_note("context_tokens", stats["tokens"])
+        record_note("context_tokens_saved", raw_tokens - stats["tokens"])
+        logger.info("Context packed: %d -> %d %s tokens (%d blocks, %d merged, %d redundant, %d over budget)",
+                    raw_tokens, stats["tokens"], CONTEXT_TOKEN_UNIT, stats["blocks"], stats["merged"], stats["redundant"],
+                    stats["over_budget"])
+        return context
+
+    async def in_retrieval_pool(self, fn, *args):
+        """Run fn(*args) in the retrieval threads, with the request profile, off the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(retrieval_executor, context_call(fn, *args))
+
+    async def retrieve_context_async(self, question, filters=None, corpus=None):
+        # Also loads the corpus on first use: off the event loop too
+        return await self.in_retrieval_pool(self.retrieve_context, question, filters, corpus)
+
+    async def search_async(self, queries, top_k=5, alpha=0.6, filters=None, corpus=None):
+        """Retrieval only (no LLM): structured hits for each query, computed as one batch."""
+        def search():
+            return get_retriever(corpus).search_batch(queries, top_k=top_k, alpha=alpha, exact=EXACT_HYBRID,
+                                                      filters=filters)
+
+        return await self.in_retrieval_pool(search)
+
+    def filter_values(self, corpus=None):
+        """Documents, sections, subsections and page range usable in filters."""
+        return get_retriever(corpus).filter_index().values()
+
+    def cached_answer(self, embedding, passage_ids, corpus=None):
+        """Semantic cache answer for the question embedding returned by retrieve_context (None: no cache)."""
+        # Only a loaded corpus is used: an evicted one is not reloaded for its cache
+        loaded = corpora.peek(corpus)
+        if embedding is None or loaded is None or loaded.semantic_cache is None:
+            return None
+        with stage_timer("semantic_cache"):
+            answer = loaded.semantic_cache.lookup(embedding, passage_ids)
+        count_cache("semantic_answer", answer is not None)
+        return answer
+
+    def remember_answer(self, question, embedding, passage_ids, answer, corpus=None):
+        loaded = corpora.peek(corpus)
+        if embedding is not None and loaded is not None and loaded.semantic_cache is not None and answer:
+            loaded.semantic_cache.store(question, embedding, passage_ids, answer)
+
+    async def cached_answer_async(self, embedding, passage_ids, corpus=None):
+        # The FAISS search of the semantic cache runs in the retrieval threads, not on the event loop
+        if embedding is None:
+            return None
+        return await self.in_retrieval_pool(self.cached_answer, embedding, passage_ids, corpus)
+
+    async def remember_answer_async(self, question, embedding, passage_ids, answer, corpus=None):
+        if embedding is not None and answer:
+            await self.in_retrieval_pool(self.remember_answer, question, embedding, passage_ids, answer, corpus)
+
+    def shutdown(self):
+        corpora.close()
+
+    def get_response(self, question, filters=None, corpus=None):
+        try:
+            context, passage_ids, embedding = self.retrieve_context(question, filters, corpus)
+            cached = self.cached_answer(embedding, passage_ids, corpus)
+            if cached is not None:
+                return cached
+
+            messages = self.build_messages(question, context)
+            start = time.perf_counter()
+            with stage_timer("llm"):
+                response = openai.ChatCompletion.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=0.2
+                )
+            record_completion(response, "sync", time.perf_counter() - start)
+
+            answer = response["choices"][0]["message"]["content"].strip()
+            self.remember_answer(question, embedding, passage_ids, answer, corpus)
+            return answer
+
+        except Exception as e:
+            return error_message(e)
+
+    async def get_response_async(self, question, filters=None, corpus=None):
+        """
+        Async version of get_response: retrieval in the executor, non-blocking OpenAI call.
+        Identical questions in flight share one answer; raises Overloaded when the scheduler queue is full.
+        """
+        return await scheduler.run(flight_key("query", question, filters, corpus),
+                                   lambda deadline: self._answer_async(question, filters, corpus, deadline))
+
+    async def _answer_async(self, question, filters, corpus, deadline):
+        try:
+            context, passage_ids, embedding = await self.retrieve_context_async(question, filters, corpus)
+            cached = await self.cached_answer_async(embedding, passage_ids, corpus)
+            if cached is not None:
+                return cached
+
+            messages = self.build_messages(question, context)
+            async with scheduler.llm_slot(deadline):
+                start = time.perf_counter()
+                with stage_timer("llm"):
+                    response = await scheduler.call_llm(
+                        openai.ChatCompletion.acreate,
+                        deadline,
+                        model=self.model,
+                        messages=messages,
+                        temperature=0.2
+                    )
+            record_completion(response, "async", time.perf_counter() - start)
+
+            answer = response["choices"][0]["message"]["content"].strip()
+            await self.remember_answer_async(question, embedding, passage_ids, answer, corpus)
+            return answer
+
+        except Overloaded:
+            raise
+        except Exception as e:
+            return error_message(e)
+
+    def stream_response(self, question, filters=None, corpus=None):
+        """
+        Tokens of the answer as the OpenAI stream delivers them (async iterator), shared by identical
+        questions in flight. Raises Overloaded at once, before any token, when the scheduler queue is full.
+        """
+        return scheduler.open_stream(flight_key("stream", question, filters, corpus),
+                                     lambda deadline: self._stream_answer(question, filters, corpus, deadline))
+
+    async def _stream_answer(self, question, filters, corpus, deadline):
+        try:
+            context, passage_ids, embedding = await self.retrieve_context_async(question, filters, corpus)
+            cached = await self.cached_answer_async(embedding, passage_ids, corpus)
+            if cached is not None:
+                yield cached
+                return
+
+            messages = self.build_messages(question, context)
+            # The slot is held until the last token: it bounds the OpenAI streams open at once
+            async with scheduler.llm_slot(deadline):
+                start = time.perf_counter()
+                stream = await scheduler.call_llm(
+                    openai.ChatCompletion.acreate,
+                    deadline,
+                    model=self.model,
+                    messages=messages,
+                    temperature=0.2,
+                    stream=True
+                )
+
+                # Streamed chunks carry no usage: each content delta is counted as one completion token
+                tokens = []
+                async for chunk in stream:
+                    token = chunk["choices"][0].get("delta", {}).get("content")
+                    if token:
+                        if not tokens:
+                            first_token = time.perf_counter() - start
+                            LLM_FIRST_TOKEN_SECONDS.observe(first_token)
+                            record_stage("llm_first_token", first_token)
+                        tokens.append(token)
+                        yield token
+            elapsed = time.perf_counter() - start
+            record_stage("llm", elapsed)
+            LLM_SECONDS.observe(elapsed, mode="stream")
+            LLM_TOKENS.inc(len(tokens), type="completion")
+            LLM_COMPLETION_TOKENS.observe(len(tokens))
+            await self.remember_answer_async(question, embedding, passage_ids, "".join(tokens).strip(), corpus)
+
+        except Exception as e:
+            yield error_message(e)
@@ -0,0 +1,144 @@
+import os
+import sys
+import math
+import logging
+
+# Add src/ to find data_processing
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+from data_processing.chunking import WORD_PATTERN, count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Without tiktoken, model tokens are estimated from word/punctuation tokens with this margin:
+# accented French words often split into two or more model tokens
+FALLBACK_TOKEN_RATIO = 1.8
+
+
+def model_token_counter(model: str = None):
+    """
+    Token counter of the chat model: its tiktoken tokenizer when tiktoken is installed, else word/punctuation
+    tokens scaled by FALLBACK_TOKEN_RATIO (an overestimate, so the budget is not exceeded).
+    Returns (count_fn, unit) where unit names what is counted.
+    """
+    try:
+        import tiktoken
+        try:
+            encoding = tiktoken.encoding_for_model(model or "")
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # Not installed, or its vocabulary cannot be downloaded (offline): estimate
+        if not isinstance(e, ImportError):
+            logger.warning("tiktoken unavailable (%s): context tokens are estimated", e)
+        return (lambda text: math.ceil(count_tokens(text) * FALLBACK_TOKEN_RATIO)), "estimated"
+    return (lambda text: len(encoding.encode(text, disallowed_special=()))), encoding.name
+
+
+def _merge_texts(first: str, second: str, adjacent: bool) -> str:
+    """Joins two passages of the same page, removing the sentences overlapping chunks share."""
+    if not adjacent:
+        return f"{first} … {second}"
+    a, b = first.split(), second.split()
+    for k in range(min(len(a), len(b), 80), 0, -1):
+        if a[-k:] == b[:k]:
+            return " ".join(a + b[k:])
+    return f"{first} {second}"
+
+
+def _truncate(text: str, max_tokens: int, count=count_tokens) -> str:
+    words, tokens = [], 0
+    for word in text.split():
+        # Leading space: model tokenizers count a word inside a sentence as " word"
+        tokens += count(" " + word)
+        if tokens > max_tokens:
+            break
+        words.append(word)
+    return " ".join(words) + " …"
+
+
+class ContextPacker:
+    """
+    Builds the prompt context from retrieved passages under a token budget:
+    passages of the same document and page are merged into one block (overlapping chunk text
+    removed), blocks mostly contained in a better-ranked block are dropped, each block gets a
+    compact citation header ([n] document, p. page, section › subsection), and blocks are added
+    in score order until max_tokens (the last one truncated if enough room is left).
+    Tokens are counted by count (default: word/punctuation tokens; see model_token_counter).
+    """
+
+    def __init__(self, max_tokens: int = 1500, redundancy_threshold: float = 0.8, min_truncated_tokens: int = 48,
+                 count=count_tokens):
+        self.max_tokens = max_tokens
+        self.count = count
+        self.redundancy_threshold = redundancy_threshold
+        self.min_truncated_tokens = min_truncated_tokens
+
+    def merge(self, hits):
+        """Blocks of same-page passages in the order of their best passage: [{passage, ids, score, text}]."""
+        blocks = {}
+        for passage_id, score, passage in hits:
+            key = (passage.get("document"), passage.get("page"))
+            block = blocks.get(key)
+            if block is None:
+                block = blocks[key] = {"passage": passage, "ids": [], "score": score, "texts": {}}
+            block["ids"].append(passage_id)
+            block["texts"][passage_id] = passage.get("text", "")
+
+        merged = []
+        for block in blocks.values():
+            ids = sorted(block["ids"])
+            text = block["texts"][ids[0]]
+            for previous, current in zip(ids, ids[1:]):
+                text = _merge_texts(text, block["texts"][current], adjacent=current - previous == 1)
+            merged.append({"passage": block["passage"], "ids": ids, "score": block["score"], "text": text})
+        return merged
+
+    def _is_redundant(self, words: set, kept_words) -> bool:
+        if not words:
+            return True
+        return any(len(words & other) / len(words) >= self.redundancy_threshold for other in kept_words)
+
+    @staticmethod
+    def header(number: int, passage: dict) -> str:
+        parts = [f"[{number}] {passage.get('document', 'Unspecified')}", f"p. {passage.get('page', '?')}"]
+        sections = [s for s in (passage.get("section"), passage.get("subsection")) if s and s != "Uncategorized"]
+        if sections:
+            parts.append(" › ".join(sections))
+        return ", ".join(parts)
+
+    def pack(self, hits):
+        """
+        hits : [(passage_id, score, passage dict)] best first
+        Returns (context, stats) where stats has the packed tokens, the blocks kept and the
+        passages merged, dropped as redundant or left out by the budget.
+        """
+        stats = {"tokens": 0, "blocks": 0, "merged": 0, "redundant": 0, "over_budget": 0}
+        blocks, kept_words = [], []
+        remaining = self.max_tokens
+
+        for block in self.merge(hits):
+            stats["merged"] += len(block["ids"]) - 1
+            words = set(WORD_PATTERN.findall(block["text"].lower()))
+            if self._is_redundant(words, kept_words):
+                stats["redundant"] += len(block["ids"])
+                continue
+
+            header = self.header(len(blocks) + 1, block["passage"])
+            text = block["text"]
+            # The "\n\n" separator and the header line break count too
+            tokens = self.count(f"{header}\n{text}\n\n")
+            if tokens > remaining:
+                room = remaining - self.count(f"{header}\n\n\n")
+                if room < self.min_truncated_tokens:
+                    stats["over_budget"] += len(block["ids"])
+                    continue
+                text = _truncate(text, room - self.count(" …"), self.count)
+                tokens = self.count(f"{header}\n{text}\n\n")
+
+            blocks.append(f"{header}\n{text}")
+            kept_words.append(words)
+            remaining -= tokens
+            stats["tokens"] += tokens
+
+        stats["blocks"] = len(blocks)
+        return "\n\n".join(blocks), stats
@@ -0,0 +1,105 @@
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Local stand-in for the OpenAI chat-completions API, to measure the service offline.
+# Point chatgpt_api.py at it with OPENAI_API_BASE=http://127.0.0.1:8001/v1 (any OPENAI_API_KEY).
+
+FIRST_TOKEN_LATENCY = float(os.getenv("FAKE_OPENAI_LATENCY", "0.5"))
+TOKEN_DELAY = float(os.getenv("FAKE_OPENAI_TOKEN_DELAY", "0.02"))
+ANSWER_TOKENS = int(os.getenv("FAKE_OPENAI_TOKENS", "120"))
+# Random extra latency (uniform in [0, jitter] seconds) and share of requests failed with 429 / 500
+LATENCY_JITTER = float(os.getenv("FAKE_OPENAI_JITTER", "0"))
+RATE_LIMIT_RATE = float(os.getenv("FAKE_OPENAI_429_RATE", "0"))
+ERROR_RATE = float(os.getenv("FAKE_OPENAI_ERROR_RATE", "0"))
+
+app = FastAPI(title="Fake OpenAI chat-completions")
+
+
+def fake_tokens(n_tokens):
+    words = ("En cas d'hémorragie, le sauveteur secouriste du travail comprime immédiatement "
+             "la plaie et fait alerter les secours.").split()
+    return [words[i % len(words)] + " " for i in range(n_tokens)]
+
+
+def completion_chunk(completion_id, model, delta, finish_reason=None):
+    return {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+def injected_error():
+    """429 or 500 answer for a share of the requests, shaped like the OpenAI errors; None otherwise."""
+    draw = random.random()
+    if draw < RATE_LIMIT_RATE:
+        return JSONResponse({"error": {"message": "Rate limit reached (fake server).", "type": "requests",
+                                       "code": "rate_limit_exceeded"}}, status_code=429, headers={"Retry-After": "1"})
+    if draw < RATE_LIMIT_RATE + ERROR_RATE:
+        return JSONResponse({"error": {"message": "The server had an error (fake server).", "type": "server_error",
+                                       "code": None}}, status_code=500)
+    return None
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    error = injected_error()
+    if error is not None:
+        return error
+    first_token_latency = FIRST_TOKEN_LATENCY + random.uniform(0, LATENCY_JITTER)
+    model = body.get("model", "fake-gpt")
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    tokens = fake_tokens(ANSWER_TOKENS)
+    prompt_tokens = sum(len(m.get("content", "").split()) for m in body.get("messages", []))
+
+    if body.get("stream"):
+        async def events():
+            await asyncio.sleep(first_token_latency)
+            yield f"data: {json.dumps(completion_chunk(completion_id, model, {'role': 'assistant'}))}\n\n"
+            for token in tokens:
+                yield f"data: {json.dumps(completion_chunk(completion_id, model, {'content': token}))}\n\n"
+                await asyncio.sleep(TOKEN_DELAY)
+            yield f"data: {json.dumps(completion_chunk(completion_id, model, {}, 'stop'))}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    await asyncio.sleep(first_token_latency + TOKEN_DELAY * len(tokens))
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)},
+                     "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                  "total_tokens": prompt_tokens + len(tokens)},
+    }
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible chat-completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=FIRST_TOKEN_LATENCY, help="Seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=TOKEN_DELAY, help="Seconds between streamed tokens")
+    parser.add_argument("--tokens", type=int, default=ANSWER_TOKENS, help="Tokens per answer")
+    parser.add_argument("--jitter", type=float, default=LATENCY_JITTER, help="Random extra first-token latency (s)")
+    parser.add_argument("--rate-limit-rate", type=float, default=RATE_LIMIT_RATE, help="Share of requests answered 429")
+    parser.add_argument("--error-rate", type=float, default=ERROR_RATE, help="Share of requests answered 500")
+    args = parser.parse_args()
+    FIRST_TOKEN_LATENCY, TOKEN_DELAY, ANSWER_TOKENS = args.latency, args.token_delay, args.tokens
+    LATENCY_JITTER, RATE_LIMIT_RATE, ERROR_RATE = args.jitter, args.rate_limit_rate, args.error_rate
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import aiohttp
+import numpy as np
+from collections import Counter
+
+from stream_benchmark import DEFAULT_QUESTIONS
+
+# End-to-end load test of /query: drives it at a target request rate (open loop) or concurrency
+# (closed loop) and reports throughput, latency percentiles, errors and where the time went.
+# Run the API against the fake OpenAI server (fake_openai_server.py) to measure without OpenAI costs.
+
+# Stages read from the Server-Timing header (the API profiles each request sent with X-Profile: stages)
+STAGES = ("retrieval", "semantic_cache", "llm_queue", "llm", "total")
+# Errors /query reports as an answer text (see chatgpt_api.error_message)
+ERROR_ANSWERS = ("OpenAI error", "Authentication error", "Unknown error", "Server overloaded")
+
+
+def parse_server_timing(header: str) -> dict:
+    """{stage: milliseconds} of a Server-Timing header such as "retrieval;dur=12.5, llm;dur=530.1"."""
+    stages = {}
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        if params.startswith("dur="):
+            stages[name] = float(params[4:])
+    return stages
+
+
+async def query_one(session, url, question):
+    """Outcome of one request: status (or error kind), client-side latency (ms), server stage timings."""
+    start = time.perf_counter()
+    try:
+        async with session.post(url, json={"query": question}, headers={"X-Profile": "stages"}) as response:
+            text = await response.text()
+            latency = (time.perf_counter() - start) * 1000
+            stages = parse_server_timing(response.headers.get("Server-Timing", ""))
+            coalesced = "coalesced=1" in response.headers.get("X-Profile-Notes", "")
+            status = str(response.status)
+            # Only answers are JSON: error bodies may be plain text (e.g. a Starlette 500)
+            if response.status == 200:
+                try:
+                    body = json.loads(text)
+                except ValueError:
+                    body = None
+                if not isinstance(body, dict):
+                    status = "200_nonjson"
+                elif str(body.get("response", "")).strip().startswith(ERROR_ANSWERS):
+                    status = "200_error"
+            return {"status": status, "latency_ms": latency, "stages": stages, "coalesced": coalesced}
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        return {"status": type(e).__name__, "latency_ms": (time.perf_counter() - start) * 1000, "stages": {},
+                "coalesced": False}
+
+
+async def run_rate(session, url, questions, rate, duration):
+    """Open loop: Poisson arrivals at `rate` req/s for `duration` s, whatever the response times."""
+    tasks = []
+    start = time.perf_counter()
+    next_at = start
+    i = 0
+    while next_at - start < duration:
+        await asyncio.sleep(max(next_at - time.perf_counter(), 0))
+        tasks.append(asyncio.ensure_future(query_one(session, url, questions[i % len(questions)])))
+        i += 1
+        next_at += random.expovariate(rate)
+    return await asyncio.gather(*tasks)
+
+
+async def run_concurrency(session, url, questions, concurrency, duration):
+    """Closed loop: `concurrency` clients each sending their next question as soon as one is answered."""
+    stop_at = time.perf_counter() + duration
+
+    async def client(client_id):
+        results = []
+        i = client_id
+        while time.perf_counter() < stop_at:
+            results.append(await query_one(session, url, questions[i % len(questions)]))
+            i += 1
+        return results
+
+    per_client = await asyncio.gather(*(client(c) for c in range(concurrency)))
+    return [r for results in per_client for r in results]
+
+
+async def load_test(url, questions, rate=None, concurrency=None, duration=30.0, timeout=120.0):
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout), connector=connector) as session:
+        start = time.perf_counter()
+        if rate:
+            results = await run_rate(session, url, questions, rate, duration)
+        else:
+            results = await run_concurrency(session, url, questions, concurrency, duration)
+        elapsed = time.perf_counter() - start
+    return results, elapsed
+
+
+def percentiles(values) -> dict:
+    if not len(values):
+        return {}
+    return {f"p{q}": round(float(np.percentile(values, q)), 1) for q in (50, 95, 99)}
+
+
+def summarize(results, elapsed) -> dict:
+    """Throughput, status counts, latency percentiles and per-stage time of the successful requests."""
+    statuses = Counter(r["status"] for r in results)
+    ok = [r for r in results if r["status"] == "200"]
+    latency = np.array([r["latency_ms"] for r in ok])
+    # Coalesced requests ran no stage of their own: the split is over the computations actually run
+    profiled = [r["stages"] for r in ok if not r["coalesced"] and r["stages"]]
+    stages = {stage: percentiles([s.get(stage, 0.0) for s in profiled]) for stage in STAGES}
+    mean_total = float(np.mean([s.get("total", 0.0) for s in profiled])) if profiled else 0.0
+    share = {stage: round(float(np.mean([s.get(stage, 0.0) for s in profiled])) / mean_total, 3)
+             for stage in STAGES[:-1]} if mean_total else {}
+    return {
+        "requests": len(results),
+        "seconds": round(elapsed, 2),
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        "statuses": dict(statuses),
+        "error_rate": round(1 - len(ok) / len(results), 4) if results else 0.0,
+        "coalesced": sum(r["coalesced"] for r in ok),
+        "latency_ms": percentiles(latency),
+        "stages_ms": stages,
+        "time_share": share,
+    }
+
+
+def print_report(report: dict, label: str):
+    print(f"\n{label}: {report['requests']} requests in {report['seconds']}s, "
+          f"{report['throughput_rps']} answers/s, error rate {report['error_rate']:.1%} {report['statuses']}")
+    if report["latency_ms"]:
+        lat = report["latency_ms"]
+        print(f"Latency:        p50={lat['p50']:.0f}ms p95={lat['p95']:.0f}ms p99={lat['p99']:.0f}ms "
+              f"({report['coalesced']} answers coalesced)")
+    for stage, values in report["stages_ms"].items():
+        if values:
+            share = report["time_share"].get(stage)
+            print(f"  {stage:14s} p50={values['p50']:.0f}ms p95={values['p95']:.0f}ms p99={values['p99']:.0f}ms"
+                  + (f"  ({share:.0%} of server time)" if share is not None else ""))
+
+
+if __name__ == "__main__":
+    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+    parser = argparse.ArgumentParser(description="Load test of /query (run the API against fake_openai_server.py)")
+    parser.add_argument("--url", default="http://127.0.0.1:8000/query")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--rate", type=float, nargs="+", help="Target request rates (req/s), one run each")
+    mode.add_argument("--concurrency", type=int, nargs="+", default=[16], help="Concurrent clients, one run each")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of load per run")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Client timeout per request (s)")
+    parser.add_argument("--eval-set", default=os.path.join(project_root, 'data', 'eval', 'sst_retrieval_eval.json'),
+                        help="Questions to send (the built-in ones if the file is missing)")
+    parser.add_argument("--output", default=None, help="Also write the reports to this JSON file")
+    args = parser.parse_args()
+
+    questions = DEFAULT_QUESTIONS
+    if os.path.exists(args.eval_set):
+        with open(args.eval_set, "r", encoding="utf-8") as f:
+            questions = [item["question"] for item in json.load(f)["questions"]]
+
+    reports = []
+    for level in args.rate or args.concurrency:
+        kwargs = {"rate": level} if args.rate else {"concurrency": level}
+        results, elapsed = asyncio.run(load_test(args.url, questions, duration=args.duration, timeout=args.timeout,
+                                                 **kwargs))
+        report = dict(summarize(results, elapsed), **kwargs)
+        print_report(report, f"{'Rate' if args.rate else 'Concurrency'} {level}")
+        reports.append(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
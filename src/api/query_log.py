@@ -0,0 +1,118 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import Counter, deque
+
+from model_management.corpus_registry import DEFAULT_CORPUS
+
+logger = logging.getLogger(__name__)
+
+# Rotation lock left by a worker that died while rotating: ignored after this many seconds
+STALE_LOCK_SECONDS = 60
+
+
+class QueryLog:
+    """
+    Append-only JSON-lines log of the questions answered by the API, rotated by size:
+    path is the current file, path.1 the previous one, ... up to path.<backups>.
+    Each record is one short append, so the API workers share the same file.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 20 * 2**20, backups: int = 5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def append(self, record: dict):
+        line = (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._lock:
+            try:
+                if os.path.exists(self.path) and os.path.getsize(self.path) + len(line) > self.max_bytes:
+                    self._rotate(len(line))
+                with open(self.path, "ab") as f:
+                    f.write(line)
+            except OSError as e:
+                # Logging must never fail a request
+                logger.warning("Query log write failed: %s", e)
+
+    def _rotate(self, incoming: int):
+        lock_path = f"{self.path}.lock"
+        try:
+            if time.time() - os.path.getmtime(lock_path) > STALE_LOCK_SECONDS:
+                os.remove(lock_path)
+        except OSError:
+            pass
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return  # another worker is rotating: append to the current file meanwhile
+        try:
+            # Rotated by another worker between the size check and the lock
+            if not os.path.exists(self.path) or os.path.getsize(self.path) + incoming <= self.max_bytes:
+                return
+            if self.backups <= 0:
+                os.remove(self.path)
+                return
+            for i in range(self.backups - 1, 0, -1):
+                if os.path.exists(f"{self.path}.{i}"):
+                    os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        finally:
+            os.close(fd)
+            os.remove(lock_path)
+
+
+def log_files(path: str) -> list:
+    """Existing files of a rotated log, oldest first."""
+    directory, prefix = os.path.dirname(path) or ".", os.path.basename(path) + "."
+    if not os.path.isdir(directory):
+        return []
+    backups = sorted((int(name[len(prefix):]) for name in os.listdir(directory)
+                      if name.startswith(prefix) and name[len(prefix):].isdigit()), reverse=True)
+    files = [f"{path}.{i}" for i in backups]
+    return files + ([path] if os.path.exists(path) else [])
+
+
+def read_records(path: str, max_records: int = None):
+    """Records of a rotated log in chronological order (only the last max_records if set); bad lines are skipped."""
+    records = deque(maxlen=max_records)
+    for file_path in log_files(path):
+        with open(file_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue  # line cut by a crash or a concurrent rotation
+    return list(records)
+
+
+def most_frequent(path: str, n: int, max_records: int = 100_000, corpus: str = DEFAULT_CORPUS) -> list:
+    """The n most asked (question, filters) pairs of a corpus in the last max_records logged questions."""
+    counts = Counter((r["q"], json.dumps(r.get("filters"), sort_keys=True))
+                     for r in read_records(path, max_records)
+                     if r.get("q") and r.get("corpus", DEFAULT_CORPUS) == corpus)
+    return [(question, json.loads(filters)) for (question, filters), _ in counts.most_common(n)]
+
+
+def query_record(route: str, question: str, filters=None, profile=None, total_ms: float = None,
+                 corpus: str = None) -> dict:
+    """Compact log record of one answered question: text, time, retrieved passage ids and stage timings (ms)."""
+    record = {"ts": round(time.time(), 3), "route": route, "q": question}
+    if corpus and corpus != DEFAULT_CORPUS:
+        record["corpus"] = corpus
+    if filters:
+        record["filters"] = filters
+    if profile is not None:
+        if profile.passage_ids is not None:
+            record["ids"] = profile.passage_ids
+        if profile.stages:
+            record["ms"] = {stage: round(ms, 2) for stage, ms in profile.milliseconds().items()}
+        if profile.notes.get("coalesced"):
+            record["coalesced"] = True
+    if total_ms is not None:
+        record["total_ms"] = round(total_ms, 2)
+    return record
@@ -0,0 +1,196 @@
+import json
+import time
+import random
+import asyncio
+from contextlib import asynccontextmanager
+import openai
+
+from model_management.metrics import (COALESCED_REQUESTS, LLM_RETRIES, REJECTED_REQUESTS, SCHEDULER_REQUESTS,
+                                      record_note, record_stage)
+
+# OpenAI errors worth another attempt: the request was refused or lost, not answered
+RETRYABLE_ERRORS = (openai.error.RateLimitError, openai.error.ServiceUnavailableError,
+                    openai.error.APIConnectionError, openai.error.TryAgain)
+
+
+class Overloaded(Exception):
+    """The question was refused (admission queue full) or got no LLM slot before its deadline (API: 503)."""
+
+    def __init__(self, reason: str, retry_after: float = 1.0):
+        super().__init__(f"server overloaded: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def flight_key(mode: str, question: str, filters: dict = None, corpus: str = None) -> tuple:
+    """Identity of a computation: questions with the same mode, text, filters and corpus get the same answer."""
+    return mode, question, json.dumps(filters, sort_keys=True) if filters else "", corpus or ""
+
+
+class _StreamFlight:
+    """Tokens of one streamed computation, replayed to each subscriber from the start and as they arrive."""
+
+    def __init__(self):
+        self.tokens = []
+        self.done = False
+        self.error = None
+        self.changed = asyncio.Condition()
+
+    async def feed(self, tokens):
+        try:
+            async for token in tokens:
+                async with self.changed:
+                    self.tokens.append(token)
+                    self.changed.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            async with self.changed:
+                self.done = True
+                self.changed.notify_all()
+
+    async def subscribe(self):
+        position = 0
+        while True:
+            async with self.changed:
+                await self.changed.wait_for(lambda: len(self.tokens) > position or self.done)
+                tokens = self.tokens[position:]
+            if not tokens:
+                if self.error is not None:
+                    raise self.error
+                return
+            for token in tokens:
+                yield token
+            position += len(tokens)
+
+
+class RequestScheduler:
+    """
+    In-process scheduler in front of the LLM pipeline of one worker:
+    - identical questions in flight share one computation (retrieval and OpenAI call): single flight;
+    - at most max_llm_calls + max_queue computations are admitted, further ones raise Overloaded;
+    - at most max_llm_calls OpenAI calls run at once, the others wait for a slot until their deadline;
+    - OpenAI calls refused for rate limit or unavailability are retried with jittered exponential backoff.
+    Limits are per worker (with --workers N, the API allows N times as many).
+    """
+
+    def __init__(self, max_llm_calls: int = 8, max_queue: int = 64, deadline: float = 60.0, max_retries: int = 3,
+                 backoff: float = 1.0, max_backoff: float = 20.0):
+        self.max_llm_calls = max_llm_calls
+        self.max_admitted = max_llm_calls + max_queue
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._semaphore = None  # created on the event loop of the first call
+        self._flights = {}
+        self.admitted = 0
+        self.queued = 0
+        self.calling = 0
+
+    def _update_gauges(self):
+        SCHEDULER_REQUESTS.set(self.admitted, state="admitted")
+        SCHEDULER_REQUESTS.set(self.queued, state="queued")
+        SCHEDULER_REQUESTS.set(self.calling, state="llm")
+
+    def _admit(self):
+        if self.admitted >= self.max_admitted:
+            REJECTED_REQUESTS.inc(reason="queue_full")
+            raise Overloaded(f"{self.admitted} questions in progress", retry_after=self.backoff)
+        self.admitted += 1
+        self._update_gauges()
+
+    def _finish(self, key, task):
+        self._flights.pop(key, None)
+        self.admitted -= 1
+        self._update_gauges()
+        if not task.cancelled():
+            task.exception()  # retrieved here so that a flight left without waiters logs nothing
+
+    def _join(self, key):
+        flight = self._flights.get(key)
+        if flight is not None:
+            COALESCED_REQUESTS.inc(mode=key[0])
+            record_note("coalesced", 1)
+        return flight
+
+    async def run(self, key: tuple, fn):
+        """Result of the coroutine fn(deadline), computed once for identical concurrent calls."""
+        flight = self._join(key)
+        if flight is None:
+            self._admit()
+            flight = asyncio.ensure_future(fn(time.monotonic() + self.deadline))
+            self._flights[key] = flight
+            flight.add_done_callback(lambda task: self._finish(key, task))
+        # A caller that goes away does not cancel the computation the others are waiting for
+        return await asyncio.shield(flight)
+
+    def open_stream(self, key: tuple, fn):
+        """
+        Tokens of the async generator fn(deadline), produced once for identical concurrent streams.
+        Admission happens on this call, before the response starts, so a full queue can still get a 503.
+        """
+        flight = self._join(key)
+        if flight is None:
+            self._admit()
+            flight = _StreamFlight()
+            task = asyncio.ensure_future(flight.feed(fn(time.monotonic() + self.deadline)))
+            self._flights[key] = flight
+            task.add_done_callback(lambda task: self._finish(key, task))
+        return flight.subscribe()
+
+    @asynccontextmanager
+    async def llm_slot(self, deadline: float):
+        """Holds one of the max_llm_calls OpenAI slots; raises Overloaded if none frees up before the deadline."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_llm_calls)
+        start = time.perf_counter()
+        self.queued += 1
+        self._update_gauges()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            REJECTED_REQUESTS.inc(reason="deadline")
+            raise Overloaded("no LLM slot before the deadline", retry_after=self.backoff) from None
+        finally:
+            self.queued -= 1
+            self._update_gauges()
+        record_stage("llm_queue", time.perf_counter() - start)
+
+        self.calling += 1
+        self._update_gauges()
+        try:
+            yield
+        finally:
+            self.calling -= 1
+            self._update_gauges()
+            self._semaphore.release()
+
+    def retry_delay(self, attempt: int, error: Exception) -> float:
+        """Retry-After of the OpenAI answer if any, else full-jitter exponential backoff."""
+        retry_after = (getattr(error, "headers", None) or {}).get("retry-after")
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_backoff) + random.uniform(0, self.backoff)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    async def call_llm(self, fn, deadline: float, **kwargs):
+        """await fn(**kwargs) (an OpenAI acreate), retried on RETRYABLE_ERRORS while the deadline allows it."""
+        attempt = 0
+        while True:
+            try:
+                return await fn(request_timeout=max(deadline - time.monotonic(), 1.0), **kwargs)
+            except RETRYABLE_ERRORS as e:
+                delay = self.retry_delay(attempt, e)
+                if attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+                    raise
+                LLM_RETRIES.inc(error=type(e).__name__)
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    def stats(self) -> dict:
+        return {"admitted": self.admitted, "queued": self.queued, "llm_calls": self.calling,
+                "in_flight": len(self._flights), "max_admitted": self.max_admitted,
+                "max_llm_calls": self.max_llm_calls}
@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import threading
+import faiss
+import numpy as np
+from collections import OrderedDict
+
+
+class SemanticAnswerCache:
+    """
+    Cache of LLM answers looked up by question similarity.
+    Past question embeddings live in a small FAISS index; a stored answer is returned when a new
+    question is above the cosine threshold AND retrieved the same passages, so paraphrases share
+    an answer only when they are grounded on the same context.
+    Entries are evicted LRU-first beyond max_entries and after ttl seconds, and the whole cache is
+    dropped when the document index version changes.
+    """
+
+    def __init__(self, dim: int, threshold: float = 0.92, max_entries: int = 1000, ttl: float = 86400.0,
+                 persist_dir: str = None, version_fn=None, version_check_interval: float = 10.0):
+        self.dim = dim
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persist_dir = persist_dir
+        self.version_fn = version_fn
+        self.version_check_interval = version_check_interval
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._version = version_fn() if version_fn else None
+        self._last_version_check = time.monotonic()
+
+        if persist_dir:
+            self.load()
+
+    def _check_version(self):
+        """Invalidate the cache if the document index was rebuilt since the answers were stored."""
+        if self.version_fn is None:
+            return
+        now = time.monotonic()
+        if now - self._last_version_check < self.version_check_interval:
+            return
+        self._last_version_check = now
+        version = self.version_fn()
+        if version != self._version:
+            self._clear()
+            self._version = version
+
+    def _remove(self, entry_id):
+        self._entries.pop(entry_id, None)
+        self._index.remove_ids(np.asarray([entry_id], dtype=np.int64))
+
+    def _clear(self):
+        self._entries.clear()
+        self._index.reset()
+
+    def lookup(self, embedding: np.ndarray, passage_ids):
+        """Stored answer of a similar past question with the same retrieved passages, else None."""
+        with self._lock:
+            self._check_version()
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            query = np.ascontiguousarray(embedding, dtype=np.float32).reshape(1, -1)
+            scores, ids = self._index.search(query, min(4, len(self._entries)))
+            now = time.time()
+            wanted = sorted(passage_ids)
+            for score, entry_id in zip(scores[0], ids[0]):
+                if entry_id == -1 or score < self.threshold:
+                    break
+                entry = self._entries.get(int(entry_id))
+                if entry is None:
+                    continue
+                if now - entry["created"] > self.ttl:
+                    self._remove(int(entry_id))
+                    continue
+                if entry["passage_ids"] == wanted:
+                    self._entries.move_to_end(int(entry_id))
+                    self.hits += 1
+                    return entry["answer"]
+
+            self.misses += 1
+            return None
+
+    def store(self, question: str, embedding: np.ndarray, passage_ids, answer: str):
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            vector = np.ascontiguousarray(embedding, dtype=np.float32).reshape(1, -1)
+            self._index.add_with_ids(vector, np.asarray([entry_id], dtype=np.int64))
+            self._entries[entry_id] = {
+                "question": question,
+                "passage_ids": sorted(int(i) for i in passage_ids),
+                "answer": answer,
+                "created": time.time(),
+            }
+            while len(self._entries) > self.max_entries:
+                oldest_id = next(iter(self._entries))
+                self._remove(oldest_id)
+
+    def invalidate(self):
+        """Drop every cached answer (call it when the document index is rebuilt)."""
+        with self._lock:
+            self._clear()
+            if self.version_fn:
+                self._version = self.version_fn()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
+
+    def save(self):
+        """Persist entries and their vectors to persist_dir."""
+        if not self.persist_dir:
+            return
+        os.makedirs(self.persist_dir, exist_ok=True)
+        with self._lock:
+            entry_ids = list(self._entries)
+            vectors = np.vstack([self._index.reconstruct(i) for i in entry_ids]) if entry_ids \
+                else np.empty((0, self.dim), dtype=np.float32)
+            payload = {"version": self._version, "dim": self.dim,
+                       "entries": [self._entries[i] for i in entry_ids]}
+
+        np.save(os.path.join(self.persist_dir, "semantic_cache_vectors.npy"), vectors)
+        tmp_path = os.path.join(self.persist_dir, "semantic_cache.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(self.persist_dir, "semantic_cache.json"))
+
+    def load(self):
+        """Reload persisted entries, unless they were built on another version of the document index."""
+        json_path = os.path.join(self.persist_dir, "semantic_cache.json")
+        vectors_path = os.path.join(self.persist_dir, "semantic_cache_vectors.npy")
+        if not (os.path.exists(json_path) and os.path.exists(vectors_path)):
+            return
+
+        with open(json_path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        if payload.get("version") != self._version or payload.get("dim") != self.dim:
+            print("♻️ Semantic cache built on another index version, starting empty.")
+            return
+
+        vectors = np.load(vectors_path)
+        now = time.time()
+        with self._lock:
+            for vector, entry in zip(vectors, payload["entries"]):
+                if now - entry["created"] <= self.ttl:
+                    entry_id = self._next_id
+                    self._next_id += 1
+                    self._index.add_with_ids(vector.reshape(1, -1).astype(np.float32),
+                                             np.asarray([entry_id], dtype=np.int64))
+                    self._entries[entry_id] = entry
+        print(f"📂 Semantic cache: {len(self._entries)} answers reloaded.")
@@ -0,0 +1,73 @@
+import json
+import time
+import asyncio
+import argparse
+import aiohttp
+import numpy as np
+
+# Measures time-to-first-token and concurrent capacity of /query/stream.
+# Run the API against the fake OpenAI server (see fake_openai_server.py) to measure offline.
+
+DEFAULT_QUESTIONS = [
+    "que faire en cas d'hémorragie ?",
+    "comment mettre une victime en position latérale de sécurité ?",
+    "quels sont les signes d'un arrêt cardiaque ?",
+    "conduite à tenir en cas de brûlure",
+]
+
+
+async def stream_one(session, url, question):
+    """Returns (time to first token, total time, number of tokens) for one streamed answer."""
+    start = time.perf_counter()
+    first_token = None
+    n_tokens = 0
+    async with session.post(url, json={"query": question}) as response:
+        response.raise_for_status()
+        async for raw_line in response.content:
+            line = raw_line.decode("utf-8").strip()
+            if not line.startswith("data:"):
+                continue
+            if json.loads(line[5:]).get("token"):
+                n_tokens += 1
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+    return first_token, time.perf_counter() - start, n_tokens
+
+
+async def run(url, concurrency, requests_per_client, questions):
+    timeout = aiohttp.ClientTimeout(total=300)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        async def client(client_id):
+            results = []
+            for i in range(requests_per_client):
+                question = questions[(client_id + i) % len(questions)]
+                results.append(await stream_one(session, url, question))
+            return results
+
+        start = time.perf_counter()
+        per_client = await asyncio.gather(*(client(c) for c in range(concurrency)), return_exceptions=True)
+        elapsed = time.perf_counter() - start
+
+    results = [r for rs in per_client if not isinstance(rs, Exception) for r in rs]
+    errors = [rs for rs in per_client if isinstance(rs, Exception)]
+    return results, errors, elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time-to-first-token and concurrency benchmark of /query/stream")
+    parser.add_argument("--url", default="http://127.0.0.1:8000/query/stream")
+    parser.add_argument("--concurrency", type=int, default=16, help="Simultaneous streaming clients")
+    parser.add_argument("--requests", type=int, default=4, help="Questions asked by each client")
+    args = parser.parse_args()
+
+    results, errors, elapsed = asyncio.run(run(args.url, args.concurrency, args.requests, DEFAULT_QUESTIONS))
+    if not results:
+        raise SystemExit(f"No successful request ({len(errors)} errors: {errors[:1]})")
+
+    ttft = np.array([r[0] for r in results if r[0] is not None]) * 1000
+    total = np.array([r[1] for r in results]) * 1000
+    print(f"Requests: {len(results)} ok, {len(errors)} failed clients, {elapsed:.1f}s "
+          f"({len(results) / elapsed:.2f} req/s at concurrency {args.concurrency})")
+    print(f"Time to first token: p50={np.percentile(ttft, 50):.0f}ms p95={np.percentile(ttft, 95):.0f}ms")
+    print(f"Full answer:         p50={np.percentile(total, 50):.0f}ms p95={np.percentile(total, 95):.0f}ms")
@@ -0,0 +1,254 @@
+import os
+import re
+import sys
+import json
+import hashlib
+import argparse
+import numpy as np
+from collections import Counter
+
+# Add src/ to find data_processing and model_management when run as a script
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+WORD_PATTERN = re.compile(r"\w+")
+
+# Token budget of a passage, in word/punctuation tokens (~1.3 MiniLM word pieces each, under its 256 limit)
+MAX_TOKENS = 160
+OVERLAP_TOKENS = 32
+
+
+def count_tokens(text: str) -> int:
+    return len(TOKEN_PATTERN.findall(text))
+
+# REPEATED HEADERS / FOOTERS
+
+# Numbers that change from page to page in a header/footer: page numbers ("page 3", "3/12", "– 3"), dates
+PAGE_NUMBER_PATTERN = re.compile(r"\b(?:page|p\.)\s*\d+(?:\s*(?:/|sur)\s*\d+)?|^\W*\d+(?:\s*(?:/|sur)\s*\d+)?\W*$"
+                                 r"|[–—|]\s*\d+\s*$|^\s*\d+\s*[–—|]")
+DATE_PATTERN = re.compile(r"\b\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}\b|\b(?:\d{1,2}(?:er)?\s+)?(?:janv|févr|mars|avr|mai|juin|"
+                          r"juil|août|sept|oct|nov|déc)[a-zéû]*\.?\s+\d{4}\b")
+NUMBER_PATTERN = re.compile(r"\d+")
+
+
+def _line_key(line: str) -> str:
+    """
+    Line compared across pages: lowercased, whitespace collapsed, page numbers and dates masked.
+    Other numbers are kept ("Étape 1" and "Étape 2" differ) unless the line is mostly digits.
+    """
+    line = re.sub(r"\s+", " ", line).strip().lower()
+    digits = sum(c.isdigit() for c in line)
+    if digits and digits * 2 >= len(line.replace(" ", "")):
+        return NUMBER_PATTERN.sub("#", line)
+    mask = lambda match: NUMBER_PATTERN.sub("#", match.group())
+    return DATE_PATTERN.sub(mask, PAGE_NUMBER_PATTERN.sub(mask, line))
+
+
+def strip_repeated_lines(pages, min_share: float = 0.5, min_pages: int = 3, stats: Counter = None):
+    """
+    Removes header/footer lines repeated on many pages of a document
+    (e.g. "INRS – Département formation – 65, bd Richard Lenoir…" or page numbers).
+    pages : [(page_num, raw page text with line breaks)] of ONE document
+    A line is boilerplate when it appears on at least max(min_pages, min_share * n_pages) pages.
+    """
+    pages = list(pages)
+    if len(pages) < min_pages:
+        return pages
+
+    counts = Counter()
+    for _, text in pages:
+        counts.update({_line_key(line) for line in text.splitlines() if line.strip()})
+    threshold = max(min_pages, min_share * len(pages))
+    boilerplate = {key for key, count in counts.items() if count >= threshold}
+    if not boilerplate:
+        return pages
+
+    stripped = []
+    for page_num, text in pages:
+        kept = [line for line in text.splitlines() if _line_key(line) not in boilerplate]
+        if stats is not None:
+            stats["boilerplate_lines"] += len(text.splitlines()) - len(kept)
+        stripped.append((page_num, "\n".join(kept)))
+    return stripped
+
+# TOKEN-BUDGET WINDOWS
+
+def _join(sentences) -> str:
+    """Joins sentence units (split on '. ') back into text, restoring the periods."""
+    text = ""
+    for sentence in sentences:
+        if text:
+            text += " " if text[-1] in ".!?:;" else ". "
+        text += sentence
+    return text
+
+
+def _split_long(unit: dict, max_tokens: int):
+    """Splits a sentence longer than the budget into consecutive pieces of at most max_tokens tokens."""
+    piece, piece_tokens = [], 0
+    for word in unit["text"].split():
+        tokens = count_tokens(word)
+        if piece and piece_tokens + tokens > max_tokens:
+            yield dict(unit, text=" ".join(piece)), piece_tokens
+            piece, piece_tokens = [], 0
+        piece.append(word)
+        piece_tokens += tokens
+    if piece:
+        yield dict(unit, text=" ".join(piece)), piece_tokens
+
+
+def chunk_units(units, max_tokens: int = MAX_TOKENS, overlap_tokens: int = OVERLAP_TOKENS, stats: Counter = None):
+    """
+    Packs consecutive sentence units (dicts from segment_pages) into passages of at most max_tokens
+    tokens. A passage never crosses a document/section/subsection boundary; consecutive passages
+    of the same section share their last sentences up to overlap_tokens tokens.
+    The page of a passage is the page of its first sentence.
+    """
+    window = []  # [(unit, n_tokens)]
+    window_tokens = 0
+    new_in_window = False
+
+    def flush():
+        text = _join(unit["text"] for unit, _ in window)
+        if stats is not None:
+            stats["chunks"] += 1
+        return dict(window[0][0], text=text)
+
+    for unit in units:
+        if stats is not None:
+            stats["sentences"] += 1
+        tokens = count_tokens(unit["text"])
+        pieces = _split_long(unit, max_tokens) if tokens > max_tokens else [(unit, tokens)]
+
+        for piece, piece_tokens in pieces:
+            boundary = window and any(piece.get(key) != window[0][0].get(key)
+                                      for key in ("document", "section", "subsection"))
+            if window and (boundary or window_tokens + piece_tokens > max_tokens):
+                if new_in_window:
+                    yield flush()
+                # Overlap: carry the last whole sentences of the same section into the next window
+                carried, carried_tokens = [], 0
+                if not boundary:
+                    for previous, previous_tokens in reversed(window):
+                        if carried_tokens + previous_tokens > overlap_tokens \
+                                or carried_tokens + previous_tokens + piece_tokens > max_tokens:
+                            break
+                        carried.insert(0, (previous, previous_tokens))
+                        carried_tokens += previous_tokens
+                window, window_tokens, new_in_window = carried, carried_tokens, False
+
+            window.append((piece, piece_tokens))
+            window_tokens += piece_tokens
+            new_in_window = True
+
+    if window and new_in_window:
+        yield flush()
+
+# NEAR-DUPLICATE DETECTION (SimHash)
+
+def simhash(text: str, shingle_size: int = 3) -> int:
+    """64-bit SimHash of the word shingles of a text (close texts get fingerprints at small Hamming distance)."""
+    words = WORD_PATTERN.findall(text.lower())
+    if not words:
+        return 0
+    shingles = [" ".join(words[i:i + shingle_size]) for i in range(max(1, len(words) - shingle_size + 1))]
+    hashes = np.frombuffer(b"".join(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest() for s in shingles),
+                           dtype=np.uint8).reshape(-1, 8)
+    bits = np.unpackbits(hashes, axis=1, bitorder="little").astype(np.int32)
+    votes = (2 * bits - 1).sum(axis=0)
+    return int.from_bytes(np.packbits(votes > 0, bitorder="little").tobytes(), "little")
+
+
+class NearDuplicateFilter:
+    """
+    Remembers the SimHash of every kept passage and flags new passages within max_distance bits
+    of one of them. Fingerprints are split into max_distance + 1 bands: two fingerprints that
+    close share at least one band exactly, so only passages sharing a band are compared.
+    """
+
+    def __init__(self, max_distance: int = 3):
+        self.max_distance = max_distance
+        self.n_bands = max_distance + 1
+        self.band_bits = 64 // self.n_bands
+        self._bands = [{} for _ in range(self.n_bands)]
+        self._exact = set()
+
+    def _band_keys(self, fingerprint: int):
+        mask = (1 << self.band_bits) - 1
+        return [(fingerprint >> (band * self.band_bits)) & mask for band in range(self.n_bands)]
+
+    def is_duplicate(self, text: str) -> bool:
+        """True if text (near-)duplicates a passage seen before; otherwise remember it and return False."""
+        exact_key = hashlib.sha1(" ".join(WORD_PATTERN.findall(text.lower())).encode("utf-8")).digest()
+        if exact_key in self._exact:
+            return True
+
+        fingerprint = simhash(text)
+        keys = self._band_keys(fingerprint)
+        for band, key in enumerate(keys):
+            for other in self._bands[band].get(key, ()):
+                if bin(fingerprint ^ other).count("1") <= self.max_distance:
+                    return True
+
+        self._exact.add(exact_key)
+        for band, key in enumerate(keys):
+            self._bands[band].setdefault(key, []).append(fingerprint)
+        return False
+
+# BEFORE / AFTER REPORT
+
+def corpus_report(passages, dim: int = 384) -> dict:
+    """Passage count, token stats and index sizes (flat FAISS, BM25 postings, text) of a corpus, without encoding it."""
+    from model_management.bm25_index import BM25Index, tokenize
+
+    passages = list(passages)
+    tokens = np.asarray([count_tokens(p["text"]) for p in passages]) if passages else np.zeros(1)
+    bm25 = BM25Index.build(tokenize(p["text"]) for p in passages)
+    faiss_bytes = len(passages) * dim * 4
+    bm25_bytes = bm25.weights.data.nbytes + bm25.weights.indices.nbytes + bm25.weights.indptr.nbytes
+    return {
+        "passages": len(passages),
+        "tokens_mean": float(tokens.mean()),
+        "tokens_max": int(tokens.max()),
+        "faiss_flat_mb": faiss_bytes / 2**20,
+        "bm25_mb": bm25_bytes / 2**20,
+        "text_mb": sum(len(p["text"].encode("utf-8")) for p in passages) / 2**20,
+    }
+
+
+if __name__ == "__main__":
+    from data_processing.hybrid_data_process import read_pdf_pages, passages_from_pages
+
+    parser = argparse.ArgumentParser(description="Compare sentence passages with token-budget chunks (+ dedup) on the PDFs")
+    parser.add_argument("--pdf-folder", default=None, help="Default: data/raw")
+    parser.add_argument("--max-tokens", type=int, default=MAX_TOKENS)
+    parser.add_argument("--overlap-tokens", type=int, default=OVERLAP_TOKENS)
+    parser.add_argument("--dim", type=int, default=384, help="Embedding dimension used for the FAISS size")
+    parser.add_argument("--output", default=None, help="Also write the report to this JSON file")
+    args = parser.parse_args()
+
+    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+    pdf_folder = args.pdf_folder or os.path.join(project_root, 'data', 'raw')
+
+    before, after = [], []
+    stats = Counter()
+    dedup = NearDuplicateFilter()
+    for filename in sorted(f for f in os.listdir(pdf_folder) if f.endswith(".pdf")):
+        print(f"Extracting from: {filename}")
+        pages = read_pdf_pages(os.path.join(pdf_folder, filename))
+        before.extend(passages_from_pages(pages, filename, chunking=False))
+        after.extend(passages_from_pages(pages, filename, max_tokens=args.max_tokens,
+                                         overlap_tokens=args.overlap_tokens, dedup=dedup, stats=stats))
+
+    report = {"sentences": corpus_report(before, args.dim), "chunks": corpus_report(after, args.dim),
+              "chunking": {"max_tokens": args.max_tokens, "overlap_tokens": args.overlap_tokens, **stats}}
+    for name in ("passages", "tokens_mean", "tokens_max", "faiss_flat_mb", "bm25_mb", "text_mb"):
+        old, new = report["sentences"][name], report["chunks"][name]
+        change = f"{(new / old - 1) * 100:+.0f}%" if old else ""
+        print(f"{name:14s} {old:>12.2f} -> {new:>12.2f}  {change}")
+    print(f"Boilerplate lines removed: {stats['boilerplate_lines']}, near-duplicate chunks dropped: {stats['duplicates']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"✅ Report saved to: {args.output}")
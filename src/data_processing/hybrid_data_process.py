@@ -1,103 +1,177 @@
-import os
-import fitz  # PyMuPDF
-import json
-import re
-import faiss
-import numpy as np
-from sklearn.preprocessing import normalize
-from sentence_transformers import SentenceTransformer
-
-# TEXT EXTRACTION UTILITIES
-
-def extract_text_from_pdf(pdf_path):
-    """Extracts and segments text from a PDF with sections/subsections and page numbers."""
-    text_data = []
-    current_section = ""
-    current_subsection = ""
-
-    section_pattern = re.compile(r'^(\d+(\.\d+)*)\s+(.+)$')
-
-    with fitz.open(pdf_path) as doc:
-        for page_num, page in enumerate(doc, start=1):
-            text = page.get_text("text")
-            cleaned_text = clean_text(text)
-            lines = cleaned_text.split(". ")
-
-            for line in lines:
-                match = section_pattern.match(line)
-                if match:
-                    if len(match.group(1).split('.')) == 1:
-                        current_section = match.group(3)
-                        current_subsection = ""
-                    else:
-                        current_subsection = match.group(3)
-
-                if line.strip():
-                    text_data.append({
-                        "page": page_num,
-                        "section": current_section if current_section else "Uncategorized",
-                        "subsection": current_subsection if current_subsection else "Uncategorized",
-                        "text": line.strip()
-                    })
-
-    return text_data
-
-def clean_text(text):
-    """Removes excessive whitespace and line breaks."""
-    return re.sub(r'\s+', ' ', text).strip()
-
-# MAIN HYBRID INDEXING LOGIC
-
-def process_pdfs_and_build_hybrid_index(pdf_folder, index_output_path, metadata_output_path, model_name="all-MiniLM-L6-v2"):
-    all_passages = []
-    model = SentenceTransformer(model_name)
-
-    print("Scanning PDF files in:", pdf_folder)
-    for filename in os.listdir(pdf_folder):
-        if filename.endswith(".pdf"):
-            file_path = os.path.join(pdf_folder, filename)
-            print(f"Extracting from: {filename}")
-            extracted = extract_text_from_pdf(file_path)
-
-            for passage in extracted:
-                passage["document"] = filename
-                if passage["text"]:
-                    all_passages.append(passage)
-
-    print(f"📚 Total extracted passages: {len(all_passages)}")
-
-    # Generate embeddings and normalize for cosine similarity
-    texts = [p["text"] for p in all_passages]
-    print("Generating embeddings...")
-    embeddings = model.encode(texts, convert_to_numpy=True)
-    embeddings = normalize(embeddings, axis=1)
-
-    # Build FAISS index
-    dimension = embeddings.shape[1]
-    index = faiss.IndexFlatIP(dimension)
-    index.add(embeddings)
-
-    # Save FAISS index
-    os.makedirs(os.path.dirname(index_output_path), exist_ok=True)
-    faiss.write_index(index, index_output_path)
-    print(f"FAISS index saved to: {index_output_path}")
-
-    # Save enriched metadata
-    with open(metadata_output_path, 'w', encoding='utf-8') as f:
-        json.dump(all_passages, f, ensure_ascii=False, indent=2)
-    print(f"✅ Metadata saved to: {metadata_output_path}")
-
-# EXECUTION ENTRY POINT
-
-if __name__ == "__main__":
-    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
-    pdf_input_dir = os.path.join(project_root, 'data', 'raw')
-    index_output = os.path.join(project_root, 'models', 'index', 'index_files', 'faiss_index')
-    metadata_output = os.path.join(project_root, 'models', 'index', 'index_files', 'metadata_passages.json')
-
-    # Vérifie si le dossier des PDF existe
-    if not os.path.exists(pdf_input_dir):
-        raise FileNotFoundError(f"Input PDF folder not found: {pdf_input_dir}")
-
-    process_pdfs_and_build_hybrid_index(pdf_input_dir, index_output, metadata_output)
-
+import os
+import sys
+import argparse
+import fitz  # PyMuPDF
+import re
+
+# Add src/ to find model_management
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+from collections import Counter
+from data_processing.chunking import MAX_TOKENS, OVERLAP_TOKENS, NearDuplicateFilter, chunk_units, strip_repeated_lines
+from model_management.ann_index import INDEX_TYPES
+from model_management.corpus_registry import CORPUS_NAME, DEFAULT_CORPUS
+from model_management.embedding_registry import get_embedding_model
+from model_management.onnx_encoder import BACKENDS
+from model_management.index_builder import build_streaming_index, model_encoder
+from model_management.index_versions import unpublish_versions, write_base_manifest
+
+# TEXT EXTRACTION UTILITIES
+
+SECTION_PATTERN = re.compile(r'^(\d+(\.\d+)*)\s+(.+)$')
+
+def extract_text_from_pdf(pdf_path, **chunk_options):
+    """Extracts and segments text from a PDF with sections/subsections and page numbers."""
+    return list(iter_text_from_pdf(pdf_path, **chunk_options))
+
+def iter_text_from_pdf(pdf_path, **chunk_options):
+    """Streaming version of extract_text_from_pdf (see passages_from_pages for the options)."""
+    return passages_from_pages(read_pdf_pages(pdf_path), **chunk_options)
+
+def read_pdf_pages(pdf_path):
+    """Raw text of every page, line breaks kept: [(page_num, text)] (1-based page numbers)."""
+    with fitz.open(pdf_path) as doc:
+        return [(page_num, page.get_text("text")) for page_num, page in enumerate(doc, start=1)]
+
+def passages_from_pages(pages, document=None, chunking=True, max_tokens=MAX_TOKENS, overlap_tokens=OVERLAP_TOKENS,
+                        dedup=None, stats=None):
+    """
+    Passages of one document from its raw pages.
+    chunking=True: repeated headers/footers are stripped, sentences are packed into token-budget
+    windows with overlap (see chunking.chunk_units), and passages flagged by dedup (a shared
+    NearDuplicateFilter) are dropped. chunking=False: one passage per sentence, as before.
+    """
+    stats = stats if stats is not None else Counter()
+    if chunking:
+        pages = strip_repeated_lines(pages, stats=stats)
+    units = segment_pages((page_num, clean_text(text)) for page_num, text in pages)
+    if document is not None:
+        units = (dict(unit, document=document) for unit in units)
+    passages = chunk_units(units, max_tokens, overlap_tokens, stats=stats) if chunking else units
+
+    for passage in passages:
+        if not passage["text"]:
+            continue
+        if dedup is not None and dedup.is_duplicate(passage["text"]):
+            stats["duplicates"] += 1
+            continue
+        yield passage
+
+def segment_pages(pages):
+    """Splits cleaned (page_num, text) pages into passages, tracking sections/subsections across pages."""
+    current_section = ""
+    current_subsection = ""
+
+    for page_num, cleaned_text in pages:
+        lines = cleaned_text.split(". ")
+
+        for line in lines:
+            match = SECTION_PATTERN.match(line)
+            if match:
+                if len(match.group(1).split('.')) == 1:
+                    current_section = match.group(3)
+                    current_subsection = ""
+                else:
+                    current_subsection = match.group(3)
+
+            if line.strip():
+                yield {
+                    "page": page_num,
+                    "section": current_section if current_section else "Uncategorized",
+                    "subsection": current_subsection if current_subsection else "Uncategorized",
+                    "text": line.strip()
+                }
+
+def clean_text(text):
+    """Removes excessive whitespace and line breaks."""
+    return re.sub(r'\s+', ' ', text).strip()
+
+# MAIN HYBRID INDEXING LOGIC
+
+def iter_pdf_passages(pdf_folder, chunking=True, max_tokens=MAX_TOKENS, overlap_tokens=OVERLAP_TOKENS,
+                      dedup=True, stats=None):
+    """Yields the passages of every PDF in the folder, tagged with their document name."""
+    print("Scanning PDF files in:", pdf_folder)
+    duplicates = NearDuplicateFilter() if chunking and dedup else None
+    for filename in sorted(os.listdir(pdf_folder)):
+        if filename.endswith(".pdf"):
+            file_path = os.path.join(pdf_folder, filename)
+            print(f"Extracting from: {filename}")
+
+            yield from iter_text_from_pdf(file_path, document=filename, chunking=chunking, max_tokens=max_tokens,
+                                          overlap_tokens=overlap_tokens, dedup=duplicates, stats=stats)
+
+def process_pdfs_and_build_hybrid_index(pdf_folder, index_output_path, metadata_output_path,
+                                        model_name="all-MiniLM-L6-v2", batch_size=256, chunking=True,
+                                        max_tokens=MAX_TOKENS, overlap_tokens=OVERLAP_TOKENS, dedup=True,
+                                        encoder_backend="torch", encoder_threads=None, **index_options):
+    model = get_embedding_model(model_name, backend=encoder_backend, threads=encoder_threads)
+
+    # Streaming pipeline: extract -> chunk -> batch-encode -> normalize -> FAISS/BM25/metadata
+    print("Generating embeddings...")
+    stats = Counter()
+    passages = iter_pdf_passages(pdf_folder, chunking=chunking, max_tokens=max_tokens,
+                                 overlap_tokens=overlap_tokens, dedup=dedup, stats=stats)
+    total = build_streaming_index(passages, model_encoder(model),
+                                  index_output_path, metadata_output_path, batch_size=batch_size, **index_options)
+    print(f"📚 Total extracted passages: {total}")
+    unpublish_versions(os.path.dirname(index_output_path))
+    index_options = dict(index_options)
+    write_base_manifest(os.path.dirname(index_output_path), index_type=index_options.pop("index_type", "flat"),
+                        index_options=index_options, model_name=model_name, encoder_backend=encoder_backend,
+                        chunk_options={"chunking": chunking, "max_tokens": max_tokens,
+                                       "overlap_tokens": overlap_tokens, "dedup": dedup})
+    if chunking:
+        print(f"   {stats['sentences']} sentences packed into {stats['chunks']} chunks, "
+              f"{stats['boilerplate_lines']} header/footer lines removed, {stats['duplicates']} near-duplicates dropped")
+
+# EXECUTION ENTRY POINT
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract PDF passages and build the hybrid FAISS + BM25 index")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Parallel extraction, skip unchanged PDFs and reuse cached embeddings")
+    parser.add_argument("--workers", type=int, default=None, help="Extraction processes (default: all cores)")
+    parser.add_argument("--batch-size", type=int, default=256, help="Passages encoded and indexed per batch")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat", help="Dense FAISS index type")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default: ~4*sqrt(passages))")
+    parser.add_argument("--hnsw-m", type=int, default=32, help="HNSW neighbors per node")
+    parser.add_argument("--pq-m", type=int, default=None, help="PQ sub-quantizers (must divide the dimension)")
+    parser.add_argument("--chunking", choices=["window", "sentence"], default="window",
+                        help="window: token-budget chunks with overlap and dedup; sentence: one passage per sentence")
+    parser.add_argument("--max-tokens", type=int, default=MAX_TOKENS, help="Token budget of a chunk")
+    parser.add_argument("--overlap-tokens", type=int, default=OVERLAP_TOKENS, help="Tokens shared by consecutive chunks")
+    parser.add_argument("--no-dedup", action="store_true", help="Keep near-duplicate chunks")
+    parser.add_argument("--encoder-backend", choices=BACKENDS, default="torch",
+                        help="Passage encoder: stock model, ONNX Runtime or int8 ONNX (use the same at query time)")
+    parser.add_argument("--encoder-threads", type=int, default=None, help="Encoder intra-op threads")
+    parser.add_argument("--corpus", default=None,
+                        help="Build a named corpus from data/raw/<corpus> into models/index/corpora/<corpus>")
+    args = parser.parse_args()
+    index_options = {"index_type": args.index_type, "nlist": args.nlist, "hnsw_m": args.hnsw_m, "pq_m": args.pq_m}
+    chunk_options = {"chunking": args.chunking == "window", "max_tokens": args.max_tokens,
+                     "overlap_tokens": args.overlap_tokens, "dedup": not args.no_dedup}
+    encoder_options = {"encoder_backend": args.encoder_backend, "encoder_threads": args.encoder_threads}
+
+    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+    pdf_input_dir = os.path.join(project_root, 'data', 'raw')
+    index_dir = os.path.join(project_root, 'models', 'index', 'index_files')
+    if args.corpus and args.corpus != DEFAULT_CORPUS:
+        if not CORPUS_NAME.fullmatch(args.corpus):
+            parser.error("--corpus: letters, digits, '_' and '-' only")
+        pdf_input_dir = os.path.join(pdf_input_dir, args.corpus)
+        index_dir = os.path.join(project_root, 'models', 'index', 'corpora', args.corpus)
+    index_output = os.path.join(index_dir, 'faiss_index')
+    metadata_output = os.path.join(index_dir, 'passage_store')
+
+    # Vérifie si le dossier des PDF existe
+    if not os.path.exists(pdf_input_dir):
+        raise FileNotFoundError(f"Input PDF folder not found: {pdf_input_dir}")
+
+    if args.incremental:
+        from data_processing.incremental_ingest import run_incremental_ingestion
+        run_incremental_ingestion(pdf_input_dir, index_output, metadata_output, workers=args.workers,
+                                  batch_size=args.batch_size, **chunk_options, **encoder_options, **index_options)
+    else:
+        process_pdfs_and_build_hybrid_index(pdf_input_dir, index_output, metadata_output,
+                                            batch_size=args.batch_size, **chunk_options, **encoder_options,
+                                            **index_options)
@@ -0,0 +1,213 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import fitz  # PyMuPDF
+import numpy as np
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+# Add src/ to find data_processing and model_management
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+from data_processing.chunking import MAX_TOKENS, OVERLAP_TOKENS, NearDuplicateFilter
+from data_processing.hybrid_data_process import passages_from_pages
+from model_management.embedding_registry import get_embedding_model
+from model_management.index_builder import build_streaming_index, iter_passages_file
+from model_management.index_versions import unpublish_versions, write_base_manifest
+
+PAGES_PER_TASK = 16
+
+# HASHING UTILITIES
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Content hash of a file, read in 1 MB chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def text_sha1(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+# PARALLEL EXTRACTION (runs in worker processes)
+
+def _page_count(pdf_path):
+    with fitz.open(pdf_path) as doc:
+        return doc.page_count
+
+def _extract_page_range(pdf_path, start, end):
+    """Raw text of pages [start, end) of a PDF, as (page_num, text) pairs (1-based page numbers)."""
+    with fitz.open(pdf_path) as doc:
+        return [(page_num + 1, doc[page_num].get_text("text")) for page_num in range(start, end)]
+
+def extract_pages_parallel(pdf_paths, workers=None, pages_per_task=PAGES_PER_TASK):
+    """
+    Extracts the pages of several PDFs with a process pool.
+    Large PDFs are split into page ranges so a single manual is also spread over all cores.
+    Returns {pdf_path: [(page_num, text), ...]} in page order.
+    """
+    pages = {path: [] for path in pdf_paths}
+    if not pdf_paths:
+        return pages
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        counts = dict(zip(pdf_paths, pool.map(_page_count, pdf_paths)))
+        futures = []
+        for path, count in counts.items():
+            for start in range(0, count, pages_per_task):
+                end = min(start + pages_per_task, count)
+                futures.append((path, pool.submit(_extract_page_range, path, start, end)))
+
+        for path, future in futures:
+            pages[path].extend(future.result())
+
+    for path in pages:
+        pages[path].sort(key=lambda page: page[0])
+    return pages
+
+# MANIFEST AND EMBEDDING CACHE
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {"documents": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(manifest, path):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+class EmbeddingCache:
+    """
+    Persistent normalized passage embeddings keyed by the SHA-1 of the passage text.
+    Vectors from another model or encoder backend (ONNX, int8) are not reused.
+    """
+
+    def __init__(self, path, model_name, backend="torch", threads=None):
+        self.path = path
+        self.model_name = model_name
+        self.backend = backend
+        self.threads = threads
+        # Stock-model caches keep the bare model name, as written before encoder backends existed
+        self.encoder_key = model_name if backend == "torch" else f"{model_name} [{backend}]"
+        self.vectors = {}
+
+        if os.path.exists(path):
+            with np.load(path, allow_pickle=False) as data:
+                if str(data["model_name"]) == self.encoder_key:
+                    self.vectors = dict(zip(data["keys"].tolist(), data["vectors"]))
+                else:
+                    print(f"⚠️ Embedding cache built with {data['model_name']}, ignoring it.")
+
+    def encode(self, texts, batch_size=64):
+        """Embeddings of texts, only running model.encode on texts missing from the cache."""
+        keys = [text_sha1(t) for t in texts]
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in self.vectors and key not in missing:
+                missing[key] = text
+
+        if missing:
+            model = get_embedding_model(self.model_name, backend=self.backend, threads=self.threads)
+            new_vectors = model.encode(list(missing.values()), batch_size=batch_size,
+                                       convert_to_numpy=True, normalize_embeddings=True)
+            self.vectors.update(zip(missing.keys(), new_vectors.astype(np.float32)))
+
+        return np.vstack([self.vectors[k] for k in keys]).astype(np.float32) if keys else np.empty((0, 0), np.float32)
+
+    def save(self, keep_texts=None):
+        """Write the cache, optionally pruned to the passages still in the corpus."""
+        if keep_texts is not None:
+            keep = {text_sha1(t) for t in keep_texts}
+            self.vectors = {k: v for k, v in self.vectors.items() if k in keep}
+        keys = list(self.vectors)
+        vectors = np.vstack([self.vectors[k] for k in keys]) if keys else np.empty((0, 0), np.float32)
+        tmp_path = self.path + ".tmp.npz"
+        np.savez(tmp_path, keys=np.asarray(keys, dtype=str), vectors=vectors, model_name=np.asarray(self.encoder_key))
+        os.replace(tmp_path, self.path)
+
+# MAIN INCREMENTAL PIPELINE
+
+def run_incremental_ingestion(pdf_folder, index_output_path, metadata_output_path,
+                              model_name="all-MiniLM-L6-v2", workers=None, batch_size=256, chunking=True,
+                              max_tokens=MAX_TOKENS, overlap_tokens=OVERLAP_TOKENS, dedup=True,
+                              encoder_backend="torch", encoder_threads=None, **index_options):
+    """
+    Re-indexes the PDF folder, only extracting PDFs whose content hash changed and only
+    embedding passages whose text is not already in the embedding cache.
+    Every PDF is re-chunked when the chunking options differ from the previous run.
+    Only extraction and encoding are incremental: the FAISS, BM25 and section indexes are rebuilt
+    from all passages (from cached embeddings). To change a few documents of a live index in place,
+    use data_processing/live_update.py.
+    """
+    start_time = time.perf_counter()
+    index_dir = os.path.dirname(index_output_path)
+    os.makedirs(index_dir, exist_ok=True)
+    manifest_path = os.path.join(index_dir, "ingest_manifest.json")
+    manifest = load_manifest(manifest_path)
+    chunk_options = {"chunking": chunking, "max_tokens": max_tokens, "overlap_tokens": overlap_tokens, "dedup": dedup}
+    previous_docs = manifest.get("documents", {}) if manifest.get("chunk_options") == chunk_options else {}
+
+    # Previous passages, grouped by document, to reuse for unchanged PDFs
+    previous_passages = {}
+    if os.path.exists(metadata_output_path):
+        for passage in iter_passages_file(metadata_output_path):
+            previous_passages.setdefault(passage.get("document"), []).append(passage)
+
+    # Compare file hashes with the manifest
+    filenames = sorted(f for f in os.listdir(pdf_folder) if f.endswith(".pdf"))
+    hashes = {name: file_sha256(os.path.join(pdf_folder, name)) for name in filenames}
+    changed = [name for name in filenames
+               if previous_docs.get(name, {}).get("sha256") != hashes[name] or name not in previous_passages]
+    removed = sorted(set(previous_docs) - set(filenames))
+    print(f"📄 {len(filenames)} PDFs: {len(changed)} new/changed, "
+          f"{len(filenames) - len(changed)} unchanged, {len(removed)} removed.")
+
+    # Extract changed PDFs in parallel
+    extracted = extract_pages_parallel([os.path.join(pdf_folder, name) for name in changed], workers=workers)
+
+    documents = {}
+    all_passages = []
+    stats = Counter()
+    duplicates = NearDuplicateFilter() if chunking and dedup else None
+    for name in filenames:
+        if name in changed:
+            pages = extracted[os.path.join(pdf_folder, name)]
+            print(f"Extracted {name}: {len(pages)} pages")
+
+            passages = list(passages_from_pages(pages, name, chunking=chunking, max_tokens=max_tokens,
+                                                overlap_tokens=overlap_tokens, dedup=duplicates, stats=stats))
+        else:
+            passages = previous_passages[name]
+            # Kept passages of unchanged PDFs still count for the dedup of the changed ones
+            if duplicates is not None:
+                for passage in passages:
+                    duplicates.is_duplicate(passage["text"])
+
+        documents[name] = {"sha256": hashes[name], "passages": len(passages)}
+        all_passages.extend(p for p in passages if p["text"])
+
+    print(f"📚 Total passages: {len(all_passages)}")
+    if chunking and changed:
+        print(f"   {stats['sentences']} sentences packed into {stats['chunks']} chunks, "
+              f"{stats['boilerplate_lines']} header/footer lines removed, {stats['duplicates']} near-duplicates dropped")
+
+    # Streaming index build, only encoding passages not seen before
+    texts = [p["text"] for p in all_passages]
+    cache = EmbeddingCache(os.path.join(index_dir, "embedding_cache.npz"), model_name,
+                           backend=encoder_backend, threads=encoder_threads)
+    n_missing = len({text_sha1(t) for t in texts} - set(cache.vectors))
+    print(f"Embeddings: {n_missing} new passages to encode, {len(texts) - n_missing} reused from cache.")
+    build_streaming_index(all_passages, cache.encode, index_output_path, metadata_output_path,
+                          batch_size=batch_size, **index_options)
+    cache.save(keep_texts=texts)
+    unpublish_versions(index_dir)
+    index_options = dict(index_options)
+    write_base_manifest(index_dir, index_type=index_options.pop("index_type", "flat"), index_options=index_options,
+                        model_name=model_name, encoder_backend=encoder_backend, chunk_options=chunk_options)
+    save_manifest({"model_name": model_name, "encoder_backend": encoder_backend, "chunk_options": chunk_options, "documents": documents}, manifest_path)
+    print(f"✅ Incremental indexing done in {time.perf_counter() - start_time:.1f}s")
@@ -0,0 +1,119 @@
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from collections import Counter
+
+# Add src/ to find data_processing and model_management
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+from data_processing.chunking import MAX_TOKENS, OVERLAP_TOKENS, NearDuplicateFilter
+from data_processing.hybrid_data_process import iter_text_from_pdf
+from model_management.corpus_registry import CORPUS_NAME, DEFAULT_CORPUS
+from model_management.embedding_registry import get_embedding_model
+from model_management.index_builder import encode_batches, model_encoder
+from model_management.index_versions import (current_version, list_versions, load_manifest, prune_versions,
+                                             publish_version, resolve_index_dir, update_lock, write_version)
+
+DEFAULT_CHUNK_OPTIONS = {"chunking": True, "max_tokens": MAX_TOKENS, "overlap_tokens": OVERLAP_TOKENS, "dedup": True}
+
+
+def live_settings(index_root: str) -> dict:
+    """Model, encoder backend and chunking of the live index, so that new passages match the old ones."""
+    manifest = load_manifest(resolve_index_dir(index_root))
+    if not manifest:
+        # Base index: settings of the last incremental ingestion, if any
+        ingest_manifest = os.path.join(index_root, "ingest_manifest.json")
+        if os.path.exists(ingest_manifest):
+            with open(ingest_manifest, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+    return {
+        "model_name": manifest.get("model_name", "all-MiniLM-L6-v2"),
+        "encoder_backend": manifest.get("encoder_backend", "torch"),
+        "chunk_options": manifest.get("chunk_options") or DEFAULT_CHUNK_OPTIONS,
+    }
+
+
+def update_live_index(index_root: str, add_pdfs=(), remove_documents=(), model=None, batch_size: int = 256,
+                      compact_ratio: float = 0.25, publish: bool = True, keep_versions: int = 3) -> str:
+    """
+    Builds the next index version with the given PDFs added (or replaced, matched by file name)
+    and documents removed, then publishes it: running APIs hot-swap to it (see chatgpt_api.reload_retriever).
+    Only the passages of the added PDFs are extracted and encoded.
+    model : encoder already loaded by the caller (the API passes its own, so it is not loaded twice)
+    Returns the new version name.
+    """
+    start = time.perf_counter()
+    settings = live_settings(index_root)
+    chunk_options = dict(settings["chunk_options"])
+    dedup = chunk_options.pop("dedup", True)
+
+    passages = []
+    stats = Counter()
+    duplicates = NearDuplicateFilter() if chunk_options.get("chunking", True) and dedup else None
+    for pdf_path in add_pdfs:
+        print(f"Extracting from: {os.path.basename(pdf_path)}")
+        passages.extend(iter_text_from_pdf(pdf_path, document=os.path.basename(pdf_path), dedup=duplicates,
+                                           stats=stats, **chunk_options))
+
+    embeddings = np.empty((0, 0), dtype=np.float32)
+    if passages:
+        model = model or get_embedding_model(settings["model_name"], backend=settings["encoder_backend"])
+        batches = [emb for _, emb in encode_batches(passages, model_encoder(model), batch_size)]
+        embeddings = np.vstack(batches)
+
+    with update_lock(index_root):
+        version = write_version(index_root, passages, embeddings, delete_documents=remove_documents,
+                                compact_ratio=compact_ratio,
+                                manifest_updates={"model_name": settings["model_name"],
+                                                  "encoder_backend": settings["encoder_backend"],
+                                                  "chunk_options": settings["chunk_options"]})
+        if publish:
+            publish_version(index_root, version)
+            prune_versions(index_root, keep=keep_versions)
+    print(f"✅ Live index update done in {time.perf_counter() - start:.1f}s"
+          f"{' (published)' if publish else ''}")
+    return version
+
+
+if __name__ == "__main__":
+    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+    default_root = os.path.join(project_root, 'models', 'index', 'index_files')
+
+    parser = argparse.ArgumentParser(description="Add/remove documents in the live index as a new version (hot-swapped by the API)")
+    parser.add_argument("--add", nargs="*", default=[], help="PDF files to add (a document with the same file name is replaced)")
+    parser.add_argument("--remove", nargs="*", default=[], help="Document names (PDF file names) to remove")
+    parser.add_argument("--index-root", default=default_root)
+    parser.add_argument("--corpus", default=None, help="Update a named corpus (models/index/corpora/<corpus>)")
+    parser.add_argument("--compact-ratio", type=float, default=0.25,
+                        help="Compact (drop deleted passages, rebuild FAISS) above this share of tombstones")
+    parser.add_argument("--keep-versions", type=int, default=3, help="Versions kept on disk for rollback")
+    parser.add_argument("--no-publish", action="store_true", help="Write the version without making it live")
+    parser.add_argument("--publish", default=None, metavar="VERSION", help="Only publish an existing version (rollback)")
+    parser.add_argument("--list", action="store_true", help="List the versions on disk")
+    args = parser.parse_args()
+    if args.corpus and args.corpus != DEFAULT_CORPUS:
+        if not CORPUS_NAME.fullmatch(args.corpus):
+            parser.error("--corpus: letters, digits, '_' and '-' only")
+        args.index_root = os.path.join(project_root, 'models', 'index', 'corpora', args.corpus)
+
+    if args.list:
+        live = current_version(args.index_root)
+        print(f"{'*' if live is None else ' '} base")
+        for version in list_versions(args.index_root):
+            manifest = load_manifest(resolve_index_dir(args.index_root, version))
+            print(f"{'*' if version == live else ' '} {version}  {manifest.get('created', '')}  "
+                  f"{manifest.get('live_passages', '?')} passages, {manifest.get('tombstones', 0)} tombstones")
+    elif args.publish:
+        publish_version(args.index_root, args.publish)
+        print(f"✅ Version {args.publish} is live.")
+    else:
+        if not args.add and not args.remove:
+            parser.error("nothing to do: use --add and/or --remove")
+        missing = [path for path in args.add if not os.path.isfile(path)]
+        if missing:
+            sys.exit(f"PDF not found: {', '.join(missing)}")
+        update_live_index(args.index_root, add_pdfs=args.add, remove_documents=args.remove,
+                          compact_ratio=args.compact_ratio, publish=not args.no_publish,
+                          keep_versions=args.keep_versions)
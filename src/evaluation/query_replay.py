@@ -0,0 +1,146 @@
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+# Add src/ to find model_management, api and evaluation
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+from api.query_log import most_frequent, read_records
+from evaluation.retrieval_benchmark import latency_stats
+from model_management.corpus_registry import CORPUS_NAME, DEFAULT_CORPUS
+from model_management.hybrid_retrieval import HybridRetriever
+from model_management.index_versions import resolve_index_dir
+from model_management.metrics import start_profile
+from model_management.passage_store import resolve_passages_path
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+DEFAULT_LOG = os.path.join(project_root, 'data', 'logs', 'queries.jsonl')
+
+# Replays logged production questions through HybridRetriever, in their logged order (repeats included):
+# per-stage latency, QPS, cache hit rates, and agreement of the results with the passages logged by the API.
+
+
+def prewarm(retriever, log_path, n, top_k, alpha, exact, corpus=DEFAULT_CORPUS):
+    """Same pre-warm as the API at startup: embeddings of the n most frequent questions in one batch, then their results."""
+    questions = most_frequent(log_path, n, corpus=corpus)
+    if questions:
+        retriever.query_encoder.encode_batch([question for question, _ in questions])
+        for question, filters in questions:
+            retriever.retrieve(question, top_k=top_k, alpha=alpha, exact=exact, filters=filters)
+    return len(questions)
+
+
+def replay(retriever, records, top_k=5, alpha=0.6, exact=False):
+    stages, overlaps, skipped = {}, [], 0
+    start = time.perf_counter()
+    for record in records:
+        profile = start_profile()
+        t0 = time.perf_counter()
+        try:
+            results = retriever.retrieve(record["q"], top_k=top_k, alpha=alpha, exact=exact, filters=record.get("filters"))
+        except Exception as e:
+            # e.g. filters on a document that is no longer indexed
+            print(f"⚠️ Skipping {record['q']!r}: {e}")
+            skipped += 1
+            continue
+        stages.setdefault("total", []).append(time.perf_counter() - t0)
+        for stage, seconds in profile.stages.items():
+            stages.setdefault(stage, []).append(seconds)
+        if record.get("ids"):
+            logged = set(record["ids"][:top_k])
+            overlaps.append(len(logged & {i for i, _ in results}) / len(logged))
+    elapsed = time.perf_counter() - start
+
+    replayed = len(records) - skipped
+    report = {
+        "queries": replayed,
+        "unique_queries": len({(r["q"], json.dumps(r.get("filters"), sort_keys=True)) for r in records}),
+        "skipped": skipped,
+        "seconds": elapsed,
+        "qps": replayed / elapsed if elapsed > 0 else None,
+        # Stages are only timed when they run: cache hits do not add samples to encode, faiss, ...
+        "stages_ms": {stage: dict(latency_stats(samples), count=len(samples)) for stage, samples in stages.items()},
+        "query_embedding_cache": retriever.query_encoder.cache.stats(),
+        "result_cache": retriever.result_cache.stats(),
+        # Share of the passages logged by the API found again: below 1 when the index or settings changed
+        "overlap_with_log": float(np.mean(overlaps)) if overlaps else None,
+    }
+    logged_ms = [r["ms"]["retrieval"] for r in records if "retrieval" in r.get("ms", {})]
+    if logged_ms:
+        report["logged_retrieval_ms"] = latency_stats(np.asarray(logged_ms) / 1000)
+    return report
+
+
+def print_summary(report):
+    print(f"Replayed:      {report['queries']} queries ({report['unique_queries']} unique, {report['skipped']} skipped) "
+          f"in {report['seconds']:.2f}s, {report['qps'] or 0:.1f} QPS")
+    for stage, stats in report["stages_ms"].items():
+        print(f"  {stage:12s} p50={stats['p50']:.2f}ms p95={stats['p95']:.2f}ms (n={stats['count']})")
+    if "logged_retrieval_ms" in report:
+        stats = report["logged_retrieval_ms"]
+        print(f"  {'logged':12s} p50={stats['p50']:.2f}ms p95={stats['p95']:.2f}ms (retrieval stage in the API)")
+    print(f"Caches:        query embedding hit rate {report['query_embedding_cache']['hit_rate']:.1%}, "
+          f"results hit rate {report['result_cache']['hit_rate']:.1%}")
+    if report["overlap_with_log"] is not None:
+        print(f"Overlap:       {report['overlap_with_log']:.3f} of the logged passages retrieved again")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay the API query log through the hybrid retriever")
+    parser.add_argument("--log", default=DEFAULT_LOG, help="Query log (its rotated files are read too)")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="Replay the questions asked on this corpus")
+    parser.add_argument("--index-dir", default=None, help="Index directory (default: the live version of the corpus index)")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--limit", type=int, default=None, help="Replay only the last N logged questions")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--alpha", type=float, default=0.6)
+    parser.add_argument("--exact", action="store_true", help="Exact hybrid search (EXACT_HYBRID)")
+    parser.add_argument("--section-probe", type=int, default=0, help="Sections probed (SECTION_PROBE, 0: flat)")
+    parser.add_argument("--cache-size", type=int, default=1024, help="Query embedding cache size (0: every query encoded)")
+    parser.add_argument("--result-cache-size", type=int, default=0,
+                        help="Retrieval result cache size (RETRIEVAL_CACHE_SIZE; 0: every query searched)")
+    parser.add_argument("--prewarm", type=int, default=0,
+                        help="Pre-warm the caches with the N most frequent logged questions first, as the API does")
+    parser.add_argument("--output", default=None, help="Optional JSON report path")
+    args = parser.parse_args()
+
+    if not CORPUS_NAME.fullmatch(args.corpus):
+        parser.error(f"invalid corpus name: {args.corpus}")
+    records = [r for r in read_records(args.log) if r.get("corpus", DEFAULT_CORPUS) == args.corpus]
+    if args.limit:
+        records = records[-args.limit:]
+    if not records:
+        raise FileNotFoundError(f"No logged questions on corpus {args.corpus} in {args.log} (run the API with QUERY_LOG=true)")
+
+    if args.corpus == DEFAULT_CORPUS:
+        index_root = os.path.join(project_root, 'models', 'index', 'index_files')
+    else:
+        index_root = os.path.join(project_root, 'models', 'index', 'corpora', args.corpus)
+    index_dir = args.index_dir or resolve_index_dir(index_root)
+    retriever = HybridRetriever(index_path=os.path.join(index_dir, "faiss_index"),
+                                embeddings_path=resolve_passages_path(index_dir), model_name=args.model,
+                                cache_size=args.cache_size, section_probe=args.section_probe,
+                                result_cache_size=args.result_cache_size)
+    print(f"📐 {len(records)} logged questions, {len(retriever.passages)} passages in {index_dir}")
+
+    report = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "log": args.log, "corpus": args.corpus, "index_dir": index_dir,
+              "settings": {k: getattr(args, k) for k in ("top_k", "alpha", "exact", "section_probe", "cache_size",
+                                                         "result_cache_size", "prewarm")}}
+    if args.prewarm:
+        start = time.perf_counter()
+        report["prewarmed"] = prewarm(retriever, args.log, args.prewarm, args.top_k, args.alpha, args.exact,
+                                       corpus=args.corpus)
+        report["prewarm_s"] = time.perf_counter() - start
+        print(f"♻️ {report['prewarmed']} questions prewarmed in {report['prewarm_s']:.2f}s")
+        # Hit rates of the replay only
+        for cache in (retriever.query_encoder.cache, retriever.result_cache):
+            cache.hits = cache.misses = 0
+
+    report.update(replay(retriever, records, top_k=args.top_k, alpha=args.alpha, exact=args.exact))
+    print_summary(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Report saved to: {args.output}")
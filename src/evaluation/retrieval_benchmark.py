@@ -0,0 +1,250 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tempfile
+import numpy as np
+
+# Add src/ to find model_management
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+from model_management.bm25_index import tokenize
+from model_management.embedding_registry import get_embedding_model
+from model_management.hybrid_retrieval import HybridRetriever
+from model_management.index_builder import build_streaming_index, model_encoder
+from model_management.passage_store import resolve_passages_path
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+DEFAULT_TEXTS = os.path.join(project_root, 'data', 'processed', 'extracted_texts.json')
+DEFAULT_EVAL_SET = os.path.join(project_root, 'data', 'eval', 'sst_retrieval_eval.json')
+
+# Metrics checked by --compare: (json path, "lower" or "higher" is better, kind)
+REGRESSION_METRICS = [
+    (("stages_ms", "encode", "p50"), "lower", "latency"),
+    (("stages_ms", "faiss", "p50"), "lower", "latency"),
+    (("stages_ms", "bm25", "p50"), "lower", "latency"),
+    (("stages_ms", "fusion", "p50"), "lower", "latency"),
+    (("stages_ms", "total", "p50"), "lower", "latency"),
+    (("stages_ms", "total", "p95"), "lower", "latency"),
+    (("quality", "recall@5"), "higher", "quality"),
+    (("quality", "recall@10"), "higher", "quality"),
+    (("quality", "mrr@10"), "higher", "quality"),
+]
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process (None where the resource module is unavailable)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024
+
+
+def latency_stats(samples_s):
+    ms = np.asarray(samples_s) * 1000
+    return {"p50": float(np.percentile(ms, 50)), "p95": float(np.percentile(ms, 95)), "mean": float(ms.mean())}
+
+
+def load_eval_set(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["questions"]
+
+
+def is_relevant(text, snippets):
+    text = text.lower()
+    return any(snippet.lower() in text for snippet in snippets)
+
+
+# BENCHMARK STEPS
+
+def build_benchmark_index(texts_path, index_dir, model_name, batch_size=256):
+    """Builds an index from extracted_texts.json and returns the build time in seconds."""
+    with open(texts_path, "r", encoding="utf-8") as f:
+        texts = json.load(f)
+    passages = ({"document": os.path.basename(texts_path), "page": 0, "section": "Uncategorized",
+                 "subsection": "Uncategorized", "text": text.strip()} for text in texts if text.strip())
+
+    model = get_embedding_model(model_name)
+    start = time.perf_counter()
+    build_streaming_index(passages, model_encoder(model), os.path.join(index_dir, "faiss_index"),
+                          os.path.join(index_dir, "passage_store"), batch_size=batch_size)
+    return time.perf_counter() - start
+
+
+def measure_startup(index_dir, model_name):
+    """Cold start of a retriever (imports, model, indexes) in a fresh process, as the API pays it."""
+    command = [sys.executable, os.path.abspath(__file__), "--startup-probe", index_dir, "--model", model_name]
+    output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def startup_probe(index_dir, model_name):
+    start = time.perf_counter()
+    HybridRetriever(index_path=os.path.join(index_dir, "faiss_index"),
+                    embeddings_path=resolve_passages_path(index_dir), model_name=model_name)
+    print(json.dumps({"startup_s": time.perf_counter() - start, "rss_mb": peak_rss_mb()}))
+
+
+def measure_stages(retriever, questions, top_k=5, alpha=0.6, repeats=3):
+    """Per-stage latency of the single-query hybrid path, with the query-embedding cache bypassed."""
+    stages = {"encode": [], "faiss": [], "bm25": [], "fusion": [], "total": []}
+    for _ in range(repeats):
+        for question in questions:
+            t0 = time.perf_counter()
+            embedding = retriever.model.encode(question, convert_to_numpy=True, normalize_embeddings=True)
+            t1 = time.perf_counter()
+            D, I = retriever.index.search(np.array([embedding], dtype=np.float32), top_k * 2)
+            t2 = time.perf_counter()
+            bm25_results = retriever.bm25.search(tokenize(question), top_k=top_k * 2)
+            t3 = time.perf_counter()
+            faiss_results = [(int(i), float(s)) for s, i in zip(D[0], I[0]) if i != -1]
+            retriever._fuse(faiss_results, bm25_results, top_k, alpha)
+            t4 = time.perf_counter()
+
+            stages["encode"].append(t1 - t0)
+            stages["faiss"].append(t2 - t1)
+            stages["bm25"].append(t3 - t2)
+            stages["fusion"].append(t4 - t3)
+            stages["total"].append(t4 - t0)
+    return {name: latency_stats(samples) for name, samples in stages.items()}
+
+
+def measure_throughput(retriever, questions, batch_sizes=(1, 8, 32, 128), min_queries=256):
+    """Queries per second of search_batch at several batch sizes (cache cleared before each run)."""
+    results = {}
+    for batch_size in batch_sizes:
+        queries = [questions[i % len(questions)] + f" ({i})" for i in range(max(min_queries, batch_size))]
+        retriever.query_encoder.cache.clear()
+        start = time.perf_counter()
+        for offset in range(0, len(queries), batch_size):
+            retriever.search_batch(queries[offset:offset + batch_size])
+        results[str(batch_size)] = len(queries) / (time.perf_counter() - start)
+    return results
+
+
+def measure_quality(retriever, eval_set, ks=(1, 5, 10), alpha=0.6):
+    """recall@k (share of questions with a relevant passage in the top k) and MRR@max(k)."""
+    max_k = max(ks)
+    hits = {k: 0 for k in ks}
+    reciprocal_ranks = []
+    per_question = []
+    for item in eval_set:
+        results = retriever.retrieve(item["question"], top_k=max_k, alpha=alpha)
+        ranks = [rank for rank, (idx, _) in enumerate(results, start=1)
+                 if is_relevant(retriever.passages[idx]["text"], item["relevant"])]
+        first = ranks[0] if ranks else None
+        for k in ks:
+            hits[k] += int(first is not None and first <= k)
+        reciprocal_ranks.append(1.0 / first if first else 0.0)
+        per_question.append({"id": item["id"], "first_relevant_rank": first})
+
+    quality = {f"recall@{k}": hits[k] / len(eval_set) for k in ks}
+    quality[f"mrr@{max_k}"] = float(np.mean(reciprocal_ranks))
+    quality["per_question"] = per_question
+    return quality
+
+
+def run_benchmark(args):
+    report = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "model": args.model,
+              "python": platform.python_version(), "machine": platform.machine()}
+
+    index_dir = args.index_dir
+    temp_dir = None
+    if index_dir is None:
+        temp_dir = tempfile.TemporaryDirectory(prefix="sst_bench_")
+        index_dir = temp_dir.name
+        print(f"🏗️ Building benchmark index from {args.texts}...")
+        report["build_s"] = build_benchmark_index(args.texts, index_dir, args.model)
+        print(f"   build: {report['build_s']:.2f}s")
+
+    print("🚀 Measuring API startup in a fresh process...")
+    report["startup"] = measure_startup(index_dir, args.model)
+
+    retriever = HybridRetriever(index_path=os.path.join(index_dir, "faiss_index"),
+                                embeddings_path=resolve_passages_path(index_dir), model_name=args.model)
+    report["passages"] = len(retriever.passages)
+    eval_set = load_eval_set(args.eval_set)
+    questions = [item["question"] for item in eval_set]
+
+    print("⏱️ Per-stage latency...")
+    report["stages_ms"] = measure_stages(retriever, questions)
+    print("📈 Throughput per batch size...")
+    report["qps"] = measure_throughput(retriever, questions)
+    print("🎯 Retrieval quality...")
+    report["quality"] = measure_quality(retriever, eval_set)
+    report["peak_rss_mb"] = peak_rss_mb()
+
+    if temp_dir is not None:
+        temp_dir.cleanup()
+    return report
+
+
+def compare_reports(baseline, current, max_latency_regression=0.2, max_quality_drop=0.02):
+    """List of regressions of current vs baseline beyond the thresholds (relative latency, absolute quality)."""
+    regressions = []
+    for path, better, kind in REGRESSION_METRICS:
+        try:
+            old, new = baseline, current
+            for key in path:
+                old, new = old[key], new[key]
+        except KeyError:
+            continue
+        name = ".".join(path)
+        if kind == "latency" and better == "lower" and new > old * (1 + max_latency_regression):
+            regressions.append(f"{name}: {old:.3f} -> {new:.3f} ms (+{(new / old - 1) * 100:.0f}%)")
+        if kind == "quality" and better == "higher" and new < old - max_quality_drop:
+            regressions.append(f"{name}: {old:.3f} -> {new:.3f}")
+    return regressions
+
+
+def print_summary(report):
+    if "build_s" in report:
+        print(f"Index build:   {report['build_s']:.2f}s ({report['passages']} passages)")
+    print(f"API startup:   {report['startup']['startup_s']:.2f}s, RSS {report['startup']['rss_mb']} MB")
+    for stage, stats in report["stages_ms"].items():
+        print(f"  {stage:8s} p50={stats['p50']:.2f}ms p95={stats['p95']:.2f}ms")
+    print("QPS:           " + ", ".join(f"batch {b}: {q:.1f}" for b, q in report["qps"].items()))
+    print("Quality:       " + ", ".join(f"{k}={v:.3f}" for k, v in report["quality"].items() if k != "per_question"))
+    print(f"Peak RSS:      {report['peak_rss_mb']} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retrieval benchmark: build/startup time, stage latency, QPS, recall/MRR")
+    parser.add_argument("--texts", default=DEFAULT_TEXTS, help="extracted_texts.json used to build the benchmark index")
+    parser.add_argument("--index-dir", default=None, help="Benchmark an already built index instead of building one")
+    parser.add_argument("--eval-set", default=DEFAULT_EVAL_SET)
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"),
+                        help="Compare two result files and exit 1 on regression")
+    parser.add_argument("--max-latency-regression", type=float, default=0.2, help="Allowed relative latency increase")
+    parser.add_argument("--max-quality-drop", type=float, default=0.02, help="Allowed absolute recall/MRR drop")
+    parser.add_argument("--startup-probe", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.startup_probe:
+        startup_probe(args.startup_probe, args.model)
+        sys.exit(0)
+
+    if args.compare:
+        with open(args.compare[0], "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        with open(args.compare[1], "r", encoding="utf-8") as f:
+            current = json.load(f)
+        regressions = compare_reports(baseline, current, args.max_latency_regression, args.max_quality_drop)
+        if regressions:
+            print("❌ Regressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("✅ No regression.")
+        sys.exit(0)
+
+    report = run_benchmark(args)
+    print_summary(report)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"✅ Results saved to: {args.output}")
@@ -0,0 +1,157 @@
+import os
+import sys
+import json
+import time
+import argparse
+import faiss
+import numpy as np
+from scipy import sparse
+
+# Add src/ to find model_management and evaluation
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+from evaluation.retrieval_benchmark import is_relevant, load_eval_set
+from model_management.bm25_index import BM25Index, bm25_path_for, tokenize, top_k_indices
+from model_management.embedding_registry import get_embedding_model
+from model_management.hybrid_retrieval import HybridRetriever
+from model_management.index_builder import embeddings_path_for
+from model_management.index_versions import load_tombstones, resolve_index_dir
+from model_management.passage_store import open_passages, resolve_passages_path
+from model_management.section_index import SectionIndex
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+# Coarse-to-fine (section probing) vs flat hybrid search, as the corpus grows: search cost
+# (passages scored, latency) and recall of the flat top-k, plus hit rate on the evaluation set.
+
+
+def replicate_corpus(matrix, bm25, sections, copies, seed=0):
+    """
+    Corpus `copies` times larger: jittered copies of the embeddings, same postings, and each copy
+    as new documents (its own sections). Passage id i of copy c is c * n + i.
+    """
+    rng = np.random.default_rng(seed)
+    base = np.asarray(matrix, dtype=np.float32)
+    blocks = [base]
+    for _ in range(copies - 1):
+        block = base + rng.normal(scale=0.02, size=base.shape).astype(np.float32)
+        faiss.normalize_L2(block)
+        blocks.append(block)
+    matrix = np.vstack(blocks)
+
+    tf = sparse.hstack([bm25.tf] * copies, format="csr")
+    bm25 = BM25Index.from_postings(bm25.vocabulary, tf, np.tile(bm25.doc_len, copies), k1=bm25.k1, b=bm25.b,
+                                   epsilon=bm25.epsilon)
+    n_sections = sections.num_sections
+    section_of = np.concatenate([sections.section_of + c * n_sections for c in range(copies)])
+    names = [(f"{document} #{c}" if c else document, section) for c in range(copies) for document, section in sections.names]
+    return matrix, bm25, SectionIndex.from_arrays(section_of, names, matrix, bm25)
+
+
+def flat_search(index, bm25, embedding, tokens, top_k, alpha):
+    """The retriever's default search: FAISS and BM25 top-2k over every passage, fused."""
+    D, I = index.search(embedding[None, :], top_k * 2)
+    dense = [(int(i), float(s)) for s, i in zip(D[0], I[0]) if i != -1]
+    return [i for i, _, _, _ in HybridRetriever._fuse(dense, bm25.search(tokens, top_k * 2), top_k, alpha)], bm25.num_docs
+
+
+def probed_search(matrix, bm25, sections, embedding, tokens, top_k, alpha, n_probe):
+    """Section probing, then FAISS-equivalent and BM25 top-2k over the probed passages only, fused."""
+    ids = sections.passages_of(sections.probe(embedding, tokens, n_probe, alpha))
+    scores = matrix[ids] @ embedding
+    dense = [(int(ids[i]), float(scores[i])) for i in top_k_indices(scores, top_k * 2)]
+    lexical = bm25.search(tokens, top_k * 2, ids=ids)
+    return [i for i, _, _, _ in HybridRetriever._fuse(dense, lexical, top_k, alpha)], ids.size
+
+
+def measure(search, queries, texts, eval_set, reference=None):
+    latencies, found, scored = [], [], []
+    for embedding, tokens in queries:
+        start = time.perf_counter()
+        ids, n_scored = search(embedding, tokens)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found.append(ids)
+        scored.append(n_scored)
+    row = {
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "passages_scored": float(np.mean(scored)),
+        # Questions with at least one relevant passage in the top-k (copies share the base texts)
+        "hit_rate": float(np.mean([any(is_relevant(texts(i), item["relevant"]) for i in ids)
+                                   for ids, item in zip(found, eval_set)])),
+    }
+    if reference is not None:
+        row["recall_vs_flat"] = float(np.mean([len(set(f) & set(r)) / max(len(r), 1)
+                                               for f, r in zip(found, reference)]))
+    return row, found
+
+
+def run_benchmark(index_dir, eval_set, model_name, copies_list, probes, top_k=5, alpha=0.6):
+    store = open_passages(resolve_passages_path(index_dir))
+    index_path = os.path.join(index_dir, "faiss_index")
+    base_matrix = np.load(embeddings_path_for(index_path), mmap_mode="r")
+    base_bm25 = BM25Index.load(bm25_path_for(index_path), with_tf=True)
+    if base_bm25.tf is None:
+        base_bm25 = BM25Index.build(tokenize(store[i]["text"]) for i in range(len(store)))
+    # Live-updated version: deleted passages are dropped so that the flat search does not return them
+    live = np.setdiff1d(np.arange(len(store), dtype=np.int64), load_tombstones(index_dir))
+    if live.size < len(store):
+        base_matrix = np.ascontiguousarray(base_matrix[live])
+        base_bm25 = base_bm25.select(live)
+        store = [store[int(i)] for i in live]
+    base_sections = SectionIndex.build(store, base_matrix, base_bm25)
+
+    model = get_embedding_model(model_name)
+    questions = [item["question"] for item in eval_set]
+    embeddings = model.encode(questions, convert_to_numpy=True, normalize_embeddings=True).astype(np.float32)
+    queries = list(zip(embeddings, (tokenize(q) for q in questions)))
+    n_base = len(store)
+
+    def texts(i):
+        return store[i % n_base]["text"]
+
+    report = []
+    for copies in copies_list:
+        matrix, bm25, sections = replicate_corpus(base_matrix, base_bm25, base_sections, copies)
+        index = faiss.IndexFlatIP(matrix.shape[1])
+        index.add(matrix)
+        print(f"\n📐 {matrix.shape[0]} passages in {sections.num_sections} sections (x{copies})")
+
+        flat, reference = measure(lambda e, t: flat_search(index, bm25, e, t, top_k, alpha), queries, texts, eval_set)
+        report.append(dict(flat, copies=copies, passages=int(matrix.shape[0]), sections=sections.num_sections,
+                           n_probe=None, recall_vs_flat=1.0))
+        print(f"  flat          p50={flat['p50_ms']:.2f}ms p95={flat['p95_ms']:.2f}ms "
+              f"scored={flat['passages_scored']:.0f} hit@{top_k}={flat['hit_rate']:.3f}")
+        for n_probe in probes:
+            row, _ = measure(lambda e, t: probed_search(matrix, bm25, sections, e, t, top_k, alpha, n_probe),
+                             queries, texts, eval_set, reference)
+            report.append(dict(row, copies=copies, passages=int(matrix.shape[0]), sections=sections.num_sections,
+                               n_probe=n_probe))
+            print(f"  n_probe={n_probe:<5d} p50={row['p50_ms']:.2f}ms p95={row['p95_ms']:.2f}ms "
+                  f"scored={row['passages_scored']:.0f} ({row['passages_scored'] / matrix.shape[0]:.1%}) "
+                  f"recall@{top_k} vs flat={row['recall_vs_flat']:.3f} hit@{top_k}={row['hit_rate']:.3f}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Section probing vs flat hybrid search: cost and recall as the corpus grows")
+    parser.add_argument("--index-dir", default=None, help="Index directory (default: the live index version)")
+    parser.add_argument("--eval-set", default=os.path.join(project_root, 'data', 'eval', 'sst_retrieval_eval.json'))
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--replicate", type=int, nargs="+", default=[1, 4, 16],
+                        help="Corpus sizes as multiples of the index (jittered copies as new documents)")
+    parser.add_argument("--probes", type=int, nargs="+", default=[2, 4, 8, 16, 32], help="Sections probed")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--alpha", type=float, default=0.6)
+    parser.add_argument("--output", default=None, help="Optional JSON report path")
+    args = parser.parse_args()
+    args.index_dir = args.index_dir or resolve_index_dir(os.path.join(project_root, 'models', 'index', 'index_files'))
+
+    if not os.path.exists(embeddings_path_for(os.path.join(args.index_dir, "faiss_index"))):
+        raise FileNotFoundError(f"embeddings.npy not found in {args.index_dir} (build the index first)")
+
+    report = run_benchmark(args.index_dir, load_eval_set(args.eval_set), args.model, args.replicate, args.probes,
+                           top_k=args.top_k, alpha=args.alpha)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Report saved to: {args.output}")
@@ -0,0 +1,122 @@
+import math
+import faiss
+import numpy as np
+
+# Supported dense index types (all use inner product on normalized vectors = cosine)
+INDEX_TYPES = ("flat", "hnsw", "hnsw_sq8", "ivf_flat", "ivf_sq8", "ivf_pq")
+
+
+def default_nlist(n_vectors: int) -> int:
+    """Number of IVF lists: ~4 * sqrt(n), kept within what the training set can support."""
+    return max(1, min(int(4 * math.sqrt(max(n_vectors, 1))), n_vectors // 39 or 1, 65536))
+
+
+def index_factory_string(index_type: str, dim: int, n_vectors: int = 0, nlist: int = None,
+                         hnsw_m: int = 32, pq_m: int = None) -> str:
+    """faiss.index_factory description of an index type."""
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "hnsw":
+        return f"HNSW{hnsw_m}"
+    if index_type == "hnsw_sq8":
+        return f"HNSW{hnsw_m}_SQ8"
+
+    nlist = nlist or default_nlist(n_vectors)
+    if index_type == "ivf_flat":
+        return f"IVF{nlist},Flat"
+    if index_type == "ivf_sq8":
+        return f"IVF{nlist},SQ8"
+    if index_type == "ivf_pq":
+        pq_m = pq_m or next(m for m in (48, 32, 24, 16, 12, 8, 4, 2, 1) if dim % m == 0)
+        if dim % pq_m != 0:
+            raise ValueError(f"pq_m={pq_m} must divide the embedding dimension {dim}.")
+        return f"IVF{nlist},PQ{pq_m}x8"
+    raise ValueError(f"Unknown index type '{index_type}'. Choose from: {', '.join(INDEX_TYPES)}")
+
+
+def create_index(index_type: str, dim: int, n_vectors: int = 0, nlist: int = None,
+                 hnsw_m: int = 32, pq_m: int = None):
+    """Empty inner-product FAISS index of the requested type."""
+    description = index_factory_string(index_type, dim, n_vectors, nlist=nlist, hnsw_m=hnsw_m, pq_m=pq_m)
+    return faiss.index_factory(dim, description, faiss.METRIC_INNER_PRODUCT)
+
+
+def build_from_matrix(embeddings: np.ndarray, index_type: str = "flat", nlist: int = None, hnsw_m: int = 32,
+                      pq_m: int = None, train_size: int = 100_000, batch_size: int = 65_536, seed: int = 0):
+    """
+    Build an index from a (possibly memory-mapped) matrix of normalized embeddings.
+    Trainable indexes are trained on a random sample, then vectors are added batch by batch.
+    """
+    n_vectors, dim = embeddings.shape
+    index = create_index(index_type, dim, n_vectors, nlist=nlist, hnsw_m=hnsw_m, pq_m=pq_m)
+
+    if not index.is_trained:
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(n_vectors, size=min(train_size, n_vectors), replace=False))
+        index.train(np.ascontiguousarray(embeddings[sample], dtype=np.float32))
+
+    for start in range(0, n_vectors, batch_size):
+        index.add(np.ascontiguousarray(embeddings[start:start + batch_size], dtype=np.float32))
+    return index
+
+
+def read_index_shared(path: str):
+    """
+    Read a FAISS index memory-mapped when this FAISS build and index type allow it, so that
+    several server workers share the same page-cache pages instead of each holding a copy.
+    Returns (index, mode) with mode "mmap" or "memory" (fallback: regular read).
+    """
+    flags = [getattr(faiss, "IO_FLAG_MMAP_IFC", None), getattr(faiss, "IO_FLAG_MMAP", None)]
+    for flag in flags:
+        if flag is None:
+            continue
+        try:
+            return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY), "mmap"
+        except RuntimeError:
+            continue
+    return faiss.read_index(path), "memory"
+
+
+def set_search_params(index, ef_search: int = None, nprobe: int = None):
+    """Runtime search parameters: efSearch for HNSW, nprobe for IVF (ignored by other index types)."""
+    params = faiss.ParameterSpace()
+    if ef_search is not None and _has_component(index, faiss.IndexHNSW):
+        params.set_index_parameter(index, "efSearch", int(ef_search))
+    if nprobe is not None and _has_component(index, faiss.IndexIVF):
+        params.set_index_parameter(index, "nprobe", int(nprobe))
+
+
+def search_parameters(index, selector):
+    """
+    Per-call SearchParameters restricting a search to the ids accepted by selector
+    (e.g. a faiss.IDSelectorBitmap), keeping the efSearch / nprobe currently set on the index.
+    """
+    hnsw = _find_component(index, faiss.IndexHNSW)
+    if hnsw is not None:
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=hnsw.hnsw.efSearch)
+    ivf = _find_component(index, faiss.IndexIVF)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    return faiss.SearchParameters(sel=selector)
+
+
+def _find_component(index, cls):
+    """The index (or the index it wraps) of the given FAISS class, else None."""
+    index = faiss.downcast_index(index)
+    while True:
+        if isinstance(index, cls):
+            return index
+        inner = getattr(index, "index", None)
+        if inner is None:
+            return None
+        index = faiss.downcast_index(inner)
+
+
+def _has_component(index, cls) -> bool:
+    """True if the index (or the index it wraps) is of the given FAISS class."""
+    return _find_component(index, cls) is not None
+
+
+def index_type_of(index) -> str:
+    """Readable name of a loaded FAISS index."""
+    return type(faiss.downcast_index(index)).__name__
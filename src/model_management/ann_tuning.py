@@ -0,0 +1,126 @@
+import os
+import sys
+import json
+import time
+import argparse
+import faiss
+import numpy as np
+
+# Add src/ to find model_management when run as a script
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+from model_management.ann_index import build_from_matrix, set_search_params
+
+# Default grid: (index type, build options, runtime parameter name, runtime values)
+DEFAULT_GRID = [
+    ("flat", {}, None, [None]),
+    ("hnsw", {"hnsw_m": 32}, "ef_search", [16, 32, 64, 128, 256]),
+    ("hnsw_sq8", {"hnsw_m": 32}, "ef_search", [32, 64, 128]),
+    ("ivf_flat", {}, "nprobe", [1, 4, 8, 16, 32, 64]),
+    ("ivf_sq8", {}, "nprobe", [4, 16, 64]),
+    ("ivf_pq", {}, "nprobe", [4, 16, 64]),
+]
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    """Mean fraction of the exact top-k neighbors returned by the approximate search."""
+    hits = [len(set(f[f >= 0]) & set(t)) / len(t) for f, t in zip(found, truth)]
+    return float(np.mean(hits))
+
+
+def measure_latency(index, queries: np.ndarray, top_k: int):
+    """Per-query search latency (one query at a time, like the API), in milliseconds."""
+    latencies = []
+    results = np.empty((len(queries), top_k), dtype=np.int64)
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], top_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results[i] = ids[0]
+    return np.asarray(latencies), results
+
+
+def index_size_mb(index) -> float:
+    return faiss.serialize_index(index).nbytes / 1e6
+
+
+def run_tuning(embeddings: np.ndarray, n_queries: int = 200, top_k: int = 10, grid=DEFAULT_GRID, seed: int = 0):
+    """
+    Holds out n_queries vectors as queries, indexes the rest with every configuration of the grid
+    and reports recall@k against the flat index, p50/p99 latency, build time and index size.
+    """
+    rng = np.random.default_rng(seed)
+    query_ids = rng.choice(len(embeddings), size=min(n_queries, len(embeddings) // 2), replace=False)
+    mask = np.ones(len(embeddings), dtype=bool)
+    mask[query_ids] = False
+    base = np.ascontiguousarray(embeddings[mask], dtype=np.float32)
+    queries = np.ascontiguousarray(embeddings[query_ids], dtype=np.float32)
+
+    ground_truth = faiss.IndexFlatIP(base.shape[1])
+    ground_truth.add(base)
+    _, truth = ground_truth.search(queries, top_k)
+
+    results = []
+    for index_type, options, param_name, values in grid:
+        start = time.perf_counter()
+        try:
+            index = build_from_matrix(base, index_type, **options)
+        except Exception as e:
+            print(f"⚠️ Skipping {index_type}: {e}")
+            continue
+        build_seconds = time.perf_counter() - start
+
+        for value in values:
+            if param_name:
+                set_search_params(index, **{param_name: value})
+            latencies, found = measure_latency(index, queries, top_k)
+            results.append({
+                "index_type": index_type,
+                "options": options,
+                "param": param_name,
+                "value": value,
+                f"recall@{top_k}": recall_at_k(found, truth),
+                "p50_ms": float(np.percentile(latencies, 50)),
+                "p99_ms": float(np.percentile(latencies, 99)),
+                "build_s": build_seconds,
+                "size_mb": index_size_mb(index),
+            })
+            row = results[-1]
+            setting = f"{param_name}={value}" if param_name else "-"
+            print(f"{index_type:10s} {setting:14s} recall@{top_k}={row[f'recall@{top_k}']:.3f} "
+                  f"p50={row['p50_ms']:.3f}ms p99={row['p99_ms']:.3f}ms "
+                  f"build={build_seconds:.1f}s size={row['size_mb']:.1f}MB")
+    return results
+
+
+if __name__ == "__main__":
+    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+    default_embeddings = os.path.join(project_root, 'models', 'index', 'index_files', 'embeddings.npy')
+
+    parser = argparse.ArgumentParser(description="Recall/latency tuning of FAISS ANN index types")
+    parser.add_argument("--embeddings", default=default_embeddings, help="Normalized embeddings (.npy)")
+    parser.add_argument("--queries", type=int, default=200, help="Held-out vectors used as queries")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--replicate", type=int, default=1,
+                        help="Simulate a larger corpus by stacking jittered copies of the embeddings")
+    parser.add_argument("--output", default=None, help="Optional JSON report path")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.embeddings):
+        raise FileNotFoundError(f"Embeddings not found: {args.embeddings} (build the index first)")
+
+    embeddings = np.load(args.embeddings, mmap_mode="r")
+    if args.replicate > 1:
+        rng = np.random.default_rng(0)
+        copies = [np.asarray(embeddings, dtype=np.float32)]
+        for _ in range(args.replicate - 1):
+            copy = copies[0] + rng.normal(scale=0.02, size=copies[0].shape).astype(np.float32)
+            faiss.normalize_L2(copy)
+            copies.append(copy)
+        embeddings = np.vstack(copies)
+    print(f"📐 {embeddings.shape[0]} vectors of dimension {embeddings.shape[1]}")
+
+    report = run_tuning(embeddings, n_queries=args.queries, top_k=args.top_k)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Report saved to: {args.output}")
@@ -0,0 +1,261 @@
+import os
+import numpy as np
+from array import array
+from collections import Counter
+from scipy import sparse
+from nltk.tokenize import RegexpTokenizer
+
+# Same tokenization as the historical rank_bm25 corpus (lowercase, \w+ tokens)
+_tokenizer = RegexpTokenizer(r"\w+")
+
+
+def tokenize(text: str) -> list:
+    """Lowercase word tokenization shared by indexing and querying."""
+    return _tokenizer.tokenize(text.lower())
+
+
+def bm25_path_for(index_path: str) -> str:
+    """BM25 index file stored next to the FAISS index."""
+    return os.path.join(os.path.dirname(index_path), "bm25_index.npz")
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Indices of the top_k highest scores (descending) using partial selection."""
+    n = scores.shape[0]
+    if top_k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if top_k >= n:
+        return np.argsort(scores)[::-1]
+    candidates = np.argpartition(scores, n - top_k)[n - top_k:]
+    return candidates[np.argsort(scores[candidates])[::-1]]
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a sparse inverted index.
+    The weight matrix is a CSR (terms x passages) matrix whose entries already contain
+    idf * tf * (k1 + 1) / (tf + k1 * length_norm), so scoring a query is a sparse mat-vec.
+    Scores are identical to rank_bm25.BM25Okapi with the same parameters.
+    """
+
+    def __init__(self, vocabulary: dict, weights: sparse.csr_matrix, idf: np.ndarray,
+                 doc_len: np.ndarray, k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25,
+                 tf: sparse.csr_matrix = None):
+        self.vocabulary = vocabulary
+        self.weights = weights
+        self.idf = idf
+        self.doc_len = doc_len
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        # Raw term frequencies (same sparsity as weights), kept to update the index without re-tokenizing
+        self.tf = tf
+
+    @property
+    def num_docs(self) -> int:
+        return self.weights.shape[1]
+
+    @classmethod
+    def build(cls, corpus, k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25, deleted: np.ndarray = None):
+        """Build the index from an iterable of tokenized passages (deleted: tombstoned passage ids)."""
+        builder = BM25Builder()
+        for tokens in corpus:
+            builder.add(tokens)
+        return builder.build(k1=k1, b=b, epsilon=epsilon, deleted=deleted)
+
+    @classmethod
+    def from_postings(cls, vocabulary: dict, tf_matrix: sparse.csr_matrix, doc_len: np.ndarray,
+                      k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25, deleted: np.ndarray = None):
+        """
+        Compute IDF and BM25 weights from a (terms x passages) term-frequency matrix.
+        deleted : passage ids left out (tombstones): their postings are dropped and they do not
+        count in the passage total or the average length, but their columns keep the ids in place.
+        """
+        live = np.ones(tf_matrix.shape[1], dtype=bool)
+        if deleted is not None and len(deleted):
+            live[np.asarray(deleted, dtype=np.int64)] = False
+            tf_matrix = (tf_matrix @ sparse.diags(live.astype(np.float32))).tocsr()
+            tf_matrix.eliminate_zeros()
+        n_docs = int(live.sum())
+
+        # IDF with rank_bm25's epsilon floor for negative values (averaged over terms still present)
+        df = np.diff(tf_matrix.indptr).astype(np.float64)
+        idf = np.log(n_docs - df + 0.5) - np.log(df + 0.5)
+        average_idf = idf[df > 0].mean() if np.any(df > 0) else 0.0
+        idf[idf < 0] = epsilon * average_idf
+
+        avgdl = doc_len[live].mean() if n_docs else 1.0
+        length_norm = k1 * (1 - b + b * doc_len / max(avgdl, 1e-6))
+
+        weights = tf_matrix.copy()
+        tf = weights.data
+        doc_of_entry = weights.indices
+        term_of_entry = np.repeat(np.arange(weights.shape[0]), np.diff(weights.indptr))
+        weights.data = (idf[term_of_entry] * tf * (k1 + 1) / (tf + length_norm[doc_of_entry])).astype(np.float32)
+
+        return cls(vocabulary, weights, idf.astype(np.float32), doc_len, k1=k1, b=b, epsilon=epsilon, tf=tf_matrix)
+
+    def update(self, added=(), deleted: np.ndarray = None):
+        """
+        New index with tokenized passages appended (ids following num_docs) and the deleted passage
+        ids (all tombstones so far) left out. Passage count, document frequencies and average length
+        are recomputed from the stored term frequencies: only the added passages are tokenized.
+        """
+        if self.tf is None:
+            raise ValueError("BM25 index saved without term frequencies: rebuild it to update it in place.")
+        builder = BM25Builder(vocabulary=dict(self.vocabulary))
+        for tokens in added:
+            builder.add(tokens)
+        new_tf = builder.tf_matrix()
+
+        # Old postings padded with the rows of the new terms, new passages appended as columns
+        n_terms = len(builder.vocabulary)
+        indptr = np.concatenate([self.tf.indptr, np.full(n_terms - self.tf.shape[0], self.tf.indptr[-1])])
+        old_tf = sparse.csr_matrix((self.tf.data, self.tf.indices, indptr), shape=(n_terms, self.tf.shape[1]))
+        tf_matrix = sparse.hstack([old_tf, new_tf], format="csr", dtype=np.float32)
+        doc_len = np.concatenate([self.doc_len, np.asarray(builder.doc_len(), dtype=np.float32)])
+        return BM25Index.from_postings(builder.vocabulary, tf_matrix, doc_len, k1=self.k1, b=self.b,
+                                       epsilon=self.epsilon, deleted=deleted)
+
+    def select(self, ids: np.ndarray):
+        """Index restricted to the given passage ids, renumbered 0..len(ids)-1 (compaction after update)."""
+        ids = np.asarray(ids, dtype=np.int64)
+        tf = self.tf[:, ids].tocsr() if self.tf is not None else None
+        return BM25Index(self.vocabulary, self.weights[:, ids].tocsr(), self.idf, self.doc_len[ids],
+                         k1=self.k1, b=self.b, epsilon=self.epsilon, tf=tf)
+
+    def _query_terms(self, tokens):
+        """Known term ids of a tokenized query and their multiplicities."""
+        counts = Counter(t for t in tokens if t in self.vocabulary)
+        term_ids = np.fromiter((self.vocabulary[t] for t in counts), dtype=np.int64, count=len(counts))
+        multiplicity = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        return term_ids, multiplicity
+
+    def get_scores(self, tokens) -> np.ndarray:
+        """BM25 score of every passage for a tokenized query."""
+        term_ids, multiplicity = self._query_terms(tokens)
+        if term_ids.size == 0:
+            return np.zeros(self.num_docs, dtype=np.float32)
+        return np.asarray(self.weights[term_ids].T @ multiplicity, dtype=np.float32).ravel()
+
+    def get_scores_subset(self, tokens, ids: np.ndarray) -> np.ndarray:
+        """
+        BM25 scores of the given passages only (sorted ids, e.g. from a metadata filter).
+        The postings of the query terms are masked to those ids, so the cost follows the
+        postings and the subset size instead of the corpus size.
+        """
+        term_ids, multiplicity = self._query_terms(tokens)
+        if term_ids.size == 0 or ids.size == 0:
+            return np.zeros(ids.size, dtype=np.float32)
+        postings = self.weights[term_ids]
+        weights = postings.data * np.repeat(multiplicity, np.diff(postings.indptr))
+        positions = np.searchsorted(ids, postings.indices)
+        keep = positions < ids.size
+        keep[keep] = ids[positions[keep]] == postings.indices[keep]
+        return np.bincount(positions[keep], weights=weights[keep], minlength=ids.size).astype(np.float32)
+
+    def search(self, tokens, top_k: int = 10, ids: np.ndarray = None):
+        """
+        Top-k (passage_id, score) pairs for a tokenized query (passages sharing no term are skipped).
+        ids : restrict the search to these sorted passage ids
+        """
+        if ids is not None:
+            scores = self.get_scores_subset(tokens, ids)
+            return [(int(ids[i]), float(scores[i])) for i in top_k_indices(scores, top_k) if scores[i] != 0]
+        scores = self.get_scores(tokens)
+        return [(int(i), float(scores[i])) for i in top_k_indices(scores, top_k) if scores[i] != 0]
+
+    def get_scores_batch(self, token_lists) -> sparse.csr_matrix:
+        """Sparse (n_queries x n_passages) BM25 score matrix, computed with one sparse product."""
+        rows, cols, values = [], [], []
+        for row, tokens in enumerate(token_lists):
+            term_ids, multiplicity = self._query_terms(tokens)
+            rows.extend([row] * len(term_ids))
+            cols.extend(term_ids.tolist())
+            values.extend(multiplicity.tolist())
+        queries = sparse.csr_matrix((np.asarray(values, dtype=np.float32), (rows, cols)),
+                                    shape=(len(token_lists), self.weights.shape[0]))
+        return (queries @ self.weights).tocsr()
+
+    def search_batch(self, token_lists, top_k: int = 10, ids: np.ndarray = None):
+        """search() for several tokenized queries, scored as one matrix (per query on the masked postings with ids)."""
+        if ids is not None:
+            return [self.search(tokens, top_k=top_k, ids=ids) for tokens in token_lists]
+        scores = self.get_scores_batch(token_lists)
+        results = []
+        for row in range(scores.shape[0]):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            doc_ids, row_scores = scores.indices[start:end], scores.data[start:end]
+            order = top_k_indices(row_scores, top_k)
+            results.append([(int(doc_ids[i]), float(row_scores[i])) for i in order if row_scores[i] != 0])
+        return results
+
+    def save(self, path: str):
+        """Save the index as a single .npz file."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        vocab = np.empty(len(self.vocabulary), dtype=object)
+        for term, term_id in self.vocabulary.items():
+            vocab[term_id] = term
+        # Written to a temporary file then renamed, so concurrent workers never read a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                data=self.weights.data,
+                indices=self.weights.indices,
+                indptr=self.weights.indptr,
+                shape=np.asarray(self.weights.shape, dtype=np.int64),
+                vocab=vocab.astype(str),
+                idf=self.idf,
+                doc_len=self.doc_len,
+                params=np.asarray([self.k1, self.b, self.epsilon], dtype=np.float64),
+                **({"tf": self.tf.data} if self.tf is not None else {}),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, with_tf: bool = False):
+        """Load an index saved with save() (with_tf: also the term frequencies, needed by update())."""
+        with np.load(path, allow_pickle=False) as data:
+            weights = sparse.csr_matrix(
+                (data["data"], data["indices"], data["indptr"]), shape=tuple(data["shape"])
+            )
+            tf = None
+            if with_tf and "tf" in data.files:
+                tf = sparse.csr_matrix((data["tf"], weights.indices, weights.indptr), shape=weights.shape)
+            vocabulary = {term: i for i, term in enumerate(data["vocab"].tolist())}
+            k1, b, epsilon = data["params"].tolist()
+            return cls(vocabulary, weights, data["idf"], data["doc_len"], k1=k1, b=b, epsilon=epsilon, tf=tf)
+
+
+class BM25Builder:
+    """Accumulates postings one passage at a time, in compact arrays, to build a BM25Index."""
+
+    def __init__(self, vocabulary: dict = None):
+        self.vocabulary = vocabulary if vocabulary is not None else {}
+        self._rows = array("i")
+        self._cols = array("i")
+        self._tfs = array("f")
+        self._doc_len = array("f")
+
+    def add(self, tokens):
+        doc_id = len(self._doc_len)
+        self._doc_len.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            self._rows.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+            self._cols.append(doc_id)
+            self._tfs.append(tf)
+
+    def tf_matrix(self) -> sparse.csr_matrix:
+        return sparse.csr_matrix(
+            (np.frombuffer(self._tfs, dtype=np.float32),
+             (np.frombuffer(self._rows, dtype=np.int32), np.frombuffer(self._cols, dtype=np.int32))),
+            shape=(len(self.vocabulary), len(self._doc_len)),
+        )
+
+    def doc_len(self) -> np.ndarray:
+        return np.array(self._doc_len, dtype=np.float32)
+
+    def build(self, k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25, deleted: np.ndarray = None) -> BM25Index:
+        return BM25Index.from_postings(self.vocabulary, self.tf_matrix(), self.doc_len(), k1=k1, b=b,
+                                       epsilon=epsilon, deleted=deleted)
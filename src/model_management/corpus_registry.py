@@ -0,0 +1,192 @@
+import os
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from model_management.index_versions import CURRENT_FILE, VERSIONS_DIR, resolve_index_dir
+from model_management.metrics import CORPUS_EVICTIONS, CORPUS_LOADS, LOADED_CORPUS_BYTES, stage_timer
+
+logger = logging.getLogger(__name__)
+
+# Several corpora served by one process, each with its own index root (base index + live versions):
+#   models/index/index_files/          the "default" corpus (data/raw)
+#   models/index/corpora/<name>/       corpus <name> (data/raw/<name>), built with hybrid_data_process.py --corpus
+DEFAULT_CORPUS = "default"
+CORPUS_NAME = re.compile(r"[A-Za-z0-9_-]+")
+
+
+class UnknownCorpus(KeyError):
+    """Corpus name with no index directory."""
+
+
+def index_size_bytes(index_root: str) -> int:
+    """
+    On-disk size of the live index of a corpus (published version, else base index). The FAISS index,
+    embeddings and passages are memory-mapped or read once loaded: it approximates the memory they take.
+    """
+    live_dir = resolve_index_dir(index_root)
+    total = 0
+    for directory, subdirs, files in os.walk(live_dir):
+        if directory == live_dir:
+            subdirs[:] = [d for d in subdirs if d != VERSIONS_DIR]
+        total += sum(os.path.getsize(os.path.join(directory, name)) for name in files)
+    return total
+
+
+class Corpus:
+    """A loaded corpus: its retriever on the live index version and its semantic answer cache."""
+
+    def __init__(self, name: str, index_root: str, retriever, version: str, semantic_cache=None):
+        self.name = name
+        self.index_root = index_root
+        self.retriever = retriever
+        self.version = version
+        self.semantic_cache = semantic_cache
+        self.size_bytes = 0
+        # Questions of the query log precomputed when it was loaded
+        self.prewarmed = 0
+        self.last_used = time.monotonic()
+        # Serializes the hot swaps of this corpus (see chatgpt_api.swap_corpus)
+        self.swap_lock = threading.Lock()
+
+    def close(self):
+        if self.semantic_cache is not None:
+            self.semantic_cache.save()
+
+
+class CorpusRegistry:
+    """
+    Corpora loaded on first use by loader(name, index_root) -> Corpus, and kept in an LRU pool:
+    before a load, the least recently used ones are unloaded until the estimated size of the loaded
+    corpora (index_size_bytes) fits memory_budget bytes; evict_idle() unloads those unused for idle_ttl
+    seconds. Requests still holding an unloaded Corpus finish on it. 0 disables each limit.
+    """
+
+    def __init__(self, default_root: str, corpora_root: str, loader, memory_budget: int = 0, idle_ttl: float = 0):
+        self.default_root = default_root
+        self.corpora_root = corpora_root
+        self.loader = loader
+        self.memory_budget = memory_budget
+        self.idle_ttl = idle_ttl
+        self._loaded = OrderedDict()  # name -> Corpus, least recently used first
+        self._load_locks = {}
+        self._lock = threading.Lock()
+
+    def names(self) -> list:
+        """Corpora available on disk: the default one and every directory of corpora_root holding an index."""
+        names = [DEFAULT_CORPUS]
+        if os.path.isdir(self.corpora_root):
+            names += [name for name in sorted(os.listdir(self.corpora_root))
+                      if CORPUS_NAME.fullmatch(name) and name != DEFAULT_CORPUS
+                      and (os.path.exists(os.path.join(self.corpora_root, name, "faiss_index"))
+                           or os.path.exists(os.path.join(self.corpora_root, name, CURRENT_FILE)))]
+        return names
+
+    def index_root(self, name: str = None) -> str:
+        name = name or DEFAULT_CORPUS
+        if name == DEFAULT_CORPUS:
+            return self.default_root
+        # Names are directory names: anything else (e.g. "../x") is refused before touching the disk
+        if CORPUS_NAME.fullmatch(name) and name in self.names():
+            return os.path.join(self.corpora_root, name)
+        raise UnknownCorpus(name)
+
+    def peek(self, name: str = None):
+        """The corpus if it is loaded (without loading it or marking it as used), else None."""
+        return self._loaded.get(name or DEFAULT_CORPUS)
+
+    def loaded(self) -> list:
+        with self._lock:
+            return list(self._loaded.values())
+
+    def get(self, name: str = None) -> Corpus:
+        """The corpus, loaded first if needed (raises UnknownCorpus)."""
+        name = name or DEFAULT_CORPUS
+        with self._lock:
+            corpus = self._touch(name)
+            if corpus is not None:
+                return corpus
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+        index_root = self.index_root(name)
+
+        # One load per corpus at a time; other requests for it wait for that load
+        with load_lock:
+            with self._lock:
+                corpus = self._touch(name)
+                if corpus is not None:
+                    return corpus
+            size = index_size_bytes(index_root)
+            self._make_room(size)
+            with stage_timer("corpus_load"):
+                corpus = self.loader(name, index_root)
+            corpus.size_bytes = size
+            with self._lock:
+                self._loaded[name] = corpus
+            CORPUS_LOADS.inc(corpus=name)
+            LOADED_CORPUS_BYTES.set(size, corpus=name)
+            print(f"📦 Worker {os.getpid()}: corpus {name} loaded ({size / 2**20:.0f} MB, "
+                  f"{len(self._loaded)} loaded)")
+            return corpus
+
+    def resized(self, corpus: Corpus):
+        """Update the size of a corpus after a hot swap to another index version."""
+        corpus.size_bytes = index_size_bytes(corpus.index_root)
+        LOADED_CORPUS_BYTES.set(corpus.size_bytes, corpus=corpus.name)
+
+    def _touch(self, name):
+        corpus = self._loaded.get(name)
+        if corpus is not None:
+            self._loaded.move_to_end(name)
+            corpus.last_used = time.monotonic()
+        return corpus
+
+    def _make_room(self, size: int):
+        """Unload the least recently used corpora until one of `size` bytes fits the budget."""
+        if not self.memory_budget:
+            return
+        evicted = []
+        with self._lock:
+            while self._loaded and sum(c.size_bytes for c in self._loaded.values()) + size > self.memory_budget:
+                evicted.append(self._loaded.popitem(last=False)[1])
+        for corpus in evicted:
+            self._unload(corpus, "budget")
+        if size > self.memory_budget:
+            logger.warning("Corpus of %d MB larger than the memory budget (%d MB)", size >> 20, self.memory_budget >> 20)
+
+    def evict_idle(self) -> list:
+        """Unload the corpora unused for idle_ttl seconds; returns their names."""
+        if not self.idle_ttl:
+            return []
+        now = time.monotonic()
+        with self._lock:
+            idle = [c for c in self._loaded.values() if now - c.last_used > self.idle_ttl]
+            for corpus in idle:
+                del self._loaded[corpus.name]
+        for corpus in idle:
+            self._unload(corpus, "idle")
+        return [corpus.name for corpus in idle]
+
+    def _unload(self, corpus: Corpus, reason: str):
+        try:
+            corpus.close()
+        except Exception as e:
+            logger.warning("Could not save the caches of corpus %s: %s", corpus.name, e)
+        CORPUS_EVICTIONS.inc(corpus=corpus.name, reason=reason)
+        LOADED_CORPUS_BYTES.set(0, corpus=corpus.name)
+        print(f"♻️ Worker {os.getpid()}: corpus {corpus.name} unloaded ({reason})")
+
+    def close(self):
+        for corpus in self.loaded():
+            corpus.close()
+
+    def stats(self) -> dict:
+        loaded = self.loaded()
+        return {
+            "available": self.names(),
+            "loaded": [c.name for c in loaded],
+            "loaded_mb": round(sum(c.size_bytes for c in loaded) / 2**20, 1),
+            "memory_budget_mb": round(self.memory_budget / 2**20, 1) if self.memory_budget else None,
+            "idle_ttl_s": self.idle_ttl or None,
+        }
@@ -0,0 +1,136 @@
+import re
+import threading
+import time
+import numpy as np
+from collections import OrderedDict
+from sentence_transformers import SentenceTransformer
+
+from model_management.metrics import count_cache
+
+# Process-wide registry: one SentenceTransformer per (model name, device, cache folder, backend, threads)
+_models = {}
+_models_lock = threading.Lock()
+
+
+def get_embedding_model(model_name: str = "all-MiniLM-L6-v2", device: str = None, cache_folder: str = None,
+                        backend: str = "torch", threads: int = None):
+    """
+    Return the shared SentenceTransformer for this model/device/backend, loading it on first use.
+    backend : "torch" (stock model), "onnx" or "onnx_int8" (ONNX Runtime on CPU, see onnx_encoder.py)
+    threads : intra-op threads of the encoder (torch.set_num_threads for torch, which is process-wide)
+    """
+    key = (model_name, device, cache_folder, backend, threads)
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _models_lock:
+        if key not in _models:
+            if backend == "torch":
+                if threads:
+                    import torch
+                    torch.set_num_threads(threads)
+                _models[key] = SentenceTransformer(model_name, device=device, cache_folder=cache_folder)
+            elif backend in ("onnx", "onnx_int8"):
+                from model_management.onnx_encoder import load_onnx_model
+                _models[key] = load_onnx_model(model_name, quantize=backend == "onnx_int8", threads=threads,
+                                               cache_folder=cache_folder)
+            else:
+                raise ValueError(f"Unknown encoder backend: {backend} (torch, onnx or onnx_int8)")
+        return _models[key]
+
+
+def normalize_query(query: str) -> str:
+    """Cache key of a query: lowercased with collapsed whitespace."""
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU cache of query embeddings with time-based expiry.
+    Keys are normalized query texts, values are the encoded vectors.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, created = entry
+                if self.ttl is None or time.monotonic() - created <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class CachedQueryEncoder:
+    """Encodes queries with a shared model, serving repeated questions from a QueryEmbeddingCache."""
+
+    def __init__(self, model, cache: QueryEmbeddingCache = None):
+        self.model = model
+        self.cache = cache if cache is not None else QueryEmbeddingCache()
+
+    def encode(self, query: str):
+        key = normalize_query(query)
+        embedding = self.cache.get(key)
+        count_cache("query_embedding", embedding is not None)
+        if embedding is None:
+            embedding = self.model.encode(key, convert_to_numpy=True, normalize_embeddings=True)
+            embedding.setflags(write=False)
+            self.cache.put(key, embedding)
+        return embedding
+
+    def encode_batch(self, queries):
+        """(n_queries x dim) embeddings, encoding all cache misses in a single model.encode call."""
+        keys = [normalize_query(q) for q in queries]
+        embeddings = [self.cache.get(key) for key in keys]
+        for embedding in embeddings:
+            count_cache("query_embedding", embedding is not None)
+        missing = list(dict.fromkeys(key for key, emb in zip(keys, embeddings) if emb is None))
+
+        if missing:
+            encoded = self.model.encode(missing, convert_to_numpy=True, normalize_embeddings=True)
+            fresh = {}
+            for key, embedding in zip(missing, encoded):
+                embedding.setflags(write=False)
+                self.cache.put(key, embedding)
+                fresh[key] = embedding
+            embeddings = [emb if emb is not None else fresh[key] for key, emb in zip(keys, embeddings)]
+
+        return np.vstack(embeddings).astype(np.float32)
@@ -1,84 +1,425 @@
-import numpy as np
-import faiss
-import json
-import re
-from nltk.tokenize import RegexpTokenizer
-from rank_bm25 import BM25Okapi
-from sentence_transformers import SentenceTransformer
-
-class HybridRetriever:
-    def __init__(self, index_path: str, embeddings_path: str, model_name: str = "all-MiniLM-L6-v2"):
-        self.model = SentenceTransformer(model_name)
-
-        # Loading FAISS
-        try:
-            self.index = faiss.read_index(index_path)
-        except Exception as e:
-            raise RuntimeError(f"Error loading index FAISS : {e}")
-
-        # Loading passages
-        try:
-            with open(embeddings_path, 'r', encoding='utf-8') as f:
-                self.passages = json.load(f)
-        except Exception as e:
-            raise RuntimeError(f"Error loading indexed passages : {e}")
-
-        # tokenizer
-        self.tokenizer = RegexpTokenizer(r"\w+")
-        self.corpus = [self.tokenizer.tokenize(p['text'].lower()) for p in self.passages]
-        self.bm25 = BM25Okapi(self.corpus)
-
-    def retrieve_hybrid(self, query: str, top_k: int = 5, alpha: float = 0.6) -> str:
-        """
-        Hybrid semantic (FAISS) + lexical (BM25) search
-        alpha : weight of semantic search (between 0 and 1)
-        """
-        faiss_results = self.search_faiss(query, top_k=top_k * 2)
-        bm25_results = self.search_bm25(query, top_k=top_k * 2)
-
-        # Score normalization
-        max_faiss = max([s for _, s in faiss_results], default=1e-6)
-        faiss_norm = {i: s / max_faiss for i, s in faiss_results}
-
-        max_bm25 = max([s for _, s in bm25_results], default=1e-6)
-        bm25_norm = {i: s / max_bm25 for i, s in bm25_results}
-
-        # Weighted merger
-        combined_scores = {}
-        for idx in set(faiss_norm.keys()).union(bm25_norm.keys()):
-            combined_scores[idx] = alpha * faiss_norm.get(idx, 0) + (1 - alpha) * bm25_norm.get(idx, 0)
-
-        # Sorting results
-        top_idxs = sorted(combined_scores.items(), key=lambda x: x[1], reverse=True)[:top_k]
-        passages = [self._format_result(self.passages[i], combined_scores[i]) for i, _ in top_idxs]
-        return "\n\n".join(passages) if passages else "Aucune information pertinente trouvée."
-
-    def search_faiss(self, query: str, top_k: int = 10):
-        embedding = self.model.encode(query, convert_to_numpy=True, normalize_embeddings=True)
-        D, I = self.index.search(np.array([embedding]), top_k)
-        return [(idx, float(score)) for score, idx in zip(D[0], I[0]) if idx != -1]
-
-    def search_bm25(self, query: str, top_k: int = 10):
-        tokenized_query = self.tokenizer.tokenize(query.lower())
-        scores = self.bm25.get_scores(tokenized_query)
-        ranked = np.argsort(scores)[::-1][:top_k]
-        return [(idx, float(scores[idx])) for idx in ranked]
-
-    def _format_result(self, passage, score):
-        document = passage.get('document', 'Unspecified')
-        section = passage.get('section', 'Unspecified')
-        subsection = passage.get('subsection', 'Unspecified')
-        page = passage.get('page', 'Unspecified')
-        text = passage.get('text', '')
-        return f"Document: {document}\nPage: {page}\nSection: {section}\nSubsection: {subsection}\nText: {text}\nCombined score: {score:.4f}"
-
-    def highlight_keywords(self, text: str, query: str) -> str:
-        for word in self.tokenizer.tokenize(query):
-            pattern = re.compile(rf"\b({re.escape(word)})\b", re.IGNORECASE)
-            text = pattern.sub(r"\033[1m\1\033[0m", text)
-        return text
-
-
-
-
-
+import os
+import sys
+import numpy as np
+import faiss
+import re
+from nltk.tokenize import RegexpTokenizer
+
+# Add src/ to find model_management when run as a script
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+from model_management.ann_index import read_index_shared, search_parameters, set_search_params
+from model_management.bm25_index import BM25Index, bm25_path_for, tokenize, top_k_indices
+from model_management.embedding_registry import CachedQueryEncoder, QueryEmbeddingCache, get_embedding_model, normalize_query
+from model_management.index_builder import embeddings_path_for
+from model_management.index_versions import load_tombstones
+from model_management.metadata_filter import FilterIndex, MetadataFilter
+from model_management.metrics import count_cache, stage_timer
+from model_management.passage_store import open_passages
+from model_management.section_index import SectionIndex, section_index_path_for
+
+class HybridRetriever:
+    def __init__(self, index_path: str, embeddings_path: str, model_name: str = "all-MiniLM-L6-v2",
+                 bm25_path: str = None, device: str = None,
+                 cache_size: int = 1024, cache_ttl: float = 3600.0,
+                 ef_search: int = None, nprobe: int = None, filter_brute_force_max: int = 10000,
+                 mmap_index: bool = True, encoder_backend: str = "torch", encoder_threads: int = None,
+                 query_cache: QueryEmbeddingCache = None, section_probe: int = None, result_cache_size: int = 0):
+        # Shared model (stock, ONNX or int8 ONNX encoder) + LRU cache of query embeddings
+        # (query_cache: reuse the cache of the retriever this one replaces on an index hot swap)
+        self.model = get_embedding_model(model_name, device=device, backend=encoder_backend, threads=encoder_threads)
+        self.query_encoder = CachedQueryEncoder(
+            self.model, query_cache if query_cache is not None else QueryEmbeddingCache(cache_size, cache_ttl))
+        # LRU cache of retrieve() results, specific to this index version (0: disabled)
+        self.result_cache = QueryEmbeddingCache(result_cache_size, cache_ttl)
+
+        # Loading FAISS (memory-mapped when possible, shared between server workers)
+        try:
+            if mmap_index:
+                self.index, self.index_mode = read_index_shared(index_path)
+            else:
+                self.index, self.index_mode = faiss.read_index(index_path), "memory"
+        except Exception as e:
+            raise RuntimeError(f"Error loading index FAISS : {e}")
+
+        # Runtime ANN parameters (HNSW efSearch, IVF nprobe)
+        set_search_params(self.index, ef_search=ef_search, nprobe=nprobe)
+
+        # Loading passages (memory-mapped PassageStore, or legacy JSON/JSONL metadata)
+        try:
+            self.passages = open_passages(embeddings_path)
+        except Exception as e:
+            raise RuntimeError(f"Error loading indexed passages : {e}")
+
+        # Passages of deleted documents in a live-updated index version (see index_versions.py):
+        # still stored until compaction, never returned
+        self.tombstones = load_tombstones(os.path.dirname(index_path))
+        self._exclusion = None
+
+        # tokenizer
+        self.tokenizer = RegexpTokenizer(r"\w+")
+
+        # Loading BM25 (persisted next to the FAISS index, rebuilt only if missing or stale)
+        self.bm25_path = bm25_path or bm25_path_for(index_path)
+        self.bm25 = self._load_or_build_bm25()
+
+        # Dense matrix for exact hybrid search, memory-mapped or reconstructed on first use
+        self.dense_path = embeddings_path_for(index_path)
+        self._dense_matrix = None
+
+        # Metadata filters: id bitmaps built on first use; filters selecting at most
+        # filter_brute_force_max passages are scored directly on their vectors instead of FAISS
+        self.filter_brute_force_max = filter_brute_force_max
+        self._filter_index = None
+
+        # Coarse-to-fine search: score the document sections first (section_index.npz) and only the
+        # passages of the section_probe best ones; None or 0 searches every passage
+        self.section_probe = section_probe
+        self.section_index_path = section_index_path_for(index_path)
+        self._section_index = None
+
+    def _load_or_build_bm25(self) -> BM25Index:
+        if os.path.exists(self.bm25_path):
+            try:
+                bm25 = BM25Index.load(self.bm25_path)
+                if bm25.num_docs == len(self.passages):
+                    return bm25
+                print("⚠️ BM25 index does not match the passages, rebuilding it.")
+            except Exception as e:
+                print(f"⚠️ Error loading BM25 index ({e}), rebuilding it.")
+
+        bm25 = BM25Index.build((tokenize(p['text']) for p in self.passages), deleted=self.tombstones)
+        try:
+            bm25.save(self.bm25_path)
+        except OSError as e:
+            print(f"⚠️ Could not save BM25 index : {e}")
+        return bm25
+
+    def retrieve_hybrid(self, query: str, top_k: int = 5, alpha: float = 0.6, exact: bool = False,
+                        filters=None) -> str:
+        """
+        Hybrid semantic (FAISS) + lexical (BM25) search
+        alpha : weight of semantic search (between 0 and 1)
+        exact : fuse dense and BM25 scores over the whole corpus instead of the two top-2k lists
+        filters : MetadataFilter (or dict of its arguments) restricting the searched passages
+        """
+        return self.format_results(self.retrieve(query, top_k=top_k, alpha=alpha, exact=exact, filters=filters))
+
+    def retrieve(self, query: str, top_k: int = 5, alpha: float = 0.6, exact: bool = False, filters=None):
+        """
+        Same search as retrieve_hybrid, returned as (passage_id, combined_score) pairs.
+        With section_probe set, passages are only searched in the best sections (exact searches all of them).
+        Repeated searches are served from result_cache when it is enabled.
+        """
+        if not self.result_cache.max_size:
+            return self._retrieve(query, top_k, alpha, exact, filters)
+        metadata_filter = MetadataFilter.from_dict(filters)
+        key = (normalize_query(query), top_k, alpha, exact, metadata_filter.key() if metadata_filter is not None else None)
+        results = self.result_cache.get(key)
+        count_cache("retrieval", results is not None)
+        if results is None:
+            results = tuple(self._retrieve(query, top_k, alpha, exact, metadata_filter))
+            self.result_cache.put(key, results)
+        return list(results)
+
+    def _retrieve(self, query: str, top_k: int, alpha: float, exact: bool, filters):
+        selection = self.resolve_filter(filters)
+        if selection is not None and selection[0].size == 0:
+            return []
+        ids = selection[0] if selection is not None else None
+        if exact:
+            return self.search_exact_hybrid(query, top_k=top_k, alpha=alpha, ids=ids)
+        if self.section_probe:
+            with stage_timer("encode"):
+                embedding = self.encode_query(query)
+            selection = self.probe_sections(embedding, tokenize(query), selection, alpha)
+            ids = selection[0]
+            if ids.size == 0:
+                return []
+
+        faiss_results = self.search_faiss(query, top_k=top_k * 2, selection=selection)
+        bm25_results = self.search_bm25(query, top_k=top_k * 2, ids=ids)
+        with stage_timer("fusion"):
+            fused = self._fuse(faiss_results, bm25_results, top_k, alpha)
+        return [(idx, score) for idx, score, _, _ in fused]
+
+    @staticmethod
+    def _fuse(faiss_results, bm25_results, top_k: int, alpha: float):
+        """Weighted fusion of max-normalized scores: [(passage_id, combined, dense, bm25)] best first."""
+        # Score normalization
+        max_faiss = max([s for _, s in faiss_results], default=1e-6)
+        faiss_norm = {i: s / max_faiss for i, s in faiss_results}
+
+        max_bm25 = max([s for _, s in bm25_results], default=1e-6) or 1e-6
+        bm25_norm = {i: s / max_bm25 for i, s in bm25_results}
+
+        # Weighted merger
+        combined_scores = {}
+        for idx in set(faiss_norm.keys()).union(bm25_norm.keys()):
+            combined_scores[idx] = alpha * faiss_norm.get(idx, 0) + (1 - alpha) * bm25_norm.get(idx, 0)
+
+        # Sorting results
+        dense, lexical = dict(faiss_results), dict(bm25_results)
+        top_idxs = sorted(combined_scores.items(), key=lambda x: x[1], reverse=True)[:top_k]
+        return [(idx, score, dense.get(idx), lexical.get(idx)) for idx, score in top_idxs]
+
+    def search_batch(self, queries, top_k: int = 5, alpha: float = 0.6, exact: bool = False, filters=None):
+        """
+        Hybrid search for several queries at once: one encode call, one FAISS search and one
+        BM25 score matrix. Returns, per query, a list of structured hits (see make_hit).
+        filters : one MetadataFilter (or dict) applied to every query
+        """
+        if not queries:
+            return []
+        selection = self.resolve_filter(filters)
+        if selection is not None and selection[0].size == 0:
+            return [[] for _ in queries]
+        ids = selection[0] if selection is not None else None
+        with stage_timer("encode"):
+            embeddings = self.query_encoder.encode_batch(queries)
+        token_lists = [tokenize(q) for q in queries]
+
+        if exact:
+            with stage_timer("dense_exact"):
+                dense = (self.dense_matrix() if ids is None else self.dense_matrix()[ids]) @ embeddings.T
+            with stage_timer("bm25"):
+                if ids is None:
+                    lexical = self.bm25.get_scores_batch(token_lists).toarray().T
+                else:
+                    lexical = np.stack([self.bm25.get_scores_subset(tokens, ids) for tokens in token_lists], axis=1)
+            results = []
+            with stage_timer("fusion"):
+                for q in range(len(queries)):
+                    fused = self._fuse_exact(dense[:, q], lexical[:, q], top_k, alpha,
+                                             exclude=self.tombstones if ids is None else None)
+                    results.append([self.make_hit(i if ids is None else ids[i], s, float(dense[i, q]),
+                                                  float(lexical[i, q])) for i, s in fused])
+            return results
+
+        if self.section_probe:
+            # Each query searches the passages of its own best sections
+            results = []
+            for q, tokens in enumerate(token_lists):
+                probed = self.probe_sections(embeddings[q], tokens, selection, alpha)
+                with stage_timer("faiss"):
+                    D, I = self._dense_search(embeddings[q:q + 1], top_k * 2, probed)
+                with stage_timer("bm25"):
+                    bm25_results = self.bm25.search(tokens, top_k=top_k * 2, ids=probed[0])
+                with stage_timer("fusion"):
+                    faiss_results = [(int(idx), float(score)) for score, idx in zip(D[0], I[0]) if idx != -1]
+                    fused = self._fuse(faiss_results, bm25_results, top_k, alpha)
+                    results.append([self.make_hit(*hit) for hit in fused])
+            return results
+
+        with stage_timer("faiss"):
+            D, I = self._dense_search(embeddings, top_k * 2, selection)
+        with stage_timer("bm25"):
+            bm25_results = self.bm25.search_batch(token_lists, top_k=top_k * 2, ids=ids)
+        results = []
+        with stage_timer("fusion"):
+            for q in range(len(queries)):
+                faiss_results = [(int(idx), float(score)) for score, idx in zip(D[q], I[q]) if idx != -1]
+                fused = self._fuse(faiss_results, bm25_results[q], top_k, alpha)
+                results.append([self.make_hit(*hit) for hit in fused])
+        return results
+
+    def make_hit(self, passage_id: int, score: float, dense_score: float = None, bm25_score: float = None) -> dict:
+        """Structured search result: passage metadata with combined and per-source scores."""
+        passage = self.passages[passage_id]
+        return {
+            "passage_id": int(passage_id),
+            "document": passage.get('document', 'Unspecified'),
+            "page": passage.get('page', 'Unspecified'),
+            "section": passage.get('section', 'Unspecified'),
+            "subsection": passage.get('subsection', 'Unspecified'),
+            "text": passage.get('text', ''),
+            "score": float(score),
+            "dense_score": dense_score,
+            "bm25_score": bm25_score,
+        }
+
+    def format_results(self, results) -> str:
+        with stage_timer("format"):
+            passages = [self._format_result(self.passages[i], score) for i, score in results]
+        return "\n\n".join(passages) if passages else "Aucune information pertinente trouvée."
+
+    def encode_query(self, query: str) -> np.ndarray:
+        """Normalized query embedding, served from the cache for repeated questions."""
+        return self.query_encoder.encode(query)
+
+    def search_faiss(self, query: str, top_k: int = 10, selection=None):
+        with stage_timer("encode"):
+            embedding = self.encode_query(query)
+        with stage_timer("faiss"):
+            D, I = self._dense_search(np.array([embedding]), top_k, selection)
+        return [(int(idx), float(score)) for score, idx in zip(D[0], I[0]) if idx != -1]
+
+    def search_bm25(self, query: str, top_k: int = 10, ids: np.ndarray = None):
+        with stage_timer("bm25"):
+            return self.bm25.search(tokenize(query), top_k=top_k, ids=ids)
+
+    def search_exact_hybrid(self, query: str, top_k: int = 5, alpha: float = 0.6, ids: np.ndarray = None):
+        """Dense and BM25 scores of every passage (or of the filtered ids) fused in one vectorized pass."""
+        with stage_timer("encode"):
+            embedding = self.encode_query(query)
+        with stage_timer("dense_exact"):
+            matrix = self.dense_matrix() if ids is None else self.dense_matrix()[ids]
+            dense = matrix @ embedding.astype(np.float32)
+        with stage_timer("bm25"):
+            tokens = tokenize(query)
+            lexical = self.bm25.get_scores(tokens) if ids is None else self.bm25.get_scores_subset(tokens, ids)
+        with stage_timer("fusion"):
+            fused = self._fuse_exact(dense, lexical, top_k, alpha, exclude=self.tombstones if ids is None else None)
+        return fused if ids is None else [(int(ids[i]), score) for i, score in fused]
+
+    def filter_index(self) -> FilterIndex:
+        if self._filter_index is None:
+            self._filter_index = FilterIndex(self.passages, deleted=self.tombstones)
+        return self._filter_index
+
+    def resolve_filter(self, filters):
+        """(sorted passage ids, packed id bitmap) selected by a filter, or None for no filter."""
+        metadata_filter = MetadataFilter.from_dict(filters)
+        if metadata_filter is None:
+            return None
+        with stage_timer("filter"):
+            return self.filter_index().resolve(metadata_filter)
+
+    def section_index(self) -> SectionIndex:
+        """Section centroids and BM25 (built at indexing time; derived from the passage indexes if missing or stale)."""
+        if self._section_index is None:
+            if os.path.exists(self.section_index_path):
+                try:
+                    sections = SectionIndex.load(self.section_index_path)
+                    if len(sections.section_of) == len(self.passages):
+                        self._section_index = sections
+                        return sections
+                    print("⚠️ Section index does not match the passages, rebuilding it.")
+                except Exception as e:
+                    print(f"⚠️ Error loading section index ({e}), rebuilding it.")
+            bm25 = BM25Index.load(self.bm25_path, with_tf=True)
+            if bm25.tf is None:
+                bm25 = BM25Index.build((tokenize(p['text']) for p in self.passages), deleted=self.tombstones)
+            sections = SectionIndex.build(self.passages, self.dense_matrix(), bm25, deleted=self.tombstones)
+            try:
+                sections.save(self.section_index_path)
+            except OSError as e:
+                print(f"⚠️ Could not save section index : {e}")
+            self._section_index = sections
+        return self._section_index
+
+    def probe_sections(self, embedding: np.ndarray, tokens, selection=None, alpha: float = 0.6):
+        """
+        Coarse level: selection (sorted passage ids, packed bitmap or None) of the passages of the
+        section_probe best sections for a query, within a filter selection if one is given.
+        """
+        sections = self.section_index()
+        with stage_timer("sections"):
+            candidates = sections.sections_of(selection[0]) if selection is not None else None
+            ids = sections.passages_of(sections.probe(embedding, tokens, self.section_probe, alpha, candidates))
+            if selection is not None:
+                ids = np.intersect1d(ids, selection[0], assume_unique=True)
+            # The bitmap is only used when the probed passages are too many to score directly
+            bitmap = None
+            if ids.size > self.filter_brute_force_max:
+                mask = np.zeros(len(self.passages), dtype=bool)
+                mask[ids] = True
+                bitmap = np.packbits(mask, bitorder="little")
+        return ids, bitmap
+
+    def _dense_search(self, embeddings: np.ndarray, top_k: int, selection=None):
+        """
+        FAISS search, optionally restricted to a filter selection. Narrow selections are scored
+        exactly on their own vectors (cheaper than the full index); wider ones are pushed into
+        FAISS as an IDSelectorBitmap so only selected ids are returned.
+        """
+        if selection is None:
+            params = self._exclusion_parameters()
+            return self.index.search(embeddings, top_k, params=params) if params is not None \
+                else self.index.search(embeddings, top_k)
+
+        ids, bitmap = selection
+        if ids.size <= self.filter_brute_force_max:
+            scores = embeddings @ self.dense_matrix()[ids].T
+            D = np.full((len(embeddings), top_k), -np.inf, dtype=np.float32)
+            I = np.full((len(embeddings), top_k), -1, dtype=np.int64)
+            for q in range(len(embeddings)):
+                order = top_k_indices(scores[q], top_k)
+                D[q, :len(order)] = scores[q, order]
+                I[q, :len(order)] = ids[order]
+            return D, I
+
+        selector = faiss.IDSelectorBitmap(bitmap.size, faiss.swig_ptr(bitmap))
+        return self.index.search(embeddings, top_k, params=search_parameters(self.index, selector))
+
+    def _exclusion_parameters(self):
+        """
+        SearchParameters skipping tombstoned passages, for ANN indexes that still hold their vectors
+        (id-mapped flat indexes have them removed); None when there is nothing to skip.
+        """
+        if self.tombstones.size == 0 or isinstance(faiss.downcast_index(self.index), faiss.IndexIDMap2):
+            return None
+        if self._exclusion is None:
+            bitmap = np.zeros((len(self.passages) + 7) // 8, dtype=np.uint8)
+            np.bitwise_or.at(bitmap, self.tombstones >> 3, (1 << (self.tombstones & 7)).astype(np.uint8))
+            deleted = faiss.IDSelectorBitmap(bitmap.size, faiss.swig_ptr(bitmap))
+            selector = faiss.IDSelectorNot(deleted)
+            # The bitmap and selectors are referenced by the parameters: kept alive together
+            self._exclusion = (bitmap, deleted, selector, search_parameters(self.index, selector))
+        return self._exclusion[-1]
+
+    @staticmethod
+    def _fuse_exact(dense: np.ndarray, lexical: np.ndarray, top_k: int, alpha: float, exclude: np.ndarray = None):
+        """exclude : passage ids (tombstones) left out of the normalization and of the results"""
+        if exclude is not None and exclude.size:
+            dense = dense.copy()
+            dense[exclude] = 0.0
+        combined = alpha * dense / max(float(dense.max(initial=0.0)), 1e-6) \
+            + (1 - alpha) * lexical / max(float(lexical.max(initial=0.0)), 1e-6)
+        if exclude is not None and exclude.size:
+            combined[exclude] = -np.inf
+        return [(int(i), float(combined[i])) for i in top_k_indices(combined, top_k) if combined[i] != -np.inf]
+
+    def dense_matrix(self) -> np.ndarray:
+        """All passage vectors (n_passages x dim): the memory-mapped embeddings.npy, else reconstructed from FAISS."""
+        if self._dense_matrix is None:
+            if os.path.exists(self.dense_path):
+                matrix = np.load(self.dense_path, mmap_mode="r")
+                if matrix.shape[0] == len(self.passages):
+                    self._dense_matrix = matrix
+            if self._dense_matrix is None:
+                self._dense_matrix = self.index.reconstruct_n(0, self.index.ntotal)
+        return self._dense_matrix
+
+    def _format_result(self, passage, score):
+        document = passage.get('document', 'Unspecified')
+        section = passage.get('section', 'Unspecified')
+        subsection = passage.get('subsection', 'Unspecified')
+        page = passage.get('page', 'Unspecified')
+        text = passage.get('text', '')
+        return f"Document: {document}\nPage: {page}\nSection: {section}\nSubsection: {subsection}\nText: {text}\nCombined score: {score:.4f}"
+
+    def highlight_keywords(self, text: str, query: str) -> str:
+        for word in self.tokenizer.tokenize(query):
+            pattern = re.compile(rf"\b({re.escape(word)})\b", re.IGNORECASE)
+            text = pattern.sub(r"\033[1m\1\033[0m", text)
+        return text
+
+# EXECUTION ENTRY POINT (retrieval smoke test on the built index)
+
+if __name__ == "__main__":
+    import time
+    from model_management.passage_store import resolve_passages_path
+
+    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+    index_dir = os.path.join(project_root, 'models', 'index', 'index_files')
+    question = " ".join(sys.argv[1:]) or "que faire en cas d'hémorragie ?"
+
+    start = time.perf_counter()
+    retriever = HybridRetriever(index_path=os.path.join(index_dir, 'faiss_index'),
+                                embeddings_path=resolve_passages_path(index_dir))
+    print(f"Loaded {len(retriever.passages)} passages in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    results = retriever.retrieve(question)
+    print(f"Query: {question} ({(time.perf_counter() - start) * 1000:.1f} ms)\n")
+    print(retriever.format_results(results))
@@ -1,75 +1,84 @@
-import os
-import json
-import faiss
-import numpy as np
-from sklearn.preprocessing import normalize
-from sentence_transformers import SentenceTransformer
-
-
-class HybridVectorStore:
-    def __init__(self,
-                 model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
-                 model_cache_dir: str = "./models/embeddings",
-                 index_file: str = "./models/index/index_files/faiss_index",
-                 metadata_file: str = "./models/index/index_files/metadata_passages.json"):
-
-        self.model_path = os.path.join(model_cache_dir, model_name)
-        os.makedirs(self.model_path, exist_ok=True)
-
-        self.model = SentenceTransformer(model_name, cache_folder=self.model_path)
-        self.index_file = index_file
-        self.metadata_file = metadata_file
-        self.index = None
-        self.passages = []
-
-    def build_index(self, passages: list):
-        """
-        Build and save a FAISS index from a list of structured passages.
-        Each passage must include a 'text' field (and ideally: page, section, etc.)
-        """
-        print(f"📦 Received {len(passages)} passages for indexing.")
-        texts = [p["text"] for p in passages]
-        embeddings = self.model.encode(texts, convert_to_numpy=True)
-        embeddings = normalize(embeddings, axis=1)
-
-        dim = embeddings.shape[1]
-        self.index = faiss.IndexFlatIP(dim)
-        self.index.add(embeddings)
-        self.passages = passages
-
-        self.save_index()
-        print("✅ FAISS index and metadata saved.")
-
-    def save_index(self):
-        """Save FAISS index and enriched metadata (JSON format)."""
-        os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
-        faiss.write_index(self.index, self.index_file)
-
-        with open(self.metadata_file, "w", encoding="utf-8") as f:
-            json.dump(self.passages, f, ensure_ascii=False, indent=2)
-
-    def load_index(self):
-        """Load a FAISS index and associated passage metadata."""
-        if not os.path.exists(self.index_file) or not os.path.exists(self.metadata_file):
-            raise FileNotFoundError("❌ FAISS index or metadata JSON not found.")
-
-        self.index = faiss.read_index(self.index_file)
-        with open(self.metadata_file, "r", encoding="utf-8") as f:
-            self.passages = json.load(f)
-        print(f"📂 Loaded index and {len(self.passages)} passages.")
-
-    def search(self, query: str, top_k: int = 5):
-        """Semantic search with FAISS and return top_k passages."""
-        if self.index is None:
-            raise RuntimeError("⚠️ FAISS index is not loaded. Run load_index() or build_index() first.")
-
-        query_embedding = self.model.encode(query, convert_to_numpy=True)
-        query_embedding = normalize([query_embedding], axis=1)
-        D, I = self.index.search(query_embedding, top_k)
-
-        results = []
-        for idx in I[0]:
-            if 0 <= idx < len(self.passages):
-                results.append(self.passages[idx])
-        return results
-
+import os
+import sys
+import faiss
+import numpy as np
+from sklearn.preprocessing import normalize
+
+# Add src/ to find model_management when run as a script
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+from model_management.bm25_index import BM25Index, bm25_path_for, tokenize
+from model_management.embedding_registry import get_embedding_model
+from model_management.index_builder import build_streaming_index, model_encoder, open_metadata_writer
+from model_management.passage_store import open_passages
+
+
+class HybridVectorStore:
+    def __init__(self,
+                 model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+                 model_cache_dir: str = "./models/embeddings",
+                 index_file: str = "./models/index/index_files/faiss_index",
+                 metadata_file: str = "./models/index/index_files/passage_store",
+                 index_type: str = "flat", encoder_backend: str = "torch", encoder_threads: int = None,
+                 **index_options):
+
+        self.model_path = os.path.join(model_cache_dir, model_name)
+        os.makedirs(self.model_path, exist_ok=True)
+
+        self.model = get_embedding_model(model_name, cache_folder=self.model_path, backend=encoder_backend,
+                                         threads=encoder_threads)
+        self.index_file = index_file
+        self.metadata_file = metadata_file
+        self.index_type = index_type
+        self.index_options = index_options
+        self.index = None
+        self.passages = []
+
+    def build_index(self, passages, batch_size: int = 256):
+        """
+        Build and save a FAISS index from structured passages (a list or any iterable).
+        Each passage must include a 'text' field (and ideally: page, section, etc.)
+        Passages are encoded and indexed batch by batch with the shared streaming pipeline.
+        """
+        total = build_streaming_index(passages, model_encoder(self.model), self.index_file, self.metadata_file,
+                                      batch_size=batch_size, index_type=self.index_type, **self.index_options)
+        print(f"📦 Indexed {total} passages.")
+        self.load_index()
+        print("✅ FAISS index and metadata saved.")
+
+    def save_index(self):
+        """Save FAISS index, BM25 index and enriched metadata (passage store or line-delimited JSON)."""
+        os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+        faiss.write_index(self.index, self.index_file)
+        BM25Index.build(tokenize(p["text"]) for p in self.passages).save(bm25_path_for(self.index_file))
+
+        # Materialize first: the writer replaces the passage store that may be backing self.passages
+        passages = list(self.passages)
+        writer = open_metadata_writer(self.metadata_file)
+        for passage in passages:
+            writer.append(passage)
+        writer.close()
+
+    def load_index(self):
+        """Load a FAISS index and associated passage metadata."""
+        if not os.path.exists(self.index_file) or not os.path.exists(self.metadata_file):
+            raise FileNotFoundError("❌ FAISS index or passage metadata not found.")
+
+        self.index = faiss.read_index(self.index_file)
+        self.passages = open_passages(self.metadata_file)
+        print(f"📂 Loaded index and {len(self.passages)} passages.")
+
+    def search(self, query: str, top_k: int = 5):
+        """Semantic search with FAISS and return top_k passages."""
+        if self.index is None:
+            raise RuntimeError("⚠️ FAISS index is not loaded. Run load_index() or build_index() first.")
+
+        query_embedding = self.model.encode(query, convert_to_numpy=True)
+        query_embedding = normalize([query_embedding], axis=1)
+        D, I = self.index.search(query_embedding, top_k)
+
+        results = []
+        for idx in I[0]:
+            if 0 <= idx < len(self.passages):
+                results.append(self.passages[idx])
+        return results
+
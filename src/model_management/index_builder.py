@@ -0,0 +1,179 @@
+import os
+import sys
+import json
+import struct
+import faiss
+import numpy as np
+
+# Add src/ to find model_management when run as a script
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+from model_management.ann_index import build_from_matrix, index_type_of
+from model_management.bm25_index import BM25Builder, bm25_path_for, tokenize
+from model_management.passage_store import PassageStore, PassageStoreWriter
+from model_management.section_index import SectionBuilder, section_index_path_for
+
+# Fixed-size .npy header so it can be rewritten in place once the row count is known
+_NPY_HEADER_SIZE = 128
+
+
+def embeddings_path_for(index_path: str) -> str:
+    """Normalized passage embeddings (.npy) stored next to the FAISS index."""
+    return os.path.join(os.path.dirname(index_path), "embeddings.npy")
+
+
+def iter_batches(items, batch_size: int):
+    """Groups any iterable into lists of at most batch_size items."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_passages_file(path: str):
+    """Streams passages from a PassageStore directory, line-delimited metadata (.jsonl) or a legacy JSON list."""
+    if os.path.isdir(path):
+        yield from PassageStore(path)
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(f)
+
+
+class JsonlWriter:
+    """Line-delimited JSON metadata writer (same interface as PassageStoreWriter)."""
+
+    def __init__(self, path: str):
+        self._file = open(path, "w", encoding="utf-8")
+
+    def append(self, passage: dict):
+        self._file.write(json.dumps(passage, ensure_ascii=False) + "\n")
+
+    def close(self):
+        self._file.close()
+
+
+def open_metadata_writer(path: str):
+    """PassageStoreWriter for a directory path, JsonlWriter for a .json/.jsonl file path."""
+    if path.endswith((".json", ".jsonl")):
+        return JsonlWriter(path)
+    return PassageStoreWriter(path)
+
+
+class EmbeddingSpill:
+    """Appends float32 rows to a .npy file that can later be opened with np.load(mmap_mode='r')."""
+
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.dim = dim
+        self.rows = 0
+        self._file = open(path, "wb")
+        self._write_header()
+
+    def _write_header(self):
+        header = repr({"descr": "<f4", "fortran_order": False, "shape": (self.rows, self.dim)}).encode("latin1")
+        padding = _NPY_HEADER_SIZE - 10 - len(header) - 1
+        self._file.write(b"\x93NUMPY\x01\x00" + struct.pack("<H", _NPY_HEADER_SIZE - 10)
+                         + header + b" " * padding + b"\n")
+
+    def append(self, vectors: np.ndarray):
+        self._file.write(np.ascontiguousarray(vectors, dtype="<f4").tobytes())
+        self.rows += vectors.shape[0]
+
+    def close(self):
+        self._file.seek(0)
+        self._write_header()
+        self._file.close()
+
+
+def encode_batches(passages, encode_fn, batch_size: int = 256):
+    """
+    Yields (passages, embeddings) batches, with embeddings L2-normalized in place.
+    encode_fn maps a list of texts to a float array (e.g. a SentenceTransformer.encode wrapper).
+    """
+    for batch in iter_batches((p for p in passages if p.get("text")), batch_size):
+        embeddings = np.ascontiguousarray(encode_fn([p["text"] for p in batch]), dtype=np.float32)
+        faiss.normalize_L2(embeddings)
+        yield batch, embeddings
+
+
+def model_encoder(model, batch_size: int = 64):
+    """encode_fn for a SentenceTransformer model."""
+    return lambda texts: model.encode(texts, batch_size=batch_size, convert_to_numpy=True)
+
+
+def build_streaming_index(passages, encode_fn, index_output_path: str, metadata_output_path: str,
+                          batch_size: int = 256, spill_embeddings: bool = True,
+                          index_type: str = "flat", **index_options) -> int:
+    """
+    Streaming build of the hybrid index: passages -> batch-encode -> normalize in place ->
+    FAISS index (+ memory-mapped embeddings.npy), with BM25 postings and passage metadata
+    (PassageStore directory, or line-delimited JSON for a .jsonl path) written as batches go. Peak memory beyond the index itself is one batch.
+    The section index (centroids and BM25 of each document section) is derived from them at the end.
+    Flat indexes are filled as batches arrive; ANN indexes (see ann_index.INDEX_TYPES) are
+    trained and filled from the memory-mapped spill once all passages are encoded.
+    Returns the number of indexed passages.
+    """
+    os.makedirs(os.path.dirname(index_output_path), exist_ok=True)
+    spill_embeddings = spill_embeddings or index_type != "flat"
+    index = None
+    spill = None
+    bm25 = BM25Builder()
+    sections = SectionBuilder()
+    count = 0
+
+    metadata_writer = open_metadata_writer(metadata_output_path)
+    try:
+        for batch, embeddings in encode_batches(passages, encode_fn, batch_size):
+            if index is None and spill is None:
+                if index_type == "flat":
+                    index = faiss.IndexFlatIP(embeddings.shape[1])
+                if spill_embeddings:
+                    spill = EmbeddingSpill(embeddings_path_for(index_output_path), embeddings.shape[1])
+
+            if index is not None:
+                index.add(embeddings)
+            if spill is not None:
+                spill.append(embeddings)
+
+            for passage in batch:
+                bm25.add(tokenize(passage["text"]))
+                sections.add(passage)
+                metadata_writer.append(passage)
+
+            count += len(batch)
+            print(f"  indexed {count} passages", end="\r")
+    finally:
+        metadata_writer.close()
+
+    if spill is not None:
+        spill.close()
+    if count == 0:
+        raise ValueError("No passage with text to index.")
+
+    if index is None:
+        print(f"\nTraining and filling {index_type} index...")
+        index = build_from_matrix(np.load(spill.path, mmap_mode="r"), index_type, **index_options)
+
+    faiss.write_index(index, index_output_path)
+    print(f"\nFAISS index ({index_type_of(index)}) saved to: {index_output_path}")
+
+    bm25_output_path = bm25_path_for(index_output_path)
+    bm25_index = bm25.build()
+    bm25_index.save(bm25_output_path)
+    print(f"BM25 index saved to: {bm25_output_path}")
+
+    matrix = np.load(spill.path, mmap_mode="r") if spill is not None else index.reconstruct_n(0, index.ntotal)
+    section_output_path = section_index_path_for(index_output_path)
+    section_index = sections.build(matrix, bm25_index)
+    section_index.save(section_output_path)
+    print(f"Section index ({section_index.num_sections} sections) saved to: {section_output_path}")
+    print(f"✅ Metadata saved to: {metadata_output_path}")
+    return count
@@ -0,0 +1,308 @@
+import os
+import sys
+import json
+import time
+import shutil
+import faiss
+import numpy as np
+from contextlib import contextmanager
+
+# Add src/ to find model_management when run as a script
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+from model_management.ann_index import build_from_matrix
+from model_management.bm25_index import BM25Index, bm25_path_for, tokenize
+from model_management.index_builder import EmbeddingSpill, embeddings_path_for
+from model_management.passage_store import PassageStore, PassageStoreWriter, open_passages, resolve_passages_path
+from model_management.section_index import SectionIndex, section_index_path_for
+
+# Versioned index snapshots, next to the base index built by hybrid_data_process.py:
+#   index_files/                 base index (faiss_index, bm25_index.npz, section_index.npz, embeddings.npy, passage_store/)
+#   index_files/versions/vNNNNNN/  same files + tombstones.npy and manifest.json
+#   index_files/CURRENT          name of the live version (absent: the base index is live)
+# A version is written in full under a temporary name, renamed, then published by replacing
+# CURRENT atomically, so readers only ever see complete snapshots.
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+MANIFEST_FILE = "manifest.json"
+TOMBSTONES_FILE = "tombstones.npy"
+LOCK_FILE = "update.lock"
+
+_INDEX_TYPE_NAMES = {"IndexFlat": "flat", "IndexFlatIP": "flat", "IndexHNSWFlat": "hnsw", "IndexHNSWSQ": "hnsw_sq8",
+                     "IndexIVFFlat": "ivf_flat", "IndexIVFScalarQuantizer": "ivf_sq8", "IndexIVFPQ": "ivf_pq"}
+
+
+def current_version(index_root: str):
+    """Name of the published version, or None when the base index is live."""
+    try:
+        with open(os.path.join(index_root, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def resolve_index_dir(index_root: str, version: str = None) -> str:
+    """Directory of a version (default: the published one; the base index when none is)."""
+    version = version or current_version(index_root)
+    return os.path.join(index_root, VERSIONS_DIR, version) if version else index_root
+
+
+def index_version(index_root: str) -> str:
+    """Identifier of the live index: the published version, else size/mtime of the base FAISS file."""
+    version = current_version(index_root)
+    if version:
+        return version
+    try:
+        st = os.stat(os.path.join(index_root, "faiss_index"))
+        return f"base@{st.st_size}:{st.st_mtime_ns}"
+    except FileNotFoundError:
+        return "base"
+
+
+def publish_version(index_root: str, version: str):
+    """Make a version live by atomically replacing the CURRENT pointer."""
+    if not os.path.isdir(resolve_index_dir(index_root, version)):
+        raise FileNotFoundError(f"Index version not found: {version}")
+    tmp_path = os.path.join(index_root, f"{CURRENT_FILE}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(index_root, CURRENT_FILE))
+
+
+def unpublish_versions(index_root: str):
+    """Make the base index live again (after a full rebuild), keeping the versions on disk."""
+    try:
+        os.remove(os.path.join(index_root, CURRENT_FILE))
+        print("ℹ️ Full rebuild: the base index is live again (live-updated versions are no longer used).")
+    except FileNotFoundError:
+        pass
+
+
+def list_versions(index_root: str) -> list:
+    versions_dir = os.path.join(index_root, VERSIONS_DIR)
+    if not os.path.isdir(versions_dir):
+        return []
+    return sorted(name for name in os.listdir(versions_dir)
+                  if name.startswith("v") and not name.endswith(".tmp") and os.path.isdir(os.path.join(versions_dir, name)))
+
+
+def prune_versions(index_root: str, keep: int = 3):
+    """Delete old versions, keeping the last `keep` ones and the published one (kept for rollback)."""
+    current = current_version(index_root)
+    for version in list_versions(index_root)[:-keep] if keep > 0 else list_versions(index_root):
+        if version != current:
+            # Workers still serving it keep their open/mapped files (POSIX); skipped if the OS refuses
+            shutil.rmtree(resolve_index_dir(index_root, version), ignore_errors=True)
+
+
+def load_manifest(version_dir: str) -> dict:
+    path = os.path.join(version_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_base_manifest(index_root: str, index_type: str = "flat", index_options: dict = None, **settings):
+    """
+    Manifest of a full build (model, encoder backend, chunking, FAISS index type and build options),
+    so that live updates encode and chunk new passages the same way and compaction rebuilds the same index.
+    """
+    manifest = dict(settings, version="base", created=time.strftime("%Y-%m-%dT%H:%M:%S"), index_type=index_type,
+                    index_options={k: v for k, v in (index_options or {}).items() if v is not None})
+    tmp_path = os.path.join(index_root, f"{MANIFEST_FILE}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, os.path.join(index_root, MANIFEST_FILE))
+
+
+def load_tombstones(version_dir: str) -> np.ndarray:
+    """Sorted ids of the deleted passages of a version (empty for the base index)."""
+    path = os.path.join(version_dir, TOMBSTONES_FILE)
+    if not os.path.exists(path):
+        return np.empty(0, dtype=np.int64)
+    return np.load(path).astype(np.int64)
+
+
+@contextmanager
+def update_lock(index_root: str):
+    """Exclusive lock (a lock file) so that a single process writes versions at a time."""
+    path = os.path.join(index_root, LOCK_FILE)
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        raise RuntimeError(f"Another index update is running (delete {path} if it crashed).")
+    try:
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        yield
+    finally:
+        os.remove(path)
+
+
+def infer_index_type(index) -> str:
+    """Index type (see ann_index.INDEX_TYPES) of a loaded index, looking through an id map."""
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
+    return _INDEX_TYPE_NAMES.get(type(index).__name__, "flat")
+
+
+def infer_index_options(index) -> dict:
+    """Build options (ann_index.build_from_matrix) read back from a loaded index without them in its manifest."""
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexHNSW):
+        return {"hnsw_m": int(index.hnsw.nb_neighbors(1))}
+    if isinstance(index, faiss.IndexIVF):
+        options = {"nlist": int(index.nlist)}
+        if isinstance(index, faiss.IndexIVFPQ):
+            options["pq_m"] = int(index.pq.M)
+        return options
+    return {}
+
+
+def id_mapped_flat(embeddings: np.ndarray, ids: np.ndarray = None, batch_size: int = 65_536):
+    """
+    Flat inner-product index wrapped in an IndexIDMap2: FAISS labels are passage ids, so vectors
+    can be removed in place without shifting the ids of the others.
+    """
+    index = faiss.IndexIDMap2(faiss.IndexFlatIP(embeddings.shape[1]))
+    ids = np.arange(embeddings.shape[0], dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64)
+    for start in range(0, embeddings.shape[0], batch_size):
+        index.add_with_ids(np.ascontiguousarray(embeddings[start:start + batch_size], dtype=np.float32),
+                           ids[start:start + batch_size])
+    return index
+
+
+def _document_rows(passages, documents) -> np.ndarray:
+    """Row ids of the passages of the given documents."""
+    documents = set(documents)
+    if not documents:
+        return np.empty(0, dtype=np.int64)
+    if isinstance(passages, PassageStore):
+        document_ids = [i for i, name in enumerate(passages.documents) if name in documents]
+        return np.flatnonzero(np.isin(np.asarray(passages.document_id), document_ids)).astype(np.int64)
+    return np.asarray([i for i, p in enumerate(passages) if p.get("document") in documents], dtype=np.int64)
+
+
+def _copy_rows(matrix: np.ndarray, spill: EmbeddingSpill, rows: np.ndarray = None, batch_size: int = 65_536):
+    n = matrix.shape[0] if rows is None else rows.size
+    for start in range(0, n, batch_size):
+        spill.append(matrix[start:start + batch_size] if rows is None else matrix[rows[start:start + batch_size]])
+
+
+def write_version(index_root: str, passages, embeddings: np.ndarray, delete_documents=(),
+                  compact_ratio: float = 0.25, manifest_updates: dict = None) -> str:
+    """
+    Writes the next index version from the live one, without re-encoding or re-tokenizing it:
+    - passages of delete_documents, and of documents re-added in passages, are tombstoned: removed
+      from id-mapped flat FAISS indexes and from the BM25 postings, skipped by the retriever otherwise;
+    - new passages and their normalized embeddings are appended with the following passage ids;
+    - BM25 statistics (passage count, document frequencies, average length) are updated from the
+      stored term frequencies.
+    When tombstones exceed compact_ratio of the passages, the version is compacted instead: deleted
+    rows are dropped, ids renumbered and the FAISS index rebuilt from the stored embeddings.
+    Call it under update_lock; returns the version name (publish it with publish_version).
+    """
+    base_dir = resolve_index_dir(index_root)
+    base_manifest = load_manifest(base_dir)
+    base_index_path = os.path.join(base_dir, "faiss_index")
+    old_passages = open_passages(resolve_passages_path(base_dir))
+    n_old = len(old_passages)
+    matrix = np.load(embeddings_path_for(base_index_path), mmap_mode="r")
+    if matrix.shape[0] != n_old:
+        raise ValueError("embeddings.npy does not match the passages: rebuild the index with hybrid_data_process.py.")
+    index = faiss.read_index(base_index_path)
+    index_type = base_manifest.get("index_type") or infer_index_type(index)
+    index_options = base_manifest.get("index_options")
+    if index_options is None:
+        index_options = infer_index_options(index)
+    bm25_path = bm25_path_for(base_index_path)
+    bm25 = BM25Index.load(bm25_path, with_tf=True) if os.path.exists(bm25_path) else None
+
+    # Replaced and removed documents are tombstoned; ids of the new passages follow the old ones
+    removed = set(delete_documents) | {p.get("document") for p in passages}
+    previous_tombstones = load_tombstones(base_dir)
+    tombstones = np.union1d(previous_tombstones, _document_rows(old_passages, removed)).astype(np.int64)
+    newly_deleted = np.setdiff1d(tombstones, previous_tombstones)
+    n_deleted = int(newly_deleted.size)
+    n_total = n_old + len(passages)
+    new_ids = np.arange(n_old, n_total, dtype=np.int64)
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32).reshape(len(passages), matrix.shape[1])
+    compact = n_total > 0 and tombstones.size / n_total > compact_ratio
+
+    versions = list_versions(index_root)
+    version = f"v{int(versions[-1][1:]) + 1 if versions else 1:06d}"
+    version_dir = resolve_index_dir(index_root, version)
+    tmp_dir = version_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    index_path = os.path.join(tmp_dir, "faiss_index")
+
+    keep = np.setdiff1d(np.arange(n_old, dtype=np.int64), tombstones) if compact else None
+    with PassageStoreWriter(os.path.join(tmp_dir, "passage_store")) as writer:
+        for i in (keep if compact else range(n_old)):
+            writer.append(old_passages[int(i)])
+        for passage in passages:
+            writer.append(passage)
+
+    spill = EmbeddingSpill(embeddings_path_for(index_path), matrix.shape[1])
+    _copy_rows(matrix, spill, keep)
+    spill.append(embeddings)
+    spill.close()
+
+    if bm25 is None or bm25.tf is None:
+        # BM25 saved without term frequencies (older index): tokenized once, then updatable
+        bm25 = BM25Index.build((tokenize(p["text"]) for p in old_passages), deleted=previous_tombstones)
+    bm25 = bm25.update([tokenize(p["text"]) for p in passages], deleted=tombstones)
+
+    if compact:
+        print(f"♻️ Compacting: dropping {tombstones.size} deleted passages out of {n_total}.")
+        bm25 = bm25.select(np.concatenate([keep, new_ids]))
+        vectors = np.load(spill.path, mmap_mode="r")
+        index = id_mapped_flat(vectors) if index_type == "flat" else \
+            build_from_matrix(vectors, index_type, **index_options)
+        tombstones = np.empty(0, dtype=np.int64)
+    else:
+        id_mapped = isinstance(faiss.downcast_index(index), faiss.IndexIDMap2)
+        if not id_mapped and index_type == "flat":
+            index, id_mapped, newly_deleted = id_mapped_flat(matrix), True, tombstones
+        if id_mapped:
+            if newly_deleted.size:
+                index.remove_ids(newly_deleted)
+            index.add_with_ids(embeddings, new_ids)
+        else:
+            # ANN graph/list indexes keep deleted vectors (HNSW cannot remove): the tombstones hide them
+            index.add(embeddings)
+    faiss.write_index(index, index_path)
+    bm25.save(bm25_path_for(index_path))
+    np.save(os.path.join(tmp_dir, TOMBSTONES_FILE), tombstones)
+
+    store = PassageStore(os.path.join(tmp_dir, "passage_store"))
+    SectionIndex.build(store, np.load(spill.path, mmap_mode="r"), bm25,
+                       deleted=tombstones).save(section_index_path_for(index_path))
+    live = np.ones(len(store), dtype=bool)
+    live[tombstones] = False
+    counts = np.bincount(np.asarray(store.document_id)[live], minlength=len(store.documents))
+    manifest = dict(base_manifest, **(manifest_updates or {}))
+    manifest.update({
+        "version": version,
+        "parent": base_manifest.get("version", "base"),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "index_type": index_type,
+        "index_options": index_options,
+        "passages": len(store),
+        "live_passages": int(live.sum()),
+        "tombstones": int(tombstones.size),
+        "compacted": bool(compact),
+        "documents": {name: int(count) for name, count in zip(store.documents, counts) if count},
+    })
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    del store
+
+    os.rename(tmp_dir, version_dir)
+    print(f"✅ Index version {version}: {manifest['live_passages']} passages "
+          f"({len(passages)} added, {n_deleted} deleted, {manifest['tombstones']} tombstones)")
+    return version
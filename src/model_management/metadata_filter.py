@@ -0,0 +1,157 @@
+import threading
+import numpy as np
+from collections import OrderedDict
+
+from model_management.passage_store import PassageStore
+
+
+def _as_tuple(values) -> tuple:
+    if values is None:
+        return ()
+    if isinstance(values, str):
+        return (values,)
+    return tuple(values)
+
+
+class MetadataFilter:
+    """
+    Restricts a search to some passages: any of the documents, any of the sections (or
+    subsections), and pages within [page_min, page_max]. Unset criteria match every passage.
+    """
+
+    def __init__(self, documents=None, sections=None, subsections=None, page_min: int = None, page_max: int = None):
+        self.documents = _as_tuple(documents)
+        self.sections = _as_tuple(sections)
+        self.subsections = _as_tuple(subsections)
+        self.page_min = page_min
+        self.page_max = page_max
+
+    @classmethod
+    def from_dict(cls, filters):
+        """Filter from a dict such as {"documents": [...], "page_min": 3}; None or {} gives None."""
+        if filters is None or isinstance(filters, cls):
+            return filters
+        filters = {k: v for k, v in filters.items() if v not in (None, "", [], ())}
+        return cls(**filters) if filters else None
+
+    def is_empty(self) -> bool:
+        return not (self.documents or self.sections or self.subsections) \
+            and self.page_min is None and self.page_max is None
+
+    def key(self) -> tuple:
+        return (tuple(sorted(self.documents)), tuple(sorted(self.sections)), tuple(sorted(self.subsections)),
+                self.page_min, self.page_max)
+
+    def __repr__(self):
+        return f"MetadataFilter{self.key()}"
+
+
+class FilterIndex:
+    """
+    Precomputed id bitmaps of the passages, one per document and per section/subsection value.
+    A filter is resolved by OR-ing the bitmaps of its values, AND-ing criteria together and with
+    the page range; the result is the sorted passage ids FAISS and BM25 are restricted to, and a
+    packed bitmap usable as a faiss.IDSelectorBitmap (bit i of byte i // 8, little-endian).
+    Deleted passages (tombstones of a live-updated index) are never selected.
+    """
+
+    def __init__(self, passages, cache_size: int = 128, deleted: np.ndarray = None):
+        if isinstance(passages, PassageStore):
+            document_id, section_id, subsection_id = (np.asarray(passages.document_id), np.asarray(passages.section_id),
+                                                      np.asarray(passages.subsection_id))
+            self.page = np.asarray(passages.page)
+            documents, sections = passages.documents, passages.sections
+        else:
+            documents, sections = {}, {}
+            document_id = np.fromiter((documents.setdefault(p.get("document", "Unspecified"), len(documents))
+                                       for p in passages), dtype=np.int32, count=len(passages))
+            section_id = np.fromiter((sections.setdefault(p.get("section", "Unspecified"), len(sections))
+                                      for p in passages), dtype=np.int32, count=len(passages))
+            subsection_id = np.fromiter((sections.setdefault(p.get("subsection", "Unspecified"), len(sections))
+                                         for p in passages), dtype=np.int32, count=len(passages))
+            self.page = np.fromiter((p.get("page", 0) if isinstance(p.get("page"), int) else 0 for p in passages),
+                                    dtype=np.int32, count=len(passages))
+            documents, sections = list(documents), list(sections)
+
+        self.num_docs = len(self.page)
+        self.deleted = None
+        if deleted is not None and len(deleted):
+            self.deleted = np.zeros(self.num_docs, dtype=bool)
+            self.deleted[np.asarray(deleted, dtype=np.int64)] = True
+        self.document_bitmaps = self._bitmaps(document_id, documents)
+        self.section_bitmaps = self._bitmaps(section_id, sections)
+        self.subsection_bitmaps = self._bitmaps(subsection_id, sections)
+
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _bitmaps(self, column: np.ndarray, names) -> dict:
+        """{value name: packed bitmap of the passages holding it}, grouped in one sort of the column."""
+        n_bytes = (self.num_docs + 7) // 8
+        order = np.argsort(column, kind="stable")
+        values, starts = np.unique(column[order], return_index=True)
+        bounds = list(starts[1:]) + [len(order)]
+        bitmaps = {}
+        for value, start, end in zip(values, starts, bounds):
+            ids = order[start:end]
+            if self.deleted is not None:
+                ids = ids[~self.deleted[ids]]
+                if ids.size == 0:
+                    continue
+            bitmap = np.zeros(n_bytes, dtype=np.uint8)
+            np.bitwise_or.at(bitmap, ids >> 3, (1 << (ids & 7)).astype(np.uint8))
+            bitmaps[names[value]] = bitmap
+        return bitmaps
+
+    def _union(self, bitmaps: dict, values) -> np.ndarray:
+        result = np.zeros((self.num_docs + 7) // 8, dtype=np.uint8)
+        for value in values:
+            bitmap = bitmaps.get(value)
+            if bitmap is not None:
+                result |= bitmap
+        return result
+
+    def resolve(self, metadata_filter: MetadataFilter):
+        """(sorted int64 passage ids, packed bitmap) of a filter, or None when it selects everything."""
+        if metadata_filter is None or metadata_filter.is_empty():
+            return None
+        key = metadata_filter.key()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+
+        bitmap = None
+        for bitmaps, values in ((self.document_bitmaps, metadata_filter.documents),
+                                (self.section_bitmaps, metadata_filter.sections),
+                                (self.subsection_bitmaps, metadata_filter.subsections)):
+            if values:
+                selected = self._union(bitmaps, values)
+                bitmap = selected if bitmap is None else bitmap & selected
+        if metadata_filter.page_min is not None or metadata_filter.page_max is not None:
+            low = metadata_filter.page_min if metadata_filter.page_min is not None else np.iinfo(np.int32).min
+            high = metadata_filter.page_max if metadata_filter.page_max is not None else np.iinfo(np.int32).max
+            in_range = (self.page >= low) & (self.page <= high)
+            if self.deleted is not None:
+                in_range &= ~self.deleted
+            selected = np.packbits(in_range, bitorder="little")
+            bitmap = selected if bitmap is None else bitmap & selected
+
+        ids = np.flatnonzero(np.unpackbits(bitmap, count=self.num_docs, bitorder="little")).astype(np.int64)
+        resolved = (ids, bitmap)
+        with self._lock:
+            self._cache[key] = resolved
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return resolved
+
+    def values(self) -> dict:
+        """Filterable values (documents, sections, subsections) and the page range."""
+        return {
+            "documents": sorted(self.document_bitmaps),
+            "sections": sorted(self.section_bitmaps),
+            "subsections": sorted(self.subsection_bitmaps),
+            "pages": [int(self.page.min()), int(self.page.max())] if self.num_docs else [],
+        }
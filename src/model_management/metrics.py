@@ -0,0 +1,329 @@
+import os
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Minimal in-process metrics with Prometheus text exposition (no extra dependency).
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def _render_sample(self, key, value):
+        counts, total = value
+        lines = []
+        for bound, count in zip(self.buckets, counts):
+            labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+            lines.append(f"{self.name}_bucket{labels} {count}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {total!r}")
+        lines.append(f"{self.name}_count{labels} {counts[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "rag_stage_seconds", "Latency of each RAG pipeline stage", ["stage"]))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "rag_cache_requests_total", "Cache lookups by cache and result", ["cache", "result"]))
+CACHE_SIZE = REGISTRY.register(Gauge(
+    "rag_cache_entries", "Entries currently held by each cache", ["cache"]))
+LLM_SECONDS = REGISTRY.register(Histogram(
+    "rag_llm_latency_seconds", "OpenAI call latency (full completion)", ["mode"]))
+LLM_FIRST_TOKEN_SECONDS = REGISTRY.register(Histogram(
+    "rag_llm_first_token_seconds", "Time to the first streamed token from OpenAI"))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "rag_llm_tokens_total", "LLM tokens by type (prompt/completion)", ["type"]))
+LLM_COMPLETION_TOKENS = REGISTRY.register(Histogram(
+    "rag_llm_completion_tokens", "Completion tokens per answer", buckets=TOKEN_BUCKETS))
+CONTEXT_TOKENS = REGISTRY.register(Histogram(
+    "rag_context_tokens", "Prompt context tokens per request after packing", buckets=TOKEN_BUCKETS))
+CONTEXT_TOKENS_SAVED = REGISTRY.register(Histogram(
+    "rag_context_tokens_saved", "Context tokens saved per request by packing vs the raw top-k passages",
+    buckets=TOKEN_BUCKETS))
+ERRORS = REGISTRY.register(Counter(
+    "rag_errors_total", "Errors by pipeline stage and exception type", ["stage", "type"]))
+REQUESTS = REGISTRY.register(Counter(
+    "rag_http_requests_total", "HTTP requests by route and status", ["route", "status"]))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "rag_http_request_seconds", "Time to response headers by route", ["route"]))
+PROCESS_MEMORY = REGISTRY.register(Gauge(
+    "rag_process_memory_bytes", "Worker memory: resident (rss) and shared with other processes (shared)", ["kind"]))
+COLD_START_SECONDS = REGISTRY.register(Gauge(
+    "rag_cold_start_seconds", "Time for this worker to load the model and indexes and answer a warmup query"))
+INDEX_SWAPS = REGISTRY.register(Counter(
+    "rag_index_swaps_total", "Hot swaps of this worker to a newly published index version"))
+SCHEDULER_REQUESTS = REGISTRY.register(Gauge(
+    "rag_scheduler_requests", "Admitted questions by state: in the pipeline (admitted), waiting for an LLM slot "
+    "(queued), calling the LLM (llm)", ["state"]))
+COALESCED_REQUESTS = REGISTRY.register(Counter(
+    "rag_coalesced_requests_total", "Questions answered by an identical in-flight computation", ["mode"]))
+REJECTED_REQUESTS = REGISTRY.register(Counter(
+    "rag_rejected_requests_total", "Questions refused with 503 (queue full) or dropped past their deadline",
+    ["reason"]))
+LLM_RETRIES = REGISTRY.register(Counter(
+    "rag_llm_retries_total", "OpenAI calls retried after a rate limit or unavailability", ["error"]))
+CORPUS_LOADS = REGISTRY.register(Counter(
+    "rag_corpus_loads_total", "Corpora loaded on first use, or again after an eviction", ["corpus"]))
+CORPUS_EVICTIONS = REGISTRY.register(Counter(
+    "rag_corpus_evictions_total", "Corpora unloaded to stay under the memory budget (budget) or unused (idle)",
+    ["corpus", "reason"]))
+LOADED_CORPUS_BYTES = REGISTRY.register(Gauge(
+    "rag_loaded_corpus_bytes", "Estimated memory of each corpus loaded by this worker (0: not loaded)", ["corpus"]))
+
+
+def process_memory() -> dict:
+    """Resident and shared (page cache, mmap) memory of this process in bytes; peak RSS outside Linux."""
+    try:
+        with open("/proc/self/statm") as f:
+            _, resident, shared = (int(v) for v in f.read().split()[:3])
+        page = os.sysconf("SC_PAGE_SIZE")
+        return {"rss": resident * page, "shared": shared * page}
+    except (OSError, ValueError):
+        pass
+    try:
+        import resource
+        import platform
+    except ImportError:
+        return {}
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {"rss": peak if platform.system() == "Darwin" else peak * 1024}
+
+
+def update_process_gauges():
+    for kind, value in process_memory().items():
+        PROCESS_MEMORY.set(value, kind=kind)
+
+
+# PER-REQUEST PROFILE (opt-in, see the X-Profile header in api.py)
+
+_current_profile = contextvars.ContextVar("rag_request_profile", default=None)
+
+
+class RequestProfile:
+    """Stage timings of one request and, in cProfile mode, the profilers of the threads it ran on."""
+
+    def __init__(self, cprofile: bool = False):
+        self.stages = {}
+        self.notes = {}
+        # Ids of the passages retrieved for the request (written to the query log)
+        self.passage_ids = None
+        self.profilers = [] if cprofile else None
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def milliseconds(self) -> dict:
+        return {stage: round(seconds * 1000, 3) for stage, seconds in self.stages.items()}
+
+    def server_timing(self) -> str:
+        """Stage breakdown as a Server-Timing header value (shown by browser dev tools)."""
+        return ", ".join(f"{stage};dur={ms}" for stage, ms in self.milliseconds().items())
+
+    def dump(self, path: str) -> str:
+        """Merge the collected cProfile stats into a single .prof file (open it with pstats or snakeviz)."""
+        import pstats
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        stats = None
+        for profiler in self.profilers or []:
+            if stats is None:
+                stats = pstats.Stats(profiler)
+            else:
+                stats.add(profiler)
+        if stats is None:
+            return None
+        stats.dump_stats(path)
+        return path
+
+
+def start_profile(cprofile: bool = False) -> RequestProfile:
+    """Start profiling the current request (the contextvar follows it into tasks and context_call)."""
+    profile = RequestProfile(cprofile)
+    _current_profile.set(profile)
+    return profile
+
+
+def current_profile():
+    return _current_profile.get()
+
+
+def run_profiled(profile: RequestProfile, fn, *args, **kwargs):
+    """Run fn under a cProfile collected by the profile (plainly if another profiler is active)."""
+    import cProfile
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return fn(*args, **kwargs)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        profiler.disable()
+        profile.profilers.append(profiler)
+
+
+def context_call(fn, *args, **kwargs):
+    """
+    Callable for an executor that runs fn in a copy of the caller's context, so the request profile
+    follows work moved off the event loop (run_in_executor does not propagate contextvars).
+    """
+    context = contextvars.copy_context()
+    profile = _current_profile.get()
+
+    def call():
+        if profile is not None and profile.profilers is not None:
+            return context.run(run_profiled, profile, fn, *args, **kwargs)
+        return context.run(fn, *args, **kwargs)
+    return call
+
+
+def record_note(name: str, value):
+    """Attach a per-request figure (e.g. context tokens saved) to the current request profile, if any."""
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.notes[name] = value
+
+
+def record_passages(ids):
+    """Attach the ids of the retrieved passages to the current request profile, if any."""
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.passage_ids = [int(i) for i in ids]
+
+
+def record_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.add(stage, seconds)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Times a block into rag_stage_seconds (and the request profile); errors are counted under the stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        count_error(stage, e)
+        raise
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def count_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def count_error(stage: str, error: BaseException):
+    """Count an error once, under the innermost stage it went through."""
+    if getattr(error, "_rag_counted", False):
+        return
+    ERRORS.inc(stage=stage, type=type(error).__name__)
+    try:
+        error._rag_counted = True
+    except AttributeError:
+        pass
@@ -0,0 +1,180 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import numpy as np
+
+# Add src/ to find model_management when run as a script
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+# Encoder backends: stock PyTorch model, ONNX Runtime export, ONNX Runtime with dynamic int8 quantization
+BACKENDS = ("torch", "onnx", "onnx_int8")
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+DEFAULT_EXPORT_ROOT = os.path.join(project_root, 'models', 'embeddings', 'onnx')
+
+
+def export_dir_for(model_name: str, export_root: str = None) -> str:
+    """Local directory holding the ONNX export of a model."""
+    return os.path.join(export_root or DEFAULT_EXPORT_ROOT, model_name.replace("/", "__"))
+
+
+def quantization_config() -> str:
+    """Dynamic int8 quantization target matching this CPU (arm64, avx512_vnni, avx512 or avx2)."""
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "arm64"
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+    except OSError:
+        return "avx2"
+    if "avx512_vnni" in flags:
+        return "avx512_vnni"
+    if "avx512f" in flags:
+        return "avx512"
+    return "avx2"
+
+
+def _session_options(threads: int = None):
+    """ONNX Runtime session options with a bounded intra-op thread pool (leaves cores to uvicorn)."""
+    import onnxruntime
+    options = onnxruntime.SessionOptions()
+    if threads:
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+    return options
+
+
+def _require_onnx():
+    try:
+        import onnxruntime  # noqa: F401
+        import optimum  # noqa: F401
+    except ImportError as e:
+        raise ImportError("The ONNX encoder backends need ONNX Runtime and Optimum: "
+                          "pip install \"sentence-transformers[onnx]==3.4.1\"") from e
+
+
+def export_onnx(model_name: str, export_dir: str, quantize: bool = False, cache_folder: str = None) -> str:
+    """
+    Exports the (locally cached) sentence-transformer to ONNX in export_dir, and its dynamic int8
+    quantization if requested. Existing exports are reused. Returns the ONNX file to load.
+    """
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+    _require_onnx()
+
+    provider = {"provider": "CPUExecutionProvider"}
+    if not os.path.exists(os.path.join(export_dir, "onnx", "model.onnx")):
+        print(f"📦 Exporting {model_name} to ONNX in {export_dir}...")
+        model = SentenceTransformer(model_name, backend="onnx", cache_folder=cache_folder, model_kwargs=provider)
+        model.save_pretrained(export_dir)
+    if not quantize:
+        return "onnx/model.onnx"
+
+    config = quantization_config()
+    file_name = f"onnx/model_qint8_{config}.onnx"
+    if not os.path.exists(os.path.join(export_dir, file_name)):
+        print(f"📦 Quantizing {model_name} to int8 ({config})...")
+        model = SentenceTransformer(export_dir, backend="onnx", model_kwargs=dict(provider, file_name="onnx/model.onnx"))
+        export_dynamic_quantized_onnx_model(model, config, export_dir)
+    return file_name
+
+
+def load_onnx_model(model_name: str, quantize: bool = False, threads: int = None, cache_folder: str = None,
+                    export_root: str = None):
+    """SentenceTransformer running on ONNX Runtime (CPU), exported on first use."""
+    from sentence_transformers import SentenceTransformer
+
+    export_dir = export_dir_for(model_name, export_root)
+    file_name = export_onnx(model_name, export_dir, quantize=quantize, cache_folder=cache_folder)
+    return SentenceTransformer(export_dir, backend="onnx", model_kwargs={
+        "file_name": file_name,
+        "provider": "CPUExecutionProvider",
+        "session_options": _session_options(threads),
+    })
+
+# PARITY CHECK AND BENCHMARK
+
+def parity(reference, candidate, texts) -> dict:
+    """Cosine similarity between the stock and accelerated embeddings of the same texts."""
+    a = reference.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+    b = candidate.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+    cosine = (a * b).sum(axis=1)
+    return {"min_cosine": float(cosine.min()), "mean_cosine": float(cosine.mean())}
+
+
+def neighbor_overlap(reference, candidate, queries, index, top_k: int = 10) -> float:
+    """Mean share of the stock model's top-k FAISS neighbors also returned with the accelerated encoder."""
+    a = reference.encode(queries, convert_to_numpy=True, normalize_embeddings=True).astype(np.float32)
+    b = candidate.encode(queries, convert_to_numpy=True, normalize_embeddings=True).astype(np.float32)
+    _, ids_a = index.search(a, top_k)
+    _, ids_b = index.search(b, top_k)
+    return float(np.mean([len(set(x) & set(y)) / top_k for x, y in zip(ids_a, ids_b)]))
+
+
+def query_latency(model, queries, repeats: int = 5) -> dict:
+    """Single-query encode latency (ms), as paid by search_faiss on a query-cache miss."""
+    model.encode(queries[0], convert_to_numpy=True, normalize_embeddings=True)  # warmup
+    samples = []
+    for _ in range(repeats):
+        for query in queries:
+            start = time.perf_counter()
+            model.encode(query, convert_to_numpy=True, normalize_embeddings=True)
+            samples.append((time.perf_counter() - start) * 1000)
+    return {"p50": float(np.percentile(samples, 50)), "p95": float(np.percentile(samples, 95))}
+
+
+if __name__ == "__main__":
+    from model_management.embedding_registry import get_embedding_model
+
+    parser = argparse.ArgumentParser(description="Export the encoder to ONNX / int8, check parity and benchmark query latency")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS[1:], default=list(BACKENDS[1:]))
+    parser.add_argument("--threads", type=int, default=None, help="Intra-op threads of every backend (torch included)")
+    parser.add_argument("--eval-set", default=os.path.join(project_root, 'data', 'eval', 'sst_retrieval_eval.json'))
+    parser.add_argument("--index-dir", default=os.path.join(project_root, 'models', 'index', 'index_files'),
+                        help="Also compare FAISS top-10 neighbors when this index exists")
+    parser.add_argument("--min-cosine", type=float, default=0.98, help="Parity threshold (exit 1 below it)")
+    parser.add_argument("--output", default=None, help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    with open(args.eval_set, "r", encoding="utf-8") as f:
+        eval_set = json.load(f)["questions"]
+    queries = [item["question"] for item in eval_set]
+    texts = queries + [snippet for item in eval_set for snippet in item["relevant"]]
+
+    index = None
+    index_file = os.path.join(args.index_dir, "faiss_index")
+    if os.path.exists(index_file):
+        import faiss
+        index = faiss.read_index(index_file)
+
+    reference = get_embedding_model(args.model, threads=args.threads)
+    results = {"torch": {"latency_ms": query_latency(reference, queries)}}
+    failed = []
+    for backend in args.backends:
+        model = get_embedding_model(args.model, backend=backend, threads=args.threads)
+        results[backend] = {"latency_ms": query_latency(model, queries), **parity(reference, model, texts)}
+        if index is not None:
+            results[backend]["top10_overlap"] = neighbor_overlap(reference, model, queries, index)
+        if results[backend]["min_cosine"] < args.min_cosine:
+            failed.append(backend)
+
+    base = results["torch"]["latency_ms"]["p50"]
+    for backend, result in results.items():
+        line = f"{backend:10s} p50={result['latency_ms']['p50']:.2f}ms p95={result['latency_ms']['p95']:.2f}ms " \
+               f"(x{base / result['latency_ms']['p50']:.2f})"
+        if "min_cosine" in result:
+            line += f"  cosine min={result['min_cosine']:.4f} mean={result['mean_cosine']:.4f}"
+        if "top10_overlap" in result:
+            line += f"  top-10 overlap={result['top10_overlap']:.3f}"
+        print(line)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if failed:
+        print(f"❌ Parity below {args.min_cosine} for: {', '.join(failed)}")
+        sys.exit(1)
+    print("✅ Parity check passed.")
@@ -0,0 +1,152 @@
+import os
+import sys
+import json
+import mmap
+import shutil
+import argparse
+import numpy as np
+from array import array
+
+STRINGS_FILE = "strings.json"
+TEXT_FILE = "text.bin"
+COLUMNS = ("offsets", "page", "document_id", "section_id", "subsection_id")
+
+
+class PassageStore:
+    """
+    Columnar, memory-mapped passage metadata.
+    Document and section names are interned in small string tables, texts live in one UTF-8
+    blob indexed by int64 offsets, and page/document/section ids are int32 columns.
+    Passages are materialized as dicts only when fetched by row id.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, STRINGS_FILE), "r", encoding="utf-8") as f:
+            strings = json.load(f)
+        self.documents = strings["documents"]
+        self.sections = strings["sections"]
+
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.page = np.load(os.path.join(path, "page.npy"), mmap_mode="r")
+        self.document_id = np.load(os.path.join(path, "document_id.npy"), mmap_mode="r")
+        self.section_id = np.load(os.path.join(path, "section_id.npy"), mmap_mode="r")
+        self.subsection_id = np.load(os.path.join(path, "subsection_id.npy"), mmap_mode="r")
+
+        with open(os.path.join(path, TEXT_FILE), "rb") as f:
+            self._text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+
+    def __len__(self):
+        return len(self.page)
+
+    def text(self, i: int) -> str:
+        return self._text[int(self.offsets[i]):int(self.offsets[i + 1])].decode("utf-8")
+
+    def __getitem__(self, i: int) -> dict:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f"Passage {i} out of range")
+        return {
+            "document": self.documents[self.document_id[i]],
+            "page": int(self.page[i]),
+            "section": self.sections[self.section_id[i]],
+            "subsection": self.sections[self.subsection_id[i]],
+            "text": self.text(i),
+        }
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class PassageStoreWriter:
+    """Streams passages into a PassageStore directory (texts are written as they arrive)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.makedirs(path)
+        self._text = open(os.path.join(path, TEXT_FILE), "wb")
+        self._strings = {"documents": {}, "sections": {}}
+        self._columns = {name: array("i") for name in COLUMNS[1:]}
+        self._offsets = array("q", [0])
+
+    def _intern(self, table: str, value) -> int:
+        ids = self._strings[table]
+        return ids.setdefault("" if value is None else str(value), len(ids))
+
+    def append(self, passage: dict):
+        data = passage.get("text", "").encode("utf-8")
+        self._text.write(data)
+        self._offsets.append(self._offsets[-1] + len(data))
+        page = passage.get("page", 0)
+        self._columns["page"].append(page if isinstance(page, int) else 0)
+        self._columns["document_id"].append(self._intern("documents", passage.get("document", "Unspecified")))
+        self._columns["section_id"].append(self._intern("sections", passage.get("section", "Unspecified")))
+        self._columns["subsection_id"].append(self._intern("sections", passage.get("subsection", "Unspecified")))
+
+    def close(self):
+        self._text.close()
+        np.save(os.path.join(self.path, "offsets.npy"), np.frombuffer(self._offsets, dtype=np.int64))
+        for name, values in self._columns.items():
+            np.save(os.path.join(self.path, f"{name}.npy"), np.frombuffer(values, dtype=np.int32))
+        with open(os.path.join(self.path, STRINGS_FILE), "w", encoding="utf-8") as f:
+            json.dump({table: list(ids) for table, ids in self._strings.items()}, f, ensure_ascii=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def is_passage_store(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, STRINGS_FILE))
+
+
+def open_passages(path: str):
+    """Random-access passages: a memory-mapped PassageStore, or a list loaded from legacy JSON/JSONL metadata."""
+    if is_passage_store(path):
+        return PassageStore(path)
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(line) for line in f if line.strip()]
+        return json.load(f)
+
+
+def resolve_passages_path(index_dir: str) -> str:
+    """Passage metadata of an index directory: passage_store/, else metadata_passages.jsonl, else .json."""
+    for name in ("passage_store", "metadata_passages.jsonl"):
+        candidate = os.path.join(index_dir, name)
+        if os.path.exists(candidate):
+            return candidate
+    return os.path.join(index_dir, "metadata_passages.json")
+
+
+def convert_metadata_to_store(metadata_path: str, store_path: str) -> int:
+    """Converts a metadata_passages.json / .jsonl file into a PassageStore directory."""
+    with open(metadata_path, "r", encoding="utf-8") as f:
+        passages = (json.loads(line) for line in f if line.strip()) if metadata_path.endswith(".jsonl") else json.load(f)
+        count = 0
+        with PassageStoreWriter(store_path) as writer:
+            for passage in passages:
+                writer.append(passage)
+                count += 1
+    return count
+
+
+if __name__ == "__main__":
+    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+    index_dir = os.path.join(project_root, 'models', 'index', 'index_files')
+
+    parser = argparse.ArgumentParser(description="Convert passage metadata JSON into a columnar passage store")
+    parser.add_argument("--input", default=os.path.join(index_dir, 'metadata_passages.json'))
+    parser.add_argument("--output", default=os.path.join(index_dir, 'passage_store'))
+    args = parser.parse_args()
+
+    if not os.path.exists(args.input):
+        sys.exit(f"Metadata file not found: {args.input}")
+    total = convert_metadata_to_store(args.input, args.output)
+    print(f"✅ {total} passages converted to: {args.output}")
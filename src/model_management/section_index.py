@@ -0,0 +1,156 @@
+import os
+import numpy as np
+from array import array
+from scipy import sparse
+
+from model_management.bm25_index import BM25Index, top_k_indices
+from model_management.passage_store import PassageStore
+
+
+def section_index_path_for(index_path: str) -> str:
+    """Section index file stored next to the FAISS index (its BM25 statistics in section_bm25.npz)."""
+    return os.path.join(os.path.dirname(index_path), "section_index.npz")
+
+
+def _section_bm25_path(path: str) -> str:
+    return os.path.join(os.path.dirname(path), "section_bm25.npz")
+
+
+class SectionBuilder:
+    """Accumulates the (document, section) of each passage, in passage id order, to build a SectionIndex."""
+
+    def __init__(self):
+        self.keys = {}
+        self._section_of = array("i")
+
+    def add(self, passage: dict):
+        key = (passage.get("document", "Unspecified"), passage.get("section", "Unspecified"))
+        self._section_of.append(self.keys.setdefault(key, len(self.keys)))
+
+    def build(self, matrix: np.ndarray, bm25: BM25Index, deleted: np.ndarray = None) -> "SectionIndex":
+        return SectionIndex.from_arrays(np.frombuffer(self._section_of, dtype=np.int32), list(self.keys), matrix,
+                                        bm25, deleted=deleted)
+
+
+class SectionIndex:
+    """
+    First level of a coarse-to-fine search: one entry per (document, section) of the corpus, with the
+    normalized centroid of its passage embeddings and BM25 statistics of its passages taken together.
+    A query scores the sections first, keeps the best n_probe and only their passages are then
+    scored by FAISS and BM25 (see HybridRetriever.section_probe).
+    """
+
+    def __init__(self, names, section_of: np.ndarray, centroids: np.ndarray, bm25: BM25Index):
+        self.names = names
+        # Section of each passage (-1: deleted passage, never probed)
+        self.section_of = section_of
+        self.centroids = centroids
+        self.bm25 = bm25
+
+        # Passage ids grouped by section: members[offsets[s]:offsets[s + 1]] are those of section s
+        order = np.argsort(section_of, kind="stable")
+        order = order[section_of[order] >= 0]
+        self.members = order.astype(np.int64)
+        self.offsets = np.searchsorted(section_of[order], np.arange(len(names) + 1))
+
+    @property
+    def num_sections(self) -> int:
+        return len(self.names)
+
+    @classmethod
+    def build(cls, passages, matrix: np.ndarray, bm25: BM25Index, deleted: np.ndarray = None):
+        """Section index of a corpus: passages (PassageStore or dicts), their embeddings and their BM25 index."""
+        if isinstance(passages, PassageStore):
+            n_sections = max(len(passages.sections), 1)
+            keys = np.asarray(passages.document_id, dtype=np.int64) * n_sections + np.asarray(passages.section_id)
+            unique, section_of = np.unique(keys, return_inverse=True)
+            names = [(passages.documents[k // n_sections], passages.sections[k % n_sections]) for k in unique.tolist()]
+            return cls.from_arrays(section_of.astype(np.int32), names, matrix, bm25, deleted=deleted)
+        builder = SectionBuilder()
+        for passage in passages:
+            builder.add(passage)
+        return builder.build(matrix, bm25, deleted=deleted)
+
+    @classmethod
+    def from_arrays(cls, section_of: np.ndarray, names, matrix: np.ndarray, bm25: BM25Index,
+                    deleted: np.ndarray = None, batch_size: int = 65_536):
+        """
+        Centroids and section BM25 from the passage-level data, without re-encoding or re-tokenizing:
+        centroids are summed batch by batch from the (memory-mapped) embeddings, section term
+        frequencies and lengths are the sums of those of their passages (bm25 must hold its tf).
+        """
+        if bm25.tf is None:
+            raise ValueError("BM25 index loaded without term frequencies: load it with with_tf=True.")
+        n_passages = len(section_of)
+        section_of = np.asarray(section_of, dtype=np.int32).copy()
+        if deleted is not None and len(deleted):
+            section_of[np.asarray(deleted, dtype=np.int64)] = -1
+        live = np.flatnonzero(section_of >= 0)
+        indicator = sparse.csr_matrix((np.ones(live.size, dtype=np.float32), (section_of[live], live)),
+                                      shape=(len(names), n_passages))
+
+        centroids = np.zeros((len(names), matrix.shape[1]), dtype=np.float32)
+        columns = indicator.tocsc()
+        for start in range(0, n_passages, batch_size):
+            block = np.asarray(matrix[start:start + batch_size], dtype=np.float32)
+            centroids += columns[:, start:start + batch_size] @ block
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        np.divide(centroids, norms, out=centroids, where=norms > 0)
+
+        tf = (bm25.tf @ indicator.T).tocsr()
+        doc_len = np.asarray(indicator @ bm25.doc_len, dtype=np.float32).ravel()
+        empty = np.flatnonzero(np.diff(indicator.indptr) == 0)
+        section_bm25 = BM25Index.from_postings(bm25.vocabulary, tf, doc_len, k1=bm25.k1, b=bm25.b,
+                                               epsilon=bm25.epsilon, deleted=empty)
+        return cls(names, section_of, centroids, section_bm25)
+
+    def probe(self, embedding: np.ndarray, tokens, n_probe: int, alpha: float = 0.6,
+              candidates: np.ndarray = None) -> np.ndarray:
+        """
+        Ids of the n_probe best sections for a query: centroid similarity and section BM25, each
+        max-normalized and weighted by alpha as in the passage-level fusion.
+        candidates : sorted section ids to choose from (e.g. those holding the passages of a filter)
+        """
+        if candidates is None:
+            dense = self.centroids @ embedding
+            lexical = self.bm25.get_scores(tokens)
+        else:
+            dense = self.centroids[candidates] @ embedding
+            lexical = self.bm25.get_scores_subset(tokens, candidates)
+        combined = alpha * dense / max(float(dense.max(initial=0.0)), 1e-6) \
+            + (1 - alpha) * lexical / max(float(lexical.max(initial=0.0)), 1e-6)
+        top = top_k_indices(combined, n_probe)
+        return top if candidates is None else candidates[top]
+
+    def passages_of(self, sections) -> np.ndarray:
+        """Sorted ids of the (live) passages of the given sections."""
+        if len(sections) == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate([self.members[self.offsets[s]:self.offsets[s + 1]] for s in sections]))
+
+    def sections_of(self, ids: np.ndarray) -> np.ndarray:
+        """Sorted ids of the sections holding the given passages."""
+        sections = np.unique(self.section_of[ids])
+        return sections[sections >= 0].astype(np.int64)
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.bm25.save(_section_bm25_path(path))
+        # Written to a temporary file then renamed, like the BM25 index
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                documents=np.asarray([d for d, _ in self.names], dtype=str),
+                sections=np.asarray([s for _, s in self.names], dtype=str),
+                section_of=self.section_of,
+                centroids=self.centroids,
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path, allow_pickle=False) as data:
+            names = list(zip(data["documents"].tolist(), data["sections"].tolist()))
+            section_of, centroids = data["section_of"], data["centroids"]
+        return cls(names, section_of, centroids, BM25Index.load(_section_bm25_path(path)))
@@ -0,0 +1,306 @@
+import os
+import json
+import time
+import random
+import asyncio
+import httpx
+
+# Client of the RAG-LLM-SST API (src/api/api.py): one pooled keep-alive connection set per client,
+# shared by every caller (Gradio users, scripts), with timeouts and retries.
+
+DEFAULT_API_URL = os.getenv("RAG_API_URL", "http://127.0.0.1:8000")
+
+# Answered before any work was done (overloaded, restarting): safe to send again
+RETRY_STATUSES = (429, 502, 503, 504)
+RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout, httpx.RemoteProtocolError)
+
+
+class APIError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(f"API error {status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _raise_for_status(response: httpx.Response):
+    if response.is_success:
+        return
+    try:
+        detail = response.json().get("detail", response.text)
+    except ValueError:
+        detail = response.text
+    raise APIError(response.status_code, str(detail))
+
+
+def _search_payload(top_k, alpha, filters, corpus=None):
+    payload = {"top_k": top_k, "alpha": alpha}
+    if filters:
+        payload["filters"] = filters
+    if corpus:
+        payload["corpus"] = corpus
+    return payload
+
+
+def _query_payload(question, filters, corpus=None):
+    payload = {"query": question}
+    if filters:
+        payload["filters"] = filters
+    if corpus:
+        payload["corpus"] = corpus
+    return payload
+
+
+def _sse_frame(event_lines):
+    """(event name, JSON payload) of one Server-Sent Event frame."""
+    event, data = "message", []
+    for line in event_lines:
+        if line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].strip())
+    return event, json.loads("\n".join(data)) if data else {}
+
+
+def iter_sse(lines):
+    """Parses text lines of an SSE stream into (event, data) pairs as frames complete."""
+    frame = []
+    for line in lines:
+        if line:
+            frame.append(line)
+        elif frame:
+            yield _sse_frame(frame)
+            frame = []
+    if frame:
+        yield _sse_frame(frame)
+
+
+async def aiter_sse(lines):
+    frame = []
+    async for line in lines:
+        if line:
+            frame.append(line)
+        elif frame:
+            yield _sse_frame(frame)
+            frame = []
+    if frame:
+        yield _sse_frame(frame)
+
+
+class _RetryPolicy:
+    """Exponential backoff with full jitter, honouring Retry-After on 429/503."""
+
+    def __init__(self, retries: int = 2, backoff: float = 0.5, max_backoff: float = 8.0):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def delay(self, attempt: int, response: httpx.Response = None) -> float:
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_backoff)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def should_retry(self, attempt: int, response: httpx.Response = None) -> bool:
+        return attempt < self.retries and (response is None or response.status_code in RETRY_STATUSES)
+
+
+def _client_options(base_url, timeout, connect_timeout, max_connections, headers):
+    return dict(
+        base_url=base_url.rstrip("/"),
+        timeout=httpx.Timeout(timeout, connect=connect_timeout),
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        headers=headers,
+    )
+
+
+class RAGClient:
+    """
+    Synchronous API client over a pooled keep-alive httpx.Client (thread-safe: share one instance).
+    timeout : seconds allowed between bytes of a response (a streamed answer may last longer)
+    retries : extra attempts on connection errors and 429/502/503/504, before any answer is sent
+    """
+
+    def __init__(self, base_url: str = DEFAULT_API_URL, timeout: float = 120.0, connect_timeout: float = 5.0,
+                 retries: int = 2, backoff: float = 0.5, max_connections: int = 32, headers: dict = None):
+        self.retry = _RetryPolicy(retries, backoff)
+        self._client = httpx.Client(**_client_options(base_url, timeout, connect_timeout, max_connections, headers))
+
+    def _request(self, method: str, path: str, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                response = self._client.request(method, path, **kwargs)
+            except RETRY_ERRORS:
+                if not self.retry.should_retry(attempt):
+                    raise
+                time.sleep(self.retry.delay(attempt))
+            else:
+                if not self.retry.should_retry(attempt, response):
+                    _raise_for_status(response)
+                    return response.json()
+                time.sleep(self.retry.delay(attempt, response))
+            attempt += 1
+
+    def query(self, question: str, filters: dict = None, corpus: str = None) -> str:
+        """Full answer of POST /query."""
+        return self._request("POST", "/query", json=_query_payload(question, filters, corpus))["response"]
+
+    def search(self, query: str, top_k: int = 5, alpha: float = 0.6, filters: dict = None, corpus: str = None) -> list:
+        """Structured hits of POST /search (no LLM call)."""
+        payload = dict(_search_payload(top_k, alpha, filters, corpus), query=query)
+        return self._request("POST", "/search", json=payload)["hits"]
+
+    def search_batch(self, queries, top_k: int = 5, alpha: float = 0.6, filters: dict = None,
+                     corpus: str = None) -> list:
+        """Hits of several queries in one POST /search/batch call (one encode/FAISS/BM25 pass server-side)."""
+        payload = dict(_search_payload(top_k, alpha, filters, corpus), queries=list(queries))
+        return self._request("POST", "/search/batch", json=payload)["results"]
+
+    def stream_events(self, question: str, filters: dict = None, corpus: str = None):
+        """(event, data) frames of POST /query/stream as they arrive; retried only before the stream starts."""
+        attempt, started = 0, False
+        while True:
+            try:
+                with self._client.stream("POST", "/query/stream",
+                                         json=_query_payload(question, filters, corpus)) as response:
+                    if self.retry.should_retry(attempt, response) and not response.is_success:
+                        delay = self.retry.delay(attempt, response)
+                    else:
+                        if not response.is_success:
+                            response.read()
+                            _raise_for_status(response)
+                        for frame in iter_sse(response.iter_lines()):
+                            started = True
+                            yield frame
+                        return
+            except RETRY_ERRORS:
+                # Once frames were yielded, a retry would stream the answer again after them
+                if started or not self.retry.should_retry(attempt):
+                    raise
+                delay = self.retry.delay(attempt)
+            time.sleep(delay)
+            attempt += 1
+
+    def stream(self, question: str, filters: dict = None, corpus: str = None):
+        """Tokens of the answer as the API streams them."""
+        for event, data in self.stream_events(question, filters, corpus):
+            if event == "done":
+                return
+            if data.get("token"):
+                yield data["token"]
+
+    def filters(self, corpus: str = None) -> dict:
+        return self._request("GET", "/filters", params={"corpus": corpus} if corpus else None)
+
+    def corpora(self) -> dict:
+        """Corpora available and loaded by the worker that answers."""
+        return self._request("GET", "/corpora")
+
+    def health(self) -> dict:
+        return self._request("GET", "/healthz")
+
+    def ready(self) -> dict:
+        """Readiness report of the worker that answers (raises APIError 503 while it warms up)."""
+        return self._request("GET", "/readyz")
+
+    def close(self):
+        self._client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class AsyncRAGClient:
+    """Same API as RAGClient for asyncio code, over a pooled httpx.AsyncClient (one per event loop)."""
+
+    def __init__(self, base_url: str = DEFAULT_API_URL, timeout: float = 120.0, connect_timeout: float = 5.0,
+                 retries: int = 2, backoff: float = 0.5, max_connections: int = 32, headers: dict = None):
+        self.retry = _RetryPolicy(retries, backoff)
+        self._client = httpx.AsyncClient(**_client_options(base_url, timeout, connect_timeout, max_connections,
+                                                           headers))
+
+    async def _request(self, method: str, path: str, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                response = await self._client.request(method, path, **kwargs)
+            except RETRY_ERRORS:
+                if not self.retry.should_retry(attempt):
+                    raise
+                await asyncio.sleep(self.retry.delay(attempt))
+            else:
+                if not self.retry.should_retry(attempt, response):
+                    _raise_for_status(response)
+                    return response.json()
+                await asyncio.sleep(self.retry.delay(attempt, response))
+            attempt += 1
+
+    async def query(self, question: str, filters: dict = None, corpus: str = None) -> str:
+        return (await self._request("POST", "/query", json=_query_payload(question, filters, corpus)))["response"]
+
+    async def search(self, query: str, top_k: int = 5, alpha: float = 0.6, filters: dict = None,
+                     corpus: str = None) -> list:
+        payload = dict(_search_payload(top_k, alpha, filters, corpus), query=query)
+        return (await self._request("POST", "/search", json=payload))["hits"]
+
+    async def search_batch(self, queries, top_k: int = 5, alpha: float = 0.6, filters: dict = None,
+                           corpus: str = None) -> list:
+        payload = dict(_search_payload(top_k, alpha, filters, corpus), queries=list(queries))
+        return (await self._request("POST", "/search/batch", json=payload))["results"]
+
+    async def stream_events(self, question: str, filters: dict = None, corpus: str = None):
+        attempt, started = 0, False
+        while True:
+            try:
+                async with self._client.stream("POST", "/query/stream",
+                                               json=_query_payload(question, filters, corpus)) as response:
+                    if self.retry.should_retry(attempt, response) and not response.is_success:
+                        delay = self.retry.delay(attempt, response)
+                    else:
+                        if not response.is_success:
+                            await response.aread()
+                            _raise_for_status(response)
+                        async for frame in aiter_sse(response.aiter_lines()):
+                            started = True
+                            yield frame
+                        return
+            except RETRY_ERRORS:
+                if started or not self.retry.should_retry(attempt):
+                    raise
+                delay = self.retry.delay(attempt)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def stream(self, question: str, filters: dict = None, corpus: str = None):
+        async for event, data in self.stream_events(question, filters, corpus):
+            if event == "done":
+                return
+            if data.get("token"):
+                yield data["token"]
+
+    async def filters(self, corpus: str = None) -> dict:
+        return await self._request("GET", "/filters", params={"corpus": corpus} if corpus else None)
+
+    async def corpora(self) -> dict:
+        return await self._request("GET", "/corpora")
+
+    async def health(self) -> dict:
+        return await self._request("GET", "/healthz")
+
+    async def ready(self) -> dict:
+        return await self._request("GET", "/readyz")
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
@@ -1,38 +1,57 @@
-import gradio as gr
-import requests
-
-# URL of FastAPI
-API_URL = "http://127.0.0.1:8000/ask"
-
-def chat_with_api(user_input, history=[]):
-    """
-    Fonction pour envoyer une question à l'API et récupérer la réponse.
-    """
-    response = requests.post(API_URL, json={"question": user_input})
-    if response.status_code == 200:
-        return response.json()["response"]
-    else:
-        return "Erreur API : Vérifiez que le serveur est bien lancé."
-
-# Gradio interface
-with gr.Blocks(theme="default") as app:
-    with gr.Row():
-        gr.Image("https://cdn-icons-png.flaticon.com/512/2206/2206368.png", width=60, height=60)  # incon of the Chatbot 
-        gr.HTML("<h1 style='margin-left: 10px;'>💬 Chatbot SST - RAG ChatGPT</h1>")
-
-    gr.Markdown("### Posez une question et obtenez une réponse basée sur les documents indexés 🏗️")
-    
-    chatbot = gr.ChatInterface(
-        fn=chat_with_api,
-        chatbot=gr.Chatbot(height=400),
-        textbox=gr.Textbox(placeholder="Tapez votre question ici...", lines=2),
-        submit_btn="Envoyer 🚀",
-        clear_btn="Effacer 🗑️"
-    )
-
-# Launch
-if __name__ == "__main__":
-    app.launch()
-
-
-
+import os
+import gradio as gr
+import httpx
+
+from api_client import APIError, RAGClient
+
+# One pooled keep-alive client shared by every Gradio session (URL of FastAPI: RAG_API_URL)
+client = RAGClient(timeout=float(os.getenv("UI_TIMEOUT", "120")))
+# Chats answered at the same time (Gradio runs the others in its queue)
+UI_CONCURRENCY = int(os.getenv("UI_CONCURRENCY", "16"))
+
+
+def available_corpora():
+    """Corpora served by the API (only the default one if it cannot be reached yet)."""
+    try:
+        return client.corpora()["available"]
+    except (APIError, httpx.HTTPError):
+        return ["default"]
+
+
+def chat_with_api(user_input, history=[], corpus="default"):
+    """
+    Fonction pour envoyer une question à l'API et afficher la réponse au fil de sa génération.
+    """
+    answer = ""
+    try:
+        for token in client.stream(user_input, corpus=corpus):
+            answer += token
+            yield answer
+    except APIError as e:
+        yield answer + f"\n\nErreur API ({e.status_code}) : {e.detail}"
+    except httpx.HTTPError:
+        yield answer + "\n\nErreur API : Vérifiez que le serveur est bien lancé."
+
+# Gradio interface
+with gr.Blocks(theme="default") as app:
+    with gr.Row():
+        gr.Image("https://cdn-icons-png.flaticon.com/512/2206/2206368.png", width=60, height=60)  # incon of the Chatbot 
+        gr.HTML("<h1 style='margin-left: 10px;'>💬 Chatbot SST - RAG ChatGPT</h1>")
+
+    gr.Markdown("### Posez une question et obtenez une réponse basée sur les documents indexés 🏗️")
+    
+    corpora = available_corpora()
+    chatbot = gr.ChatInterface(
+        fn=chat_with_api,
+        chatbot=gr.Chatbot(height=400),
+        textbox=gr.Textbox(placeholder="Tapez votre question ici...", lines=2),
+        submit_btn="Envoyer 🚀",
+        clear_btn="Effacer 🗑️",
+        concurrency_limit=UI_CONCURRENCY,
+        # Documents searched: only shown when the API serves several corpora
+        additional_inputs=[gr.Dropdown(corpora, value="default", label="Corpus", visible=len(corpora) > 1)]
+    )
+
+# Launch
+if __name__ == "__main__":
+    app.queue(default_concurrency_limit=UI_CONCURRENCY).launch()